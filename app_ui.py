@@ -1,6 +1,21 @@
+import json
 import streamlit as st
 import requests
 
+API_URL = "http://localhost:8000"
+
+def iter_sse(response):
+    """Découpe un flux text/event-stream en couples (event, data JSON)."""
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and event:
+            yield event, json.loads("\n".join(data))
+            event, data = None, []
+
 st.set_page_config(page_title="Attention Is All You Need Bot", layout="centered")
 st.title("📘 Chat with the Paper")
 st.caption("Document source : Attention Is All You Need (Vaswani et al., 2017)")
@@ -21,22 +36,39 @@ if prompt := st.chat_input("Posez une question technique sur le Transformer...")
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        with st.spinner("Consultation de l'index FAISS..."):
-            try:
-                # Appel API
-                res = requests.post("http://localhost:8000/query", json={"q": prompt})
-                
-                if res.status_code == 200:
-                    data = res.json()
-                    st.markdown(data["answer"])
-                    
-                    # Afficher les sources proprement
-                    with st.expander("Voir les passages sources"):
-                        for s in data["sources"]:
-                            st.markdown(f"**Score {s['score']:.2f}** : {s['preview']}")
-                    
-                    st.session_state.messages.append({"role": "assistant", "content": data["answer"]})
-                else:
-                    st.error("Erreur API. Vérifiez que main.py tourne.")
-            except Exception as e:
-                st.error(f"Connexion échouée : {e}")
\ No newline at end of file
+        answer_box = st.empty()
+        answer = ""
+        sources, metrics = [], {}
+        try:
+            # Appel API en streaming : sources d'abord, puis les tokens au fil de l'eau
+            with st.spinner("Consultation de l'index FAISS..."):
+                res = requests.post(API_URL + "/query/stream", json={"q": prompt}, stream=True, timeout=120)
+
+            if res.status_code == 200:
+                for event, data in iter_sse(res):
+                    if event == "sources":
+                        sources = data
+                    elif event == "token":
+                        answer += data["text"]
+                        answer_box.markdown(answer + "▌")
+                    elif event == "done":
+                        metrics = data
+                    elif event == "error":
+                        st.error(f"Erreur API : {data['detail']}")
+                answer_box.markdown(answer)
+
+                if metrics:
+                    st.caption(f"⏱️ Premier token : {metrics['ttft_s']:.2f}s · Total : {metrics['total_s']:.2f}s")
+
+                # Afficher les sources proprement
+                with st.expander("Voir les passages sources"):
+                    for s in sources:
+                        st.markdown(f"**Score {s['score']:.2f}** : {s['preview']}")
+
+                st.session_state.messages.append({"role": "assistant", "content": answer})
+            elif res.status_code == 429:
+                st.warning("Serveur saturé, réessayez dans un instant.")
+            else:
+                st.error("Erreur API. Vérifiez que main.py tourne.")
+        except Exception as e:
+            st.error(f"Connexion échouée : {e}")
@@ -1,114 +1,501 @@
+import os
 import json
 import time
-import requests
-import os
+import asyncio
+import argparse
+import subprocess
 from datetime import datetime
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from src.config import Config
+from src.rate_limiter import estimate_tokens
+from src.rerankers import BaseReranker
 
 # --- CONFIGURATION ---
 API_URL = "http://localhost:8000/query"
 GROUND_TRUTH_PATH = "data/ground_truth.json"
-REPORT_FILE = "BENCHMARK_REPORT.md"
+STAGES = ("embed_s", "faiss_s", "bm25_s", "fusion_s", "rerank_s", "pack_s", "llm_s")
 
-# Modèle pour l'évaluation de similarité (Sémantique)
-model = SentenceTransformer('all-MiniLM-L6-v2')
 
 def load_ground_truth():
     with open(GROUND_TRUTH_PATH, "r") as f:
         return json.load(f)
 
-def run_benchmark():
-    qa_pairs = load_ground_truth()
+
+def percentiles(latencies) -> dict:
+    if not latencies:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    values = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "mean_ms": round(float(values.mean()), 2),
+    }
+
+
+# --- Bouchons : mesurer le système sans réseau ni quota d'API ---
+class StubLLM:
+    """
+    LLM factice (interface LangChain minimale) : répond avec le début de la première source.
+    Latence = `delay_ms` + `ms_per_ktok` par millier de tokens du prompt, comme le pré-remplissage
+    d'un vrai modèle : la taille du contexte envoyé pèse donc sur le résultat.
+    """
+
+    def __init__(self, delay_ms: float, ms_per_ktok: float = 0.0, tokens: int = 20):
+        self.delay = delay_ms / 1000.0
+        self.ms_per_ktok = ms_per_ktok
+        self.tokens = tokens
+
+    def _latency(self, messages) -> float:
+        prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        return self.delay + self.ms_per_ktok * prompt_tokens / 1e6
+
+    def _answer(self, messages) -> str:
+        context = messages[-1]["content"] if messages else ""
+        return " ".join(context.split()[:self.tokens])
+
+    def invoke(self, messages):
+        time.sleep(self._latency(messages))
+        return AIMessage(content=self._answer(messages))
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self._latency(messages))
+        return AIMessage(content=self._answer(messages))
+
+    async def astream(self, messages):
+        words = self._answer(messages).split()
+        latency = self._latency(messages)
+        for word in words:
+            await asyncio.sleep(latency / max(1, len(words)))
+            yield AIMessageChunk(content=word + " ")
+
+
+class StubReranker(BaseReranker):
+    """Reranker factice : garde l'ordre de la fusion après une latence fixe."""
+
+    name = "stub"
+
+    def __init__(self, delay_ms: float):
+        self.delay = delay_ms / 1000.0
+
+    def rerank(self, query, documents, top_n):
+        time.sleep(self.delay)
+        return [(doc, 1.0 / (i + 1)) for i, doc in enumerate(documents[:top_n])]
+
+    async def arerank(self, query, documents, top_n, executor=None):
+        await asyncio.sleep(self.delay)
+        return [(doc, 1.0 / (i + 1)) for i, doc in enumerate(documents[:top_n])]
+
+
+# --- Cibles : le serveur HTTP, ou le pipeline de main.py dans ce processus ---
+class HttpTarget:
+    def __init__(self, url: str, max_clients: int):
+        import requests
+
+        self.url = url
+        self.session = requests.Session()
+        self.pool = ThreadPoolExecutor(max_workers=max_clients)
+
+    async def query(self, question: str, k: int) -> dict:
+        def send():
+            res = self.session.post(self.url, json={"q": question, "k": k}, timeout=120)
+            return res.status_code, res.json() if res.status_code == 200 else None
+
+        return await asyncio.get_running_loop().run_in_executor(self.pool, send)
+
+    async def query_batch(self, questions, k: int):
+        def send():
+            res = self.session.post(self.url + "/batch", json={"queries": questions, "k": k}, timeout=600)
+            return res.status_code, res.json()["results"] if res.status_code == 200 else None
+
+        return await asyncio.get_running_loop().run_in_executor(self.pool, send)
+
+
+class OfflineTarget:
+    """Appelle main.answer_query directement : mêmes pools, même admission, sans HTTP."""
+
+    def __init__(self, args):
+        import main
+        from fastapi import HTTPException
+
+        self.main = main
+        self.http_exception = HTTPException
+        if not args.cache:
+            main.query_cache = None
+        if not main.rag_store.load():
+            raise SystemExit("❌ Aucun index trouvé : lancez d'abord l'ingestion (main.py).")
+        if not args.real_reranker:
+            main.rag_store.reranker = StubReranker(args.stub_rerank_ms)
+        if not args.real_llm:
+            main.llm_client = StubLLM(args.stub_llm_ms, args.stub_llm_ms_per_ktok)
+        self.store = main.rag_store
+
+    async def query(self, question: str, k: int) -> dict:
+        request = self.main.QueryRequest(q=question, k=k)
+        try:
+            async with self.main.admission_control():
+                return 200, await self.main.answer_query(request)
+        except self.http_exception as e:
+            return e.status_code, None
+
+    async def query_batch(self, questions, k: int):
+        request = self.main.BatchQueryRequest(queries=questions, k=k)
+        try:
+            async with self.main.admission_control():
+                return 200, await self.main.answer_batch(request)
+        except self.http_exception as e:
+            return e.status_code, None
+
+    def profile_stages(self, qa_pairs, k: int) -> dict:
+        """Une passe séquentielle par question, chaque étape chronométrée séparément."""
+        llm = self.main.get_llm_client()
+        per_stage = {stage: [] for stage in STAGES}
+        self.context_tokens = []
+        for item in qa_pairs:
+            timings = {}
+            docs = self.store.search(item["question"], k, timings=timings)
+            start = time.perf_counter()
+            messages = self.main.build_messages(item["question"], docs)
+            timings["pack_s"] = time.perf_counter() - start
+            self.context_tokens.append(estimate_tokens(messages[-1]["content"]))
+            start = time.perf_counter()
+            llm.invoke(messages)
+            timings["llm_s"] = time.perf_counter() - start
+            for stage in STAGES:
+                per_stage[stage].append(timings.get(stage, 0.0))
+        return {stage: percentiles(values) for stage, values in per_stage.items()}
+
+
+# --- Générateurs de charge ---
+async def timed_query(target, item, k, results, scheduled_at=None):
+    # En boucle ouverte, la latence part de l'arrivée prévue (pas d'omission coordonnée)
+    start = scheduled_at or time.perf_counter()
+    try:
+        status, body = await target.query(item["question"], k)
+    except Exception:
+        status, body = None, None
+    results.append({"item": item, "status": status, "latency": time.perf_counter() - start, "body": body})
+
+
+async def run_closed_loop(target, qa_pairs, clients: int, requests_count: int, k: int) -> list:
+    """`clients` clients enchaînent les requêtes dès la réponse précédente."""
+    queue = asyncio.Queue()
+    for i in range(requests_count):
+        queue.put_nowait(qa_pairs[i % len(qa_pairs)])
+    results = []
+
+    async def client():
+        while not queue.empty():
+            await timed_query(target, queue.get_nowait(), k, results)
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return results
+
+
+async def run_batches(target, qa_pairs, batch_size: int, requests_count: int, k: int) -> list:
+    """Lots envoyés l'un après l'autre ; chaque question reçoit la latence de son lot."""
+    items = [qa_pairs[i % len(qa_pairs)] for i in range(requests_count)]
     results = []
-    
-    print(f"🚀 Démarrage du benchmark sur {len(qa_pairs)} questions...")
-
-    total_latency = 0
-    total_similarity = 0
-
-    for i, item in enumerate(qa_pairs):
-        question = item["question"]
-        expected_answer = item["answer"]
-        
-        # 1. Mesure de la Latence
-        start_time = time.time()
+    for begin in range(0, len(items), batch_size):
+        batch = items[begin:begin + batch_size]
+        start = time.perf_counter()
         try:
-            response = requests.post(API_URL, json={"q": question, "k": 5})
-            response.raise_for_status()
-            data = response.json()
-            generated_answer = data["answer"]
-        except Exception as e:
-            generated_answer = "Error"
-            print(f"❌ Erreur sur Q{i+1}: {e}")
-        
-        end_time = time.time()
-        latency = end_time - start_time
-        
-        # 2. Calcul de la Similarité Cosinus
-        embeddings = model.encode([expected_answer, generated_answer])
-        similarity = cosine_similarity([embeddings[0]], [embeddings[1]])[0][0]
-        
-        # Stockage
-        results.append({
-            "id": i + 1,
-            "question": question,
-            "latency": latency,
-            "similarity": similarity,
-            "generated": generated_answer,
-            "expected": expected_answer
-        })
-        
-        total_latency += latency
-        total_similarity += similarity
-        print(f"✅ Q{i+1} | Latence: {latency:.2f}s | Sim: {similarity:.4f}")
-
-    # --- GÉNÉRATION DU RAPPORT MARKDOWN ---
-    avg_latency = total_latency / len(qa_pairs)
-    avg_similarity = total_similarity / len(qa_pairs)
-
-    print(f"\n📝 Génération du rapport dans {REPORT_FILE}...")
-    
-    with open(REPORT_FILE, "w", encoding="utf-8") as f:
-        # En-tête du rapport
-        f.write(f"# 📊 RAG Benchmark Report\n\n")
-        f.write(f"**Date:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-        f.write(f"**Document:** Attention Is All You Need\n")
-        f.write(f"**Evaluated Questions:** {len(qa_pairs)}\n\n")
-        
-        # Résumé Global
-        f.write("## 📈 Global Summary\n\n")
-        f.write("| Metric | Average Value |\n")
-        f.write("| :--- | :--- |\n")
-        f.write(f"| **Average Latency** | **{avg_latency:.4f} s** |\n")
-        f.write(f"| **Semantic Similarity** | **{avg_similarity:.4f}** |\n\n")
-        
-        # Détails par question
-        f.write("## 🧐 Detailed Analysis\n\n")
-        f.write("| ID | Question | Latency (s) | Similarity | Status |\n")
-        f.write("| :--- | :--- | :--- | :--- | :--- |\n")
-        
-        for res in results:
-            # Petite icône pour visualiser la qualité
-            status = "🟢 Excellent" if res["similarity"] > 0.8 else "🟡 Good" if res["similarity"] > 0.6 else "🔴 Poor"
-            f.write(f"| {res['id']} | {res['question']} | {res['latency']:.2f} | {res['similarity']:.4f} | {status} |\n")
-
-        # Section Comparaison (Optionnelle pour le détail)
-        f.write("\n### 🔍 Answer Comparison (Sample)\n\n")
-        best_res = max(results, key=lambda x: x['similarity'])
-        worst_res = min(results, key=lambda x: x['similarity'])
-        
-        f.write(f"**✅ Best Match (Score: {best_res['similarity']:.4f})**\n")
-        f.write(f"> **Q:** {best_res['question']}\n")
-        f.write(f"> **Expected:** {best_res['expected']}\n")
-        f.write(f"> **Generated:** {best_res['generated']}\n\n")
-
-        f.write(f"**⚠️ Needs Improvement (Score: {worst_res['similarity']:.4f})**\n")
-        f.write(f"> **Q:** {worst_res['question']}\n")
-        f.write(f"> **Expected:** {worst_res['expected']}\n")
-        f.write(f"> **Generated:** {worst_res['generated']}\n")
-
-    print(f"✨ Rapport généré avec succès !")
+            status, bodies = await target.query_batch([item["question"] for item in batch], k)
+        except Exception:
+            status, bodies = None, None
+        latency = time.perf_counter() - start
+        for i, item in enumerate(batch):
+            body = bodies[i] if bodies else None
+            # Erreur propre à une question : comptée comme une erreur serveur
+            item_status = status if body is None or not body.get("error") else 500
+            results.append({"item": item, "status": item_status, "latency": latency, "body": body})
+    return results
+
+
+async def run_open_loop(target, qa_pairs, rate: float, duration: float, k: int, seed: int) -> list:
+    """Arrivées de Poisson à `rate` requêtes/s pendant `duration` s, indépendamment des réponses."""
+    rng = np.random.default_rng(seed)
+    results, tasks = [], []
+    start = time.perf_counter()
+    next_at, i = start, 0
+    while next_at - start < duration:
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+        tasks.append(asyncio.create_task(timed_query(target, qa_pairs[i % len(qa_pairs)], k, results, next_at)))
+        i += 1
+        next_at += rng.exponential(1.0 / rate)
+    await asyncio.gather(*tasks)
+    return results
+
+
+def summarize(results, elapsed: float, k: int) -> dict:
+    ok = [r for r in results if r["status"] == 200]
+    summary = {
+        "requests": len(results),
+        "ok": len(ok),
+        "rejected_429": sum(1 for r in results if r["status"] == 429),
+        "errors": sum(1 for r in results if r["status"] not in (200, 429)),
+        "qps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        **percentiles([r["latency"] for r in ok]),
+    }
+    summary.update(retrieval_quality(ok, k))
+    return summary
+
+
+def retrieval_quality(ok_results, k: int) -> dict:
+    """Hit@k et MRR au niveau page (les sources renvoyées sont numérotées à partir de 1)."""
+    if not ok_results:
+        return {f"hit@{k}": None, "mrr": None}
+    hits, reciprocal_ranks = 0, []
+    for r in ok_results:
+        pages = [s.get("page") for s in r["body"]["sources"]]
+        rank = next((i + 1 for i, page in enumerate(pages) if page == r["item"]["page"]), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+    return {f"hit@{k}": round(hits / len(ok_results), 4), "mrr": round(float(np.mean(reciprocal_ranks)), 4)}
+
+
+def answer_similarity(results) -> float:
+    """Cosinus moyen entre réponse attendue et générée (seulement avec un vrai LLM)."""
+    from src.models import ModelFactory
+
+    ok = [r for r in results if r["status"] == 200]
+    if not ok:
+        return None
+    embeddings = ModelFactory.get_embeddings()
+    expected = embeddings.encode_documents([r["item"]["answer"] for r in ok])
+    generated = embeddings.encode_documents([r["body"]["answer"] for r in ok])
+    expected /= np.linalg.norm(expected, axis=1, keepdims=True)
+    generated /= np.linalg.norm(generated, axis=1, keepdims=True)
+    return round(float(np.mean(np.sum(expected * generated, axis=1))), 4)
+
+
+# --- Comparaison entre exécutions ---
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Liste des régressions : latence en hausse, débit ou qualité en baisse au-delà de `tolerance`."""
+    regressions = []
+
+    def check(label, metric, new, old, higher_is_better):
+        if new is None or old is None or old == 0:
+            return
+        change = (new - old) / old
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        print(f"| {label} | {metric} | {old} | {new} | {change:+.1%} | {'🔴' if worse else '🟢'} |")
+        if worse:
+            regressions.append(f"{label} {metric}: {old} -> {new} ({change:+.1%})")
+
+    print("\n| Scénario | Métrique | Référence | Actuel | Écart | |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- |")
+    for section, key in (("closed_loop", "clients"), ("open_loop", "rate"), ("batch", "batch_size")):
+        old_runs = {run[key]: run for run in baseline.get(section, [])}
+        for run in current.get(section, []):
+            old = old_runs.get(run[key])
+            if old is None:
+                continue
+            label = f"{section} {key}={run[key]}"
+            check(label, "p95_ms", run["p95_ms"], old["p95_ms"], higher_is_better=False)
+            check(label, "p99_ms", run["p99_ms"], old["p99_ms"], higher_is_better=False)
+            check(label, "qps", run["qps"], old["qps"], higher_is_better=True)
+            for metric in run:
+                if metric.startswith("hit@") or metric == "mrr":
+                    check(label, metric, run[metric], old.get(metric), higher_is_better=True)
+    for stage, stats in current.get("stages", {}).items():
+        old = baseline.get("stages", {}).get(stage)
+        if old:
+            check(f"stage {stage}", "p50_ms", stats["p50_ms"], old["p50_ms"], higher_is_better=False)
+    return regressions
+
+
+def write_report(results: dict, path: str):
+    """Rapport Markdown (uniquement si --report est demandé)."""
+    meta = results["meta"]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# 📊 RAG Benchmark Report\n\n")
+        f.write(f"**Date:** {meta['date']}  \n**Target:** {meta['target']}  \n**Commit:** {meta['commit']}\n\n")
+        f.write(f"**LLM:** {meta['llm']}  \n**Reranker:** {meta['reranker']}\n\n")
+        for section, key in (("closed_loop", "clients"), ("open_loop", "rate"), ("batch", "batch_size")):
+            if not results[section]:
+                continue
+            f.write(f"## {section}\n\n| {key} | OK | 429 | QPS | p50 (ms) | p95 (ms) | p99 (ms) |\n")
+            f.write("| :--- | :--- | :--- | :--- | :--- | :--- | :--- |\n")
+            for run in results[section]:
+                f.write(f"| {run[key]} | {run['ok']}/{run['requests']} | {run['rejected_429']} | {run['qps']} | "
+                        f"{run['p50_ms']} | {run['p95_ms']} | {run['p99_ms']} |\n")
+            f.write("\n")
+        if results["stages"]:
+            f.write("## Stages\n\n| Stage | p50 (ms) | p95 (ms) | p99 (ms) |\n| :--- | :--- | :--- | :--- |\n")
+            for stage, stats in results["stages"].items():
+                f.write(f"| {stage} | {stats['p50_ms']} | {stats['p95_ms']} | {stats['p99_ms']} |\n")
+        if results["quality"]:
+            f.write("\n## Quality\n\n")
+            for metric, value in results["quality"].items():
+                f.write(f"- **{metric}:** {value}\n")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+async def run(args) -> dict:
+    qa_pairs = load_ground_truth()
+    levels = list(args.concurrency)
+    if args.saturate:
+        # Plus de clients que de créneaux + places en file : l'admission doit répondre 429
+        levels.append(Config.MAX_CONCURRENT_QUERIES + Config.MAX_QUEUED_QUERIES + args.saturate)
+    if args.target == "http":
+        target = HttpTarget(args.url, max(levels + [64]))
+    else:
+        target = OfflineTarget(args)
+
+    results = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "target": args.url if args.target == "http" else "offline",
+            "k": args.k,
+            "llm": ("real" if args.target == "http" or args.real_llm
+                    else f"stub ({args.stub_llm_ms} ms + {args.stub_llm_ms_per_ktok} ms/1k tokens)"),
+            "reranker": (Config.RERANKER_BACKEND if args.target == "http" or args.real_reranker
+                         else f"stub ({args.stub_rerank_ms} ms)"),
+            "config": {
+                "FAISS_INDEX_TYPE": Config.FAISS_INDEX_TYPE,
+                "FAISS_STORAGE": Config.FAISS_STORAGE,
+                "FAISS_RESCORE_FACTOR": Config.FAISS_RESCORE_FACTOR,
+                "HIERARCHICAL_RETRIEVAL": Config.HIERARCHICAL_RETRIEVAL,
+                "HIERARCHY_SECTIONS": Config.HIERARCHY_SECTIONS,
+                "FUSION_METHOD": Config.FUSION_METHOD,
+                "MAX_CONCURRENT_QUERIES": Config.MAX_CONCURRENT_QUERIES,
+                "QUERY_EXECUTOR_WORKERS": Config.QUERY_EXECUTOR_WORKERS,
+                "CONTEXT_PACKING_ENABLED": Config.CONTEXT_PACKING_ENABLED,
+                "CONTEXT_TOKEN_BUDGET": Config.CONTEXT_TOKEN_BUDGET,
+            },
+        },
+        "stages": {},
+        "closed_loop": [],
+        "open_loop": [],
+        "batch": [],
+        "quality": {},
+    }
+
+    if args.target == "offline":
+        print(f"🔬 Profil par étape sur {len(qa_pairs)} questions...")
+        results["stages"] = target.profile_stages(qa_pairs, args.k)
+        results["quality"]["context_tokens_mean"] = round(float(np.mean(target.context_tokens)), 1)
+
+    # Un tour à blanc : connexions, modèles et caches internes chauds
+    await run_closed_loop(target, qa_pairs, 1, min(3, len(qa_pairs)), args.k)
+
+    all_results = []
+    for clients in levels:
+        requests_count = args.requests or len(qa_pairs) * max(1, clients)
+        print(f"🚀 Boucle fermée : {clients} client(s), {requests_count} requêtes...")
+        start = time.perf_counter()
+        level = await run_closed_loop(target, qa_pairs, clients, requests_count, args.k)
+        results["closed_loop"].append({"clients": clients, **summarize(level, time.perf_counter() - start, args.k)})
+        all_results += level
+    if args.saturate and not results["closed_loop"][-1]["rejected_429"]:
+        print(f"⚠️ Aucun 429 à {levels[-1]} clients : l'admission n'a rien refusé")
+    for rate in args.rates:
+        print(f"🌊 Boucle ouverte : {rate} req/s pendant {args.duration}s...")
+        start = time.perf_counter()
+        level = await run_open_loop(target, qa_pairs, rate, args.duration, args.k, args.seed)
+        results["open_loop"].append({"rate": rate, **summarize(level, time.perf_counter() - start, args.k)})
+        all_results += level
+
+    for batch_size in args.batch_sizes:
+        requests_count = args.requests or len(qa_pairs)
+        print(f"📦 Lots de {batch_size} questions, {requests_count} questions...")
+        start = time.perf_counter()
+        level = await run_batches(target, qa_pairs, batch_size, requests_count, args.k)
+        results["batch"].append({"batch_size": batch_size, **summarize(level, time.perf_counter() - start, args.k)})
+        all_results += level
+
+    if args.target == "http" or args.real_llm:
+        # Une réponse par question suffit pour la similarité
+        unique = {r["item"]["question"]: r for r in all_results if r["status"] == 200}
+        results["quality"]["answer_similarity"] = answer_similarity(list(unique.values()))
+    ok = [r for r in all_results if r["status"] == 200]
+    results["quality"].update(retrieval_quality(ok, args.k))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark charge + qualité du pipeline RAG")
+    parser.add_argument("--target", choices=["offline", "http"], default="offline",
+                        help="offline : pipeline de main.py dans ce processus ; http : serveur lancé")
+    parser.add_argument("--url", default=API_URL)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 4, 16],
+                        help="Niveaux de clients simultanés (boucle fermée)")
+    parser.add_argument("--requests", type=int, help="Requêtes par niveau (défaut : questions x clients)")
+    parser.add_argument("--saturate", type=int, nargs="?", const=16, default=0,
+                        help="Ajoute un niveau de N clients au-delà de MAX_CONCURRENT_QUERIES + MAX_QUEUED_QUERIES "
+                             "(défaut 16) : la réponse attendue est 429")
+    parser.add_argument("--rates", type=float, nargs="*", default=[],
+                        help="Débits d'arrivée en req/s (boucle ouverte, arrivées de Poisson)")
+    parser.add_argument("--batch-sizes", type=int, nargs="*", default=[],
+                        help="Tailles de lot pour /query/batch (lots envoyés l'un après l'autre)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Durée de chaque débit (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stub-llm-ms", type=float, default=300.0)
+    parser.add_argument("--stub-llm-ms-per-ktok", type=float, default=150.0,
+                        help="Latence ajoutée par millier de tokens de prompt (coût du contexte)")
+    parser.add_argument("--stub-rerank-ms", type=float, default=20.0)
+    parser.add_argument("--real-llm", action="store_true", help="offline : vrai LLM au lieu du bouchon")
+    parser.add_argument("--real-reranker", action="store_true", help="offline : reranker de Config")
+    parser.add_argument("--cache", action="store_true", help="offline : garder le cache de réponses")
+    parser.add_argument("--json", help="Fichier de résultats (défaut : benchmarks/<date>.json)")
+    parser.add_argument("--compare", help="Résultats de référence : signale les régressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Écart relatif toléré (0.15 = 15%%)")
+    parser.add_argument("--report", help="Écrit aussi un rapport Markdown (ex : BENCHMARK_REPORT.md)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    print("\n| Scénario | OK | 429 | QPS | p50 (ms) | p95 (ms) | p99 (ms) |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- | :--- |")
+    for run_ in results["closed_loop"]:
+        print(f"| {run_['clients']} client(s) | {run_['ok']}/{run_['requests']} | {run_['rejected_429']} | "
+              f"{run_['qps']} | {run_['p50_ms']} | {run_['p95_ms']} | {run_['p99_ms']} |")
+    for run_ in results["open_loop"]:
+        print(f"| {run_['rate']} req/s | {run_['ok']}/{run_['requests']} | {run_['rejected_429']} | "
+              f"{run_['qps']} | {run_['p50_ms']} | {run_['p95_ms']} | {run_['p99_ms']} |")
+    for run_ in results["batch"]:
+        print(f"| lots de {run_['batch_size']} | {run_['ok']}/{run_['requests']} | {run_['rejected_429']} | "
+              f"{run_['qps']} | {run_['p50_ms']} | {run_['p95_ms']} | {run_['p99_ms']} |")
+    if results["stages"]:
+        print("\n| Étape | p50 (ms) | p95 (ms) | p99 (ms) |")
+        print("| :--- | :--- | :--- | :--- |")
+        for stage, stats in results["stages"].items():
+            print(f"| {stage} | {stats['p50_ms']} | {stats['p95_ms']} | {stats['p99_ms']} |")
+    print(f"\n📐 Qualité : {results['quality']}")
+
+    path = args.json or os.path.join("benchmarks", f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Résultats : {path}")
+    if args.report:
+        write_report(results, args.report)
+        print(f"📝 Rapport : {args.report}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} régression(s) au-delà de {args.tolerance:.0%} :")
+            for line in regressions:
+                print(f"  - {line}")
+            raise SystemExit(1)
+        print(f"\n✅ Aucune régression au-delà de {args.tolerance:.0%}")
+
 
 if __name__ == "__main__":
-    run_benchmark()
\ No newline at end of file
+    main()
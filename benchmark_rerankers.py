@@ -0,0 +1,85 @@
+import json
+import time
+import argparse
+import statistics
+
+from src.models import ModelFactory
+from src.corpus import CorpusManager
+
+# --- CONFIGURATION ---
+GROUND_TRUTH_PATH = "data/ground_truth.json"
+
+
+def is_relevant(doc, item) -> bool:
+    """Un passage est pertinent s'il vient de la page attendue (PyPDFLoader numérote à partir de 0)."""
+    page = doc.metadata.get("page")
+    return page is not None and int(page) + 1 == item["page"]
+
+
+def evaluate(name, rank_fn, store, qa_pairs, k, documents=None):
+    latencies, hits, reciprocal_ranks = [], 0, []
+    for item in qa_pairs:
+        candidates = store.retrieve_candidates(item["question"], k=k, documents=documents)
+        start = time.perf_counter()
+        ranked = rank_fn(item["question"], candidates, k)
+        latencies.append(time.perf_counter() - start)
+
+        rank = next((i + 1 for i, doc in enumerate(ranked) if is_relevant(doc, item)), None)
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    latencies.sort()
+    return {
+        "reranker": name,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        f"hit@{k}": hits / len(qa_pairs),
+        "mrr": statistics.mean(reciprocal_ranks),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare les rerankers (latence et qualité) sur la vérité terrain")
+    parser.add_argument("--backends", nargs="+", default=["none", "cohere", "cross-encoder"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--documents", nargs="+",
+                        help="Shards interrogés (doc_id ou nom de fichier) : ceux de la vérité terrain ; défaut : tout le corpus")
+    parser.add_argument("--json", help="Fichier où écrire les résultats bruts")
+    args = parser.parse_args()
+
+    with open(GROUND_TRUTH_PATH, "r") as f:
+        qa_pairs = json.load(f)
+
+    # Les shards du corpus, comme le serveur (reranking fait ici, backend par backend)
+    store = CorpusManager()
+    if not store.load():
+        raise SystemExit("❌ Aucun index trouvé : lancez d'abord main.py pour l'ingestion.")
+    if not store.select_shards(args.documents):
+        raise SystemExit(f"❌ Aucun shard ne correspond à {args.documents}")
+
+    results = []
+    for backend in args.backends:
+        if backend == "none":
+            rank_fn = lambda q, docs, k: docs[:k]
+        else:
+            reranker = ModelFactory.get_reranker(backend)
+            if reranker is None:
+                continue
+            # Un appel à blanc pour ne pas compter le chargement du modèle / la connexion
+            reranker.rerank("warmup", store.retrieve_candidates("warmup", k=args.k, documents=args.documents), args.k)
+            rank_fn = lambda q, docs, k, r=reranker: [doc for doc, _ in r.rerank(q, docs, k)]
+        print(f"⏱️ Évaluation de '{backend}' sur {len(qa_pairs)} questions...")
+        results.append(evaluate(backend, rank_fn, store, qa_pairs, args.k, args.documents))
+
+    print(f"\n| Reranker | p50 (ms) | p95 (ms) | Hit@{args.k} | MRR |")
+    print("| :--- | :--- | :--- | :--- | :--- |")
+    for r in results:
+        print(f"| {r['reranker']} | {r['p50_ms']:.1f} | {r['p95_ms']:.1f} | {r[f'hit@{args.k}']:.2f} | {r['mrr']:.3f} |")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
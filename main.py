@@ -1,147 +1,625 @@
+import time
+# Mesure du coût d'import (rapporté par /health) : doit rester la première instruction
+_import_start = time.perf_counter()
+
 import os
+import json
+import asyncio
+import threading
 import uvicorn
-import time
-from fastapi import FastAPI, HTTPException
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 # Imports internes
+from src.answer_store import AnswerStore
 from src.config import Config
-from src.contextual import ContextualProcessor
-from src.vector_store import HybridStore
+from src.context_packing import pack_context
+from src.corpus import CorpusManager
+from src.jobs import IngestionJobManager
 from src.models import ModelFactory
-
-# Configuration
-TARGET_PDF = "data/attention_is_all_you_need.pdf"
-INDEX_FOLDER = "data/faiss_index"
+from src.query_cache import QueryCache
+from src.rate_limiter import estimate_tokens
+from src.telemetry import (
+    PROMPT_TOKENS, REGISTRY, REJECTED_REQUESTS, Trace, observe_stages, record_stage, trace_request
+)
+from src.vector_store import embed_queries
 
 app = FastAPI(title="RAG : Attention Is All You Need", version="2.0")
 
-# Initialisation globale
-rag_store = HybridStore()
-llm_client = ModelFactory.get_llm()
+# Initialisation globale : corpus multi-documents (un shard par PDF)
+rag_store = CorpusManager()
+# Client LLM créé au premier usage (voir get_llm_client)
+llm_client = None
+
+# Cache des réponses, vidé dès que l'index change
+query_cache = QueryCache(
+    max_entries=Config.QUERY_CACHE_MAX_ENTRIES,
+    ttl_seconds=Config.QUERY_CACHE_TTL_SECONDS,
+    similarity_threshold=Config.QUERY_CACHE_SIMILARITY_THRESHOLD
+) if Config.QUERY_CACHE_ENABLED else None
+if query_cache:
+    rag_store.add_index_listener(query_cache.invalidate)
+
+# Réponses préparées (warm_answers.py) et journal des requêtes, liés à la version de l'index
+answer_store = AnswerStore(
+    Config.ANSWER_STORE_PATH, Config.QUERY_LOG_MAX_ROWS
+) if Config.ANSWER_STORE_ENABLED or Config.QUERY_LOG_ENABLED else None
+if answer_store:
+    rag_store.add_index_listener(lambda: answer_store.invalidate(rag_store.index_version()))
+
+# Ingestion en arrière-plan (processus séparé) : les nouveaux shards sont basculés à chaud
+job_manager = IngestionJobManager(rag_store)
+
+# Pool borné pour les étapes CPU de la recherche : l'event loop reste libre
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=Config.QUERY_EXECUTOR_WORKERS,
+    thread_name_prefix="retrieval"
+)
+# Limite de concurrence + compteur des requêtes admises (en cours ou en attente)
+query_slots = asyncio.Semaphore(Config.MAX_CONCURRENT_QUERIES)
+admitted_queries = 0
+
+# Temps de démarrage (secondes), exposés par /health
+startup_timings = {"import_s": None, "load_shards_s": None, "models_s": None}
+
+def get_llm_client():
+    """L'import de langchain_cohere et la création du client sont reportés au premier usage."""
+    global llm_client
+    if llm_client is None:
+        llm_client = ModelFactory.get_llm()
+    return llm_client
+
+def preload_models():
+    """Charge le modèle d'embedding, le reranker et le client LLM (thread de fond ou bloquant)."""
+    start = time.perf_counter()
+    try:
+        rag_store.embeddings.warmup()
+        if rag_store.reranker and hasattr(rag_store.reranker, "warmup"):
+            rag_store.reranker.warmup()
+        get_llm_client()
+    except Exception as e:
+        print(f"⚠️ Préchargement des modèles incomplet : {e}")
+    startup_timings["models_s"] = round(time.perf_counter() - start, 3)
+    print(f"⏱️ Modèles prêts en {startup_timings['models_s']}s")
+
+def check_capacity():
+    if admitted_queries >= Config.MAX_CONCURRENT_QUERIES + Config.MAX_QUEUED_QUERIES:
+        REJECTED_REQUESTS.inc()
+        raise HTTPException(
+            status_code=429,
+            detail="Serveur saturé, réessayez dans un instant.",
+            headers={"Retry-After": "1"}
+        )
+
+@asynccontextmanager
+async def admission_control():
+    """Refuse la requête (429) si la file d'attente est pleine, sinon attend un créneau."""
+    global admitted_queries
+    check_capacity()
+    admitted_queries += 1
+    try:
+        async with query_slots:
+            yield
+    finally:
+        admitted_queries -= 1
 
 # --- Modèles Pydantic ---
+class QueryFilters(BaseModel):
+    documents: Optional[List[str]] = None  # doc_id ou nom de fichier
+    page_from: Optional[int] = None        # pages numérotées à partir de 1
+    page_to: Optional[int] = None
+    date_from: Optional[str] = None        # YYYY-MM-DD, date du document
+    date_to: Optional[str] = None
+
+    def search_kwargs(self) -> dict:
+        pages = None
+        if self.page_from is not None or self.page_to is not None:
+            pages = (self.page_from or 1, self.page_to or 10**9)
+        return {"documents": self.documents, "pages": pages,
+                "date_from": self.date_from, "date_to": self.date_to}
+
 class QueryRequest(BaseModel):
     q: str
     k: int = 6
+    filters: Optional[QueryFilters] = None
+
+    def search_kwargs(self) -> dict:
+        return self.filters.search_kwargs() if self.filters else {}
+
+    def cache_scope(self) -> str:
+        return self.filters.model_dump_json(exclude_none=True) if self.filters else ""
 
 class SourceItem(BaseModel):
     chunk_id: int
+    global_id: Optional[str] = None
+    doc_id: Optional[str] = None
+    page: Optional[int] = None
     score: float
     method: str
+    section: Optional[str] = None  # titre de section (recherche hiérarchique)
     preview: str
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[SourceItem]
 
-# --- Logique d'Ingestion Automatique ---
-# Dans main.py
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    k: int = 6
+    filters: Optional[QueryFilters] = None  # communs à tout le lot
 
-def ingest_local_file():
-    """
-    Lit le fichier PDF local, le découpe, génère les embeddings et sauvegarde l'index.
-    """
-    print(f"🔄 Démarrage de l'ingestion pour : {TARGET_PDF}")
-    
-    if not os.path.exists(TARGET_PDF):
-        print(f"❌ ERREUR CRITIQUE : Le fichier {TARGET_PDF} est introuvable !")
-        return False
-
-    processor = ContextualProcessor()
-    
-    # 1. Chargement et découpage
-    print("✂️ Lecture et découpage du PDF...")
-    raw_docs, basic_chunks = processor.load_and_split(TARGET_PDF)
-    
-    # 2. Contextualisation (Attention au Rate Limit Cohere !)
-    print(f"🧠 Génération des embeddings pour {len(basic_chunks)} segments...")
-    
-    # Pause de sécurité pour éviter l'erreur 429 si nécessaire
-    # time.sleep(2) 
-    
-    contextualized_chunks = processor.generate_contextual_chunks(
-        "Ce document présente l'architecture Transformer.", 
-        basic_chunks
-    )
-    
-    # 3. Construction et Sauvegarde
-    print("💾 Création et sauvegarde de l'index FAISS...")
-    
-    # --- CORRECTION ICI : On ajoute le deuxième argument (filename) ---
-    rag_store.build_index(contextualized_chunks, os.path.basename(TARGET_PDF)) 
-    # -----------------------------------------------------------------
-    
-    return True
+    def item(self, q: str) -> QueryRequest:
+        return QueryRequest(q=q, k=self.k, filters=self.filters)
+
+class BatchItem(BaseModel):
+    answer: Optional[str] = None
+    sources: Optional[List[SourceItem]] = None
+    error: Optional[str] = None  # erreur propre à cette question, les autres sont servies
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchItem]  # dans l'ordre de `queries`
+
+class JobRequest(BaseModel):
+    files: Optional[List[str]] = None  # PDF du dossier source ; vide = synchronisation complète
+    force: bool = False                # ré-ingère même si le fichier n'a pas changé
+    prune: bool = False                # synchronisation : retire les shards dont le PDF a disparu
 
 # --- Événement de Démarrage (Le Cœur du Système) ---
 @app.on_event("startup")
 async def startup_event():
     print("🚀 Initialisation du serveur RAG...")
-    
-    # Étape 1 : Essayer de charger l'index existant
-    if rag_store.load_index():
-        print("✅ Index FAISS chargé depuis le disque. Le système est prêt instantanément !")
-        # Petite vérification optionnelle : est-ce qu'il y a des docs ?
-        if rag_store.vector_db:
-            print(f"   -> Base vectorielle active.")
-    
-    # Étape 2 : Si pas d'index, on le crée
+    print(f"⏱️ Import de main.py : {startup_timings['import_s']}s")
+
+    # Étape 1 : Charger les shards existants (mmap : quasi instantané, aucun modèle requis)
+    start = time.perf_counter()
+    if rag_store.load():
+        print(f"✅ {len(rag_store.shards)} shard(s) chargé(s) depuis le disque.")
     else:
-        print("⚠️ Aucun index trouvé. Lancement de l'ingestion automatique...")
-        success = ingest_local_file()
-        if success:
-             print("✅ Ingestion terminée avec succès. Le système est prêt.")
-        else:
-             print("❌ Échec de l'initialisation. Vérifiez que le fichier PDF est bien dans /data.")
+        print("⚠️ Aucun index trouvé. Les requêtes répondront 503 jusqu'à la fin de la première ingestion.")
+    startup_timings["load_shards_s"] = round(time.perf_counter() - start, 3)
+    if answer_store:
+        # Réponses préparées sur un index qui n'est plus celui en service
+        answer_store.invalidate(rag_store.index_version())
+    print(f"⏱️ Shards chargés en {startup_timings['load_shards_s']}s")
+
+    # Étape 2 : Modèles (paresseux, en arrière-plan ou bloquant selon Config.MODEL_LOADING)
+    if Config.MODEL_LOADING == "eager":
+        await asyncio.get_running_loop().run_in_executor(None, preload_models)
+    elif Config.MODEL_LOADING == "background":
+        threading.Thread(target=preload_models, name="preload-models", daemon=True).start()
+
+    # Étape 3 : Synchroniser les PDF nouveaux ou modifiés en arrière-plan (le serveur répond déjà).
+    # Jamais de retrait au démarrage : il passe par POST /admin/jobs {"prune": true}.
+    # Un seul worker uvicorn mène l'ingestion, les autres suivent le manifeste du corpus.
+    if job_manager.start():
+        job = job_manager.submit()
+        print(f"🔄 Synchronisation du corpus avec {Config.CORPUS_SOURCE_DIR} : job {job.id}")
+    else:
+        rag_store.start_auto_refresh(Config.CORPUS_REFRESH_SECONDS)
+        print(f"👀 Ingestion menée par un autre worker : suivi du corpus toutes les {Config.CORPUS_REFRESH_SECONDS}s")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    job_manager.stop()
 
 # --- Endpoint de Question (Lecture Seule) ---
 @app.post("/query", response_model=QueryResponse)
 async def query_endpoint(request: QueryRequest):
-    if not rag_store.vector_db:
-        raise HTTPException(status_code=503, detail="Le système est en cours d'initialisation ou l'index est vide.")
+    with trace_request("query") as trace:
+        if not rag_store.is_ready():
+            raise HTTPException(status_code=503, detail="Le système est en cours d'initialisation ou l'index est vide.")
+
+        # Le niveau exact du cache et les réponses préparées ne coûtent rien : pas besoin de créneau
+        if query_cache and (result := query_cache.get_exact(request.q, request.k, request.cache_scope())):
+            trace.outcome = "cache_exact"
+        elif result := await get_prepared_answer(request):
+            trace.outcome = "prepared"
+        else:
+            async with admission_control():
+                result = await answer_query(request, trace)
+        record_query("query", request, result, trace)
+        return result
+
+async def get_prepared_answer(request: QueryRequest) -> Optional[dict]:
+    """Réponse pré-calculée pour cette question, si elle date de l'index en service."""
+    return (await get_prepared_answers([request]))[0]
+
+async def get_prepared_answers(requests: List[QueryRequest]) -> List[Optional[dict]]:
+    """Réponses pré-calculées d'un lot : une seule lecture SQLite, hors de la boucle d'évènements."""
+    if not answer_store or not Config.ANSWER_STORE_ENABLED or not requests:
+        return [None] * len(requests)
+    return await asyncio.get_running_loop().run_in_executor(
+        retrieval_executor, answer_store.get_many,
+        [(request.q, request.k, request.cache_scope()) for request in requests], rag_store.index_version()
+    )
+
+def record_query(endpoint: str, request: QueryRequest, result: Optional[dict], trace: Trace):
+    """Journalise la requête (chunks retrouvés, durées) pour un rejeu hors ligne (replay_queries.py)."""
+    if not answer_store or not Config.QUERY_LOG_ENABLED:
+        return
+    sources = (result or {}).get("sources") or []
+    answer_store.record(
+        endpoint, request.q, request.k, request.cache_scope(), rag_store.index_version(),
+        "error" if result is None or result.get("error") else trace.outcome,
+        [source.get("global_id") or str(source.get("chunk_id")) for source in sources],
+        trace.spans, time.perf_counter() - trace.start
+    )
+
+# --- Endpoint de Questions par Lot (évaluation hors ligne, traitements de masse) ---
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_batch_endpoint(request: BatchQueryRequest):
+    with trace_request("query_batch") as trace:
+        if not rag_store.is_ready():
+            raise HTTPException(status_code=503, detail="Le système est en cours d'initialisation ou l'index est vide.")
+        if len(request.queries) > Config.BATCH_MAX_QUERIES:
+            raise HTTPException(status_code=413, detail=f"Au plus {Config.BATCH_MAX_QUERIES} questions par lot.")
+
+        # Un lot occupe un créneau ; ses appels LLM sont bornés par Config.BATCH_CONCURRENCY
+        async with admission_control():
+            results = await answer_batch(request, trace)
+        for q, result in zip(request.queries, results):
+            record_query("query_batch", request.item(q), result, trace)
+        return {"results": results}
+
+SYSTEM_PROMPT = (
+    "You are an expert on the research paper 'Attention Is All You Need'. "
+    "Answer the user's question using ONLY the context provided below. "
+    "Strict rules:\n"
+    "1. Answer in English.\n"
+    "2. If the answer is not in the context, say exactly: 'I cannot answer this based on the provided context.'\n"
+    "3. Do not use outside knowledge.\n"
+    "4. Always cite the source index (e.g., [Source 1])."
+)
+
+def build_messages(question: str, retrieved_docs: List[dict]) -> List[dict]:
+    """Prompt Système Strict + contexte numéroté (compressé dans Config.CONTEXT_TOKEN_BUDGET)."""
+    passages = [d["content"] for d in retrieved_docs]
+    if Config.CONTEXT_PACKING_ENABLED:
+        # Les numéros de source restent ceux de format_sources, même si un chunk est écarté
+        packed = pack_context(question, passages, Config.CONTEXT_TOKEN_BUDGET,
+                              max_sentences=Config.CONTEXT_MAX_SENTENCES_PER_CHUNK,
+                              dedup_threshold=Config.CONTEXT_DEDUP_THRESHOLD,
+                              anchors=[d.get("match") for d in retrieved_docs])
+    else:
+        packed = list(enumerate(passages))
+    context_str = "\n\n".join([f"[Source {i+1}] {text}" for i, text in packed])
+    PROMPT_TOKENS.observe(estimate_tokens(context_str))
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"CONTEXTE:\n{context_str}\n\nQUESTION:\n{question}"}
+    ]
 
+async def prepare_messages(question: str, retrieved_docs: List[dict], trace: Trace) -> List[dict]:
+    """build_messages hors de l'event loop (découpage en phrases et doublons : quelques ms en CPU)."""
+    start = time.perf_counter()
+    messages = await asyncio.get_running_loop().run_in_executor(
+        retrieval_executor, build_messages, question, retrieved_docs
+    )
+    record_stage(trace.spans, "pack_s", start)
+    return messages
+
+def format_sources(retrieved_docs: List[dict]) -> List[dict]:
+    sources_output = []
+    for doc in retrieved_docs:
+        c_id = doc.get("chunk_id", 0) # Sécurité int
+        sources_output.append({
+            "chunk_id": int(c_id) if c_id is not None else 0,
+            "global_id": doc.get("global_id"),
+            "doc_id": doc.get("doc_id"),
+            "page": int(doc["page"]) + 1 if doc.get("page") is not None else None,
+            "score": float(doc.get("score", 0.0)),
+            "method": str(doc.get("source_method", "Unknown")),
+            "section": doc.get("section"),
+            "preview": str(doc.get("content", ""))[:80] + "..."
+        })
+    return sources_output
+
+async def lookup_semantic_cache(request: QueryRequest, trace: Trace):
+    """Embedde la requête (dans le pool) et consulte le niveau sémantique du cache."""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    query_vector = await loop.run_in_executor(retrieval_executor, rag_store.embed_query, request.q)
+    record_stage(trace.spans, "embed_s", start)
+    cached = query_cache.get_semantic(query_vector, request.k, request.cache_scope())
+    if cached:
+        trace.outcome = "cache_semantic"
+    return query_vector, cached
+
+async def answer_query(request: QueryRequest, trace: Trace = None):
+    # Sans trace fournie (ex : benchmark.py), les mesures sont simplement ignorées
+    trace = trace or Trace()
     try:
-        # 1. Recherche
-        retrieved_docs = rag_store.search(request.q, k=request.k)
-        
-        # 2. Prompt Système Strict
-# Dans main.py, à l'intérieur de query_endpoint
-        
-        system_prompt = (
-            "You are an expert on the research paper 'Attention Is All You Need'. "
-            "Answer the user's question using ONLY the context provided below. "
-            "Strict rules:\n"
-            "1. Answer in English.\n"
-            "2. If the answer is not in the context, say exactly: 'I cannot answer this based on the provided context.'\n"
-            "3. Do not use outside knowledge.\n"
-            "4. Always cite the source index (e.g., [Source 1])."
-        )
-        context_str = "\n\n".join([f"[Source {i+1}] {d['content']}" for i, d in enumerate(retrieved_docs)])
+        query_vector = None
+        if query_cache:
+            generation = query_cache.generation
+            query_vector, cached = await lookup_semantic_cache(request, trace)
+            if cached:
+                return cached
 
-        # 3. Génération
-        response = llm_client.invoke([
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"CONTEXTE:\n{context_str}\n\nQUESTION:\n{request.q}"}
-        ])
+        # 1. Recherche (FAISS/BM25 dans le pool, rerank asynchrone)
+        retrieved_docs = await rag_store.asearch(
+            request.q, k=request.k, executor=retrieval_executor, query_vector=query_vector,
+            timings=trace.spans, **request.search_kwargs()
+        )
 
-        # 4. Formatage
-        sources_output = []
-        for doc in retrieved_docs:
-            c_id = doc.get("chunk_id", 0) # Sécurité int
-            sources_output.append({
-                "chunk_id": int(c_id) if c_id is not None else 0,
-                "score": float(doc.get("score", 0.0)),
-                "method": str(doc.get("source_method", "Unknown")),
-                "preview": str(doc.get("content", ""))[:80] + "..."
-            })
+        # 2. Génération (client asynchrone, contexte compressé dans le pool)
+        messages = await prepare_messages(request.q, retrieved_docs, trace)
+        start = time.perf_counter()
+        response = await get_llm_client().ainvoke(messages)
+        record_stage(trace.spans, "llm_s", start)
 
-        return {"answer": response.content, "sources": sources_output}
+        # 3. Formatage
+        result = {"answer": response.content, "sources": format_sources(retrieved_docs)}
+        if query_cache:
+            query_cache.put(request.q, request.k, result, query_vector,
+                            generation=generation, scope=request.cache_scope())
+        return result
 
     except Exception as e:
         print(f"Erreur Query: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def answer_batch(request: BatchQueryRequest, trace: Trace = None) -> List[dict]:
+    """
+    Répond à un lot de questions : cache, puis un seul embedding pour tout le lot, une recherche
+    FAISS/BM25 groupée (asearch_batch) et la génération avec au plus BATCH_CONCURRENCY appels LLM.
+    Renvoie une entrée par question, dans l'ordre : {"answer", "sources"} ou {"error"}.
+    """
+    trace = trace or Trace()
+    items = [request.item(q) for q in request.queries]
+    results: List[Optional[dict]] = [None] * len(items)
+    scope = items[0].cache_scope() if items else ""
+    generation = query_cache.generation if query_cache else None
+
+    if query_cache:
+        for i, item in enumerate(items):
+            results[i] = query_cache.get_exact(item.q, item.k, scope)
+    todo = [i for i in range(len(items)) if results[i] is None]
+    for i, prepared in zip(todo, await get_prepared_answers([items[i] for i in todo])):
+        results[i] = prepared
+    todo = [i for i in todo if results[i] is None]
+    if not todo:
+        return results
+
+    # 1. Embeddings du lot (un seul encode), puis niveau sémantique du cache
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    vectors = await loop.run_in_executor(
+        retrieval_executor, embed_queries, rag_store.embeddings, [items[i].q for i in todo]
+    )
+    record_stage(trace.spans, "embed_s", start)
+    if query_cache:
+        for row, i in enumerate(todo):
+            results[i] = query_cache.get_semantic(vectors[row], request.k, scope)
+        misses = [row for row, i in enumerate(todo) if results[i] is None]
+        todo, vectors = [todo[row] for row in misses], vectors[misses]
+    if not todo:
+        return results
+
+    # 2. Recherche groupée (une erreur ici concerne tout le lot)
+    try:
+        retrieved = await rag_store.asearch_batch(
+            [items[i].q for i in todo], k=request.k, executor=retrieval_executor, query_vectors=vectors,
+            concurrency=Config.BATCH_CONCURRENCY, timings=trace.spans, **items[0].search_kwargs()
+        )
+    except Exception as e:
+        print(f"Erreur Query (batch): {e}")
+        for i in todo:
+            results[i] = {"error": str(e)}
+        return results
+
+    # 3. Génération, concurrence bornée ; chaque question échoue indépendamment
+    semaphore = asyncio.Semaphore(max(1, Config.BATCH_CONCURRENCY))
+
+    async def generate(i: int, vector: np.ndarray, retrieved_docs: List[dict]):
+        # Étapes mesurées par question (et non sommées sur le lot)
+        item_trace = Trace()
+        async with semaphore:
+            try:
+                messages = await prepare_messages(items[i].q, retrieved_docs, item_trace)
+                start = time.perf_counter()
+                response = await get_llm_client().ainvoke(messages)
+                record_stage(item_trace.spans, "llm_s", start)
+                result = {"answer": response.content, "sources": format_sources(retrieved_docs)}
+                if query_cache:
+                    query_cache.put(items[i].q, items[i].k, result, vector, generation=generation, scope=scope)
+                results[i] = result
+            except Exception as e:
+                print(f"Erreur Query (batch, question {i}): {e}")
+                results[i] = {"error": str(e)}
+            finally:
+                observe_stages(item_trace.spans)
+
+    await asyncio.gather(*(generate(i, vectors[row], docs) for row, (i, docs) in enumerate(zip(todo, retrieved))))
+    return results
+
+# --- Endpoint de Question en Streaming (Server-Sent Events) ---
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_answer(request: QueryRequest):
+    """
+    Envoie d'abord les sources, puis les tokens du LLM au fil de l'eau.
+    Le dernier évènement `done` sépare le temps jusqu'au premier token (TTFT) du temps total.
+    """
+    with trace_request("query_stream") as trace:
+        async with admission_control():
+            start = time.perf_counter()
+            try:
+                query_vector, cached = None, None
+                if query_cache:
+                    generation = query_cache.generation
+                    cached = query_cache.get_exact(request.q, request.k, request.cache_scope())
+                    if cached:
+                        trace.outcome = "cache_exact"
+                if not cached and (cached := await get_prepared_answer(request)):
+                    trace.outcome = "prepared"
+                if not cached and query_cache:
+                    query_vector, cached = await lookup_semantic_cache(request, trace)
+                if cached:
+                    # Réponse en cache : tout part d'un coup
+                    yield sse_event("sources", cached["sources"])
+                    yield sse_event("token", {"text": cached["answer"]})
+                    elapsed = round(time.perf_counter() - start, 4)
+                    yield sse_event("done", {"retrieval_s": 0.0, "ttft_s": elapsed, "total_s": elapsed, "cached": True})
+                    record_query("query_stream", request, cached, trace)
+                    return
+
+                retrieved_docs = await rag_store.asearch(
+                    request.q, k=request.k, executor=retrieval_executor, query_vector=query_vector,
+                    timings=trace.spans, **request.search_kwargs()
+                )
+                retrieval_time = time.perf_counter() - start
+                sources = format_sources(retrieved_docs)
+                yield sse_event("sources", sources)
+
+                messages = await prepare_messages(request.q, retrieved_docs, trace)
+                llm_start = time.perf_counter()
+                ttft = None
+                answer = ""
+                async for chunk in get_llm_client().astream(messages):
+                    if not chunk.content:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    answer += chunk.content
+                    yield sse_event("token", {"text": chunk.content})
+                record_stage(trace.spans, "llm_s", llm_start)
+
+                if query_cache:
+                    query_cache.put(request.q, request.k, {"answer": answer, "sources": sources},
+                                    query_vector, generation=generation, scope=request.cache_scope())
+                record_query("query_stream", request, {"answer": answer, "sources": sources}, trace)
+                yield sse_event("done", {
+                    "retrieval_s": round(retrieval_time, 4),
+                    "ttft_s": round(ttft if ttft is not None else time.perf_counter() - start, 4),
+                    "total_s": round(time.perf_counter() - start, 4),
+                    "cached": False
+                })
+            except Exception as e:
+                # Les en-têtes HTTP sont déjà partis : l'erreur passe par le flux
+                print(f"Erreur Query (stream): {e}")
+                trace.outcome = "error"
+                yield sse_event("error", {"detail": str(e)})
+
+@app.post("/query/stream")
+async def query_stream_endpoint(request: QueryRequest):
+    if not rag_store.is_ready():
+        raise HTTPException(status_code=503, detail="Le système est en cours d'initialisation ou l'index est vide.")
+    # Vérifié avant d'ouvrir le flux pour pouvoir répondre un vrai 429
+    check_capacity()
+
+    return StreamingResponse(
+        stream_answer(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --- Documents du corpus ---
+@app.get("/documents")
+async def documents_endpoint():
+    return {"documents": rag_store.list_documents()}
+
+# --- Administration : jobs d'ingestion ---
+def require_admin(x_admin_key: Optional[str] = Header(default=None)):
+    if Config.ADMIN_API_KEY and x_admin_key != Config.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="Clé d'administration invalide.")
+
+@app.post("/admin/jobs", status_code=202, dependencies=[Depends(require_admin)])
+async def submit_job_endpoint(request: JobRequest):
+    try:
+        job = await asyncio.get_running_loop().run_in_executor(
+            None, job_manager.submit, request.files, request.force, request.prune
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return job.to_dict()
+
+@app.get("/admin/jobs", dependencies=[Depends(require_admin)])
+async def list_jobs_endpoint():
+    return {"jobs": [job.to_dict() for job in job_manager.list()]}
+
+@app.get("/admin/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def job_status_endpoint(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job inconnu.")
+    return job.to_dict()
+
+@app.delete("/admin/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def cancel_job_endpoint(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job inconnu.")
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Job déjà terminé ({job.status}).")
+    return job.to_dict()
+
+# --- Santé et démarrage ---
+@app.get("/health")
+async def health_endpoint():
+    reranker = rag_store.reranker
+    return {
+        "ready": rag_store.is_ready(),
+        "pid": os.getpid(),
+        "ingestion_leader": job_manager.is_leader,
+        "models_loaded": {
+            "embeddings": rag_store.embeddings.is_loaded,
+            "reranker": bool(reranker) and getattr(reranker, "is_loaded", True),
+            "llm": llm_client is not None,
+        },
+        "timings": startup_timings,
+    }
+
+# --- Métriques Prometheus ---
+def collect_runtime_metrics():
+    """Valeurs lues au moment du scrape (aucun coût sur le chemin des requêtes)."""
+    yield ("rag_admitted_queries", "gauge", "Requêtes admises (en cours ou en attente d'un créneau)",
+           [({}, admitted_queries)])
+    yield ("rag_shards", "gauge", "Shards en service", [({}, len(rag_store.shards))])
+    if query_cache:
+        stats = query_cache.stats()
+        yield ("rag_query_cache_lookups_total", "counter", "Consultations du cache de réponses par résultat", [
+            ({"result": "exact_hit"}, stats["exact_hits"]),
+            ({"result": "semantic_hit"}, stats["semantic_hits"]),
+            ({"result": "miss"}, stats["misses"]),
+        ])
+        yield ("rag_query_cache_entries", "gauge", "Entrées du cache de réponses", [({}, stats["entries"])])
+    if answer_store:
+        yield ("rag_prepared_answer_lookups_total", "counter", "Consultations des réponses préparées", [
+            ({"result": "hit"}, answer_store.hits),
+            ({"result": "miss"}, answer_store.misses),
+        ])
+    stats = rag_store.embeddings.stats()
+    yield ("rag_embedding_cache_lookups_total", "counter", "Consultations du cache d'embeddings de requêtes", [
+        ({"result": "hit"}, stats["hits"]),
+        ({"result": "miss"}, stats["misses"]),
+    ])
+
+REGISTRY.add_collector(collect_runtime_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# --- Statistiques du cache de réponses ---
+@app.get("/cache/stats")
+async def cache_stats_endpoint():
+    stats = {"enabled": False}
+    if query_cache:
+        stats = {"enabled": True, **query_cache.stats()}
+    if answer_store:
+        stats["answer_store"] = {"index_version": rag_store.index_version(), **answer_store.stats()}
+    return stats
+
+startup_timings["import_s"] = round(time.perf_counter() - _import_start, 3)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
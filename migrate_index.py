@@ -0,0 +1,23 @@
+import argparse
+
+from src.config import Config
+from src.vector_store import HybridStore
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convertit un index LangChain picklé (index.pkl) au format sans pickle (ChunkStore + BM25)"
+    )
+    parser.add_argument("path", nargs="?", default=Config.FAISS_INDEX_PATH, help="Dossier de l'index")
+    args = parser.parse_args()
+
+    store = HybridStore(index_path=args.path, reranker=None)
+    if not store.is_legacy_format():
+        raise SystemExit(f"✅ {args.path} est déjà au format sans pickle (ou ne contient pas d'index).")
+    if not store.load_index():
+        raise SystemExit(f"❌ Impossible de charger {args.path}")
+    store.migrate_legacy_format()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import json
+import time
+import argparse
+from collections import defaultdict
+
+import numpy as np
+
+RETRIEVAL_STAGES = ("embed_s", "faiss_s", "bm25_s", "fusion_s", "rerank_s")
+
+
+def replay(args) -> dict:
+    """
+    Rejoue la recherche (sans LLM) des requêtes journalisées par le serveur (QUERY_LOG_ENABLED=1)
+    et compare aux résultats servis : chunks retrouvés (recouvrement, ordre) et durée de la recherche.
+    Les requêtes sont regroupées par (k, filtres) et rejouées par lots (search_batch).
+    """
+    import main
+    from src.answer_store import AnswerStore
+    from src.config import Config
+
+    if not main.rag_store.load():
+        raise SystemExit("❌ Aucun index à interroger.")
+    if args.no_rerank:
+        main.rag_store.reranker = None
+    store = main.answer_store or AnswerStore(Config.ANSWER_STORE_PATH, Config.QUERY_LOG_MAX_ROWS)
+    version = main.rag_store.index_version()
+
+    entries = [entry for entry in store.iter_log(args.limit, args.endpoint) if entry["outcome"] != "error"]
+    if not entries:
+        raise SystemExit("❌ Journal vide : lancez le serveur avec QUERY_LOG_ENABLED=1.")
+    print(f"🔁 Rejeu de {len(entries)} requête(s) sur l'index {version}")
+
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[(entry["k"], entry["scope"])].append(entry)
+
+    overlaps, identical, recorded_ms, replayed_ms = [], 0, [], []
+    stale = sum(entry["index_version"] != version for entry in entries)
+    for (k, scope), group in groups.items():
+        filters = main.QueryFilters.model_validate_json(scope).search_kwargs() if scope else {}
+        for start in range(0, len(group), args.batch_size):
+            batch = group[start:start + args.batch_size]
+            timings = {}
+            results = main.rag_store.search_batch([entry["question"] for entry in batch], k=k, timings=timings, **filters)
+            per_query_ms = sum(timings.values()) * 1000 / len(batch)
+            for entry, docs in zip(batch, results):
+                chunk_ids = [doc.get("global_id") or str(doc.get("chunk_id")) for doc in docs]
+                logged = entry["chunk_ids"]
+                overlaps.append(len(set(chunk_ids) & set(logged)) / max(1, len(logged)))
+                identical += chunk_ids == logged
+                # Requêtes servies par un cache : pas de durée de recherche à comparer
+                spans = [entry["timings"][stage] for stage in RETRIEVAL_STAGES if stage in entry["timings"]]
+                if spans:
+                    recorded_ms.append(sum(spans) * 1000)
+                    replayed_ms.append(per_query_ms)
+
+    report = {
+        "queries": len(entries),
+        "stale_index_version": stale,
+        "mean_overlap": round(float(np.mean(overlaps)), 4),
+        "identical_ranking": round(identical / len(entries), 4),
+    }
+    if recorded_ms:
+        report["retrieval_ms"] = {
+            "recorded_p50": round(float(np.percentile(recorded_ms, 50)), 2),
+            "recorded_p95": round(float(np.percentile(recorded_ms, 95)), 2),
+            "replayed_p50": round(float(np.percentile(replayed_ms, 50)), 2),
+            "replayed_p95": round(float(np.percentile(replayed_ms, 95)), 2),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rejoue hors ligne la recherche des requêtes journalisées")
+    parser.add_argument("--limit", type=int, help="Nombre max de requêtes rejouées (les plus anciennes)")
+    parser.add_argument("--endpoint", help="query, query_stream ou query_batch")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--no-rerank", action="store_true", help="Sans reranker (pas d'appel API)")
+    parser.add_argument("--json", help="Écrit le rapport dans ce fichier")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = replay(args)
+    report["elapsed_s"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
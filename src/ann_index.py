@@ -0,0 +1,120 @@
+import math
+from typing import Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+# Encodage des vecteurs pour flat / ivf_flat / hnsw (ivf_pq a son propre codage).
+# "binary" : 1 bit par dimension (signe par rapport au seuil médian appris), index flat seulement
+STORAGE_CODES = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8", "binary": "LSHt"}
+
+
+def factory_string(index_type: str, storage: str, n_vectors: int, dim: int,
+                   nlist: int, hnsw_m: int, pq_m: int) -> str:
+    """Chaîne faiss.index_factory correspondant au type d'index demandé."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Type d'index inconnu : {index_type} (attendu : {INDEX_TYPES})")
+    if storage not in STORAGE_CODES:
+        raise ValueError(f"Stockage inconnu : {storage} (attendu : {tuple(STORAGE_CODES)})")
+    code = STORAGE_CODES[storage]
+    if storage == "binary" and index_type != "flat":
+        raise ValueError("Stockage binaire disponible uniquement avec l'index flat")
+
+    # nlist ~ 4*sqrt(n), plafonné par la config et par le nombre de points d'entraînement
+    nlist = max(1, min(nlist, int(4 * math.sqrt(n_vectors)), n_vectors))
+
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},{code}"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}" if storage == "float32" else f"HNSW{hnsw_m}_{code}"
+    if index_type == "ivf_pq":
+        # PQ 8 bits : 256 centroïdes par sous-quantifieur, il faut au moins autant de vecteurs
+        if n_vectors < 256 or dim % pq_m:
+            print(f"⚠️ IVF-PQ impossible ({n_vectors} vecteurs, dim {dim}, m={pq_m}) : repli sur IVF-Flat")
+            return f"IVF{nlist},Flat"
+        return f"IVF{nlist},PQ{pq_m}x8"
+    return code
+
+
+def apply_search_params(index: faiss.Index, nprobe: int, ef_search: int):
+    """Paramètres de recherche (non garantis après un rechargement : on les réapplique)."""
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+    hnsw_index = faiss.try_extract_index_hnsw(index) if hasattr(faiss, "try_extract_index_hnsw") else index
+    if hasattr(hnsw_index, "hnsw"):
+        hnsw_index.hnsw.efSearch = ef_search
+
+
+def build_faiss_index(vectors: np.ndarray, index_type: str = "flat", storage: str = "float32",
+                      nlist: int = 1024, nprobe: int = 16, hnsw_m: int = 32,
+                      ef_construction: int = 200, ef_search: int = 64, pq_m: int = 48) -> faiss.Index:
+    """Construit (entraîne si besoin) et remplit un index FAISS L2 pour `vectors` (n, dim) float32."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, dim = vectors.shape
+    spec = factory_string(index_type, storage, n, dim, nlist, hnsw_m, pq_m)
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+
+    if hasattr(index, "hnsw"):
+        index.hnsw.efConstruction = ef_construction
+    if not index.is_trained:
+        index.train(vectors)
+    apply_search_params(index, nprobe, ef_search)
+    index.add(vectors)
+    return index
+
+
+def is_exact(index: faiss.Index) -> bool:
+    """Vrai si l'index compare les vecteurs float32 d'origine : un rescoring n'apporterait rien."""
+    return isinstance(index, (faiss.IndexFlat, faiss.IndexIVFFlat, faiss.IndexHNSWFlat))
+
+
+def rescore(query_vectors: np.ndarray, vectors: np.ndarray, positions: np.ndarray,
+            k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Re-classe les candidats d'un index quantifié (positions renvoyées par index.search) par la
+    distance L2 exacte au carré, comme FAISS, calculée sur les vecteurs float32 (`vectors`, en mmap :
+    seules les lignes candidates sont lues). Renvoie (distances, positions) de forme (nq, k), -1 si vide.
+    """
+    out_distances = np.full((len(positions), k), np.inf, dtype=np.float32)
+    out_positions = np.full((len(positions), k), -1, dtype=np.int64)
+    for row, (query, candidates) in enumerate(zip(query_vectors, positions)):
+        # Positions croissantes : lecture du fichier dans l'ordre
+        candidates = np.unique(candidates[candidates != -1])
+        if not len(candidates):
+            continue
+        diff = np.asarray(vectors[candidates], dtype=np.float32) - query
+        distances = np.einsum("ij,ij->i", diff, diff)
+        best = np.argsort(distances, kind="stable")[:k]
+        out_distances[row, :len(best)] = distances[best]
+        out_positions[row, :len(best)] = candidates[best]
+    return out_distances, out_positions
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    """
+    Seul IndexFlat renumérote les vecteurs après remove_ids, ce que suppose FAISS.delete de LangChain.
+    Pour les autres types, la compaction reconstruit l'index.
+    """
+    return isinstance(index, faiss.IndexFlat)
+
+
+def reconstruct_vectors(index: faiss.Index, positions) -> np.ndarray:
+    """Relit les vecteurs stockés (exacts pour Flat/HNSW/IVF-Flat, approchés si quantifiés)."""
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+    out = np.empty((len(positions), index.d), dtype=np.float32)
+    for i, position in enumerate(positions):
+        out[i] = index.reconstruct(int(position))
+    return out
+
+
+def empty_like(index: faiss.Index) -> faiss.Index:
+    """Copie vide d'un index, en gardant l'entraînement (quantifieur IVF, codebooks PQ)."""
+    fresh = faiss.clone_index(index)
+    fresh.reset()
+    return fresh
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.query_cache import normalize_query
+
+
+class AnswerStore:
+    """
+    Magasin SQLite local à deux usages :
+      - réponses préparées (FAQ) : calculées hors ligne pour des questions connues
+        (data/ground_truth.json, questions fréquentes du journal) et servies telles quelles
+        quand une requête correspond (même question normalisée, même k, mêmes filtres) ;
+      - journal des requêtes servies (question, chunks retrouvés, durées par étape) pour
+        les rejouer hors ligne (voir replay_queries.py).
+    Chaque réponse porte la version de l'index qui l'a produite : une réponse d'une autre
+    version n'est jamais servie, même écrite par un autre processus ou avant un redémarrage.
+    """
+
+    def __init__(self, path: str, log_max_rows: int = 100000):
+        self.path = path
+        self.log_max_rows = log_max_rows
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Écritures différées (journal, compteurs de hits) : faites par lots dans un thread dédié
+        self._write_queue = queue.SimpleQueue()
+        self._writer = None
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # Connexion partagée entre les threads du serveur (protégée par le lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # WAL : les lectures du serveur ne bloquent pas l'outil de pré-calcul qui écrit en parallèle
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, question TEXT NOT NULL, k INTEGER NOT NULL, scope TEXT NOT NULL, "
+            "value TEXT NOT NULL, index_version TEXT NOT NULL, created_at REAL NOT NULL, "
+            "hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_log ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, endpoint TEXT NOT NULL, "
+            "question TEXT NOT NULL, k INTEGER NOT NULL, scope TEXT NOT NULL, index_version TEXT, "
+            "outcome TEXT NOT NULL, chunk_ids TEXT NOT NULL, timings TEXT NOT NULL, total_s REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_log_question ON query_log(question)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(question: str, k: int, scope: str = "") -> str:
+        h = hashlib.sha256()
+        for part in (normalize_query(question), str(k), scope):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    # --- Réponses préparées ---
+    def get(self, question: str, k: int, scope: str, index_version: str) -> Optional[Any]:
+        return self.get_many([(question, k, scope)], index_version)[0]
+
+    def get_many(self, requests: List[tuple], index_version: str) -> List[Optional[Any]]:
+        """
+        Réponses préparées de [(question, k, scope)] (None si absente), en une seule requête SQL.
+        Lecture seule : les compteurs de hits sont incrémentés plus tard, par lots (voir _write_loop).
+        """
+        keys = [self.make_key(question, k, scope) for question, k, scope in requests]
+        if not keys:
+            return []
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            rows = dict(self._conn.execute(
+                f"SELECT key, value FROM answers WHERE index_version = ? AND key IN ({','.join('?' * len(unique))})",
+                (index_version, *unique)
+            ).fetchall())
+            hits = sum(key in rows for key in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        for key in keys:
+            if key in rows:
+                self._enqueue(("hit", key))
+        return [json.loads(rows[key]) if key in rows else None for key in keys]
+
+    def contains(self, question: str, k: int, scope: str, index_version: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM answers WHERE key = ? AND index_version = ?",
+                (self.make_key(question, k, scope), index_version)
+            ).fetchone() is not None
+
+    def put(self, question: str, k: int, scope: str, value: Any, index_version: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, question, k, scope, value, index_version, created_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (self.make_key(question, k, scope), question, k, scope,
+                 json.dumps(value, ensure_ascii=False), index_version, time.time())
+            )
+            self._conn.commit()
+
+    def invalidate(self, index_version: str) -> int:
+        """Supprime les réponses calculées sur une autre version de l'index ; renvoie leur nombre."""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM answers WHERE index_version != ?", (index_version,)
+            ).rowcount
+            self._conn.commit()
+        if deleted:
+            print(f"🧹 {deleted} réponse(s) préparée(s) invalidée(s) (index modifié)")
+        return deleted
+
+    # --- Journal des requêtes ---
+    def record(self, endpoint: str, question: str, k: int, scope: str, index_version: str, outcome: str,
+               chunk_ids: List[str], timings: Dict[str, float], total_s: float):
+        """Non bloquant : l'écriture est faite par lots dans un thread dédié."""
+        self._enqueue(("log", (
+            time.time(), endpoint, question, k, scope, index_version, outcome,
+            json.dumps(chunk_ids), json.dumps({stage: round(s, 6) for stage, s in timings.items()}),
+            round(total_s, 6)
+        )))
+
+    def _enqueue(self, item: tuple):
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="answer-store-writer", daemon=True)
+                    self._writer.start()
+        self._write_queue.put(item)
+
+    def _write_loop(self):
+        while True:
+            items = [self._write_queue.get()]
+            while len(items) < 500:
+                try:
+                    items.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [payload for kind, payload in items if kind == "log"]
+            hits = [(payload,) for kind, payload in items if kind == "hit"]
+            with self._lock:
+                if hits:
+                    self._conn.executemany("UPDATE answers SET hits = hits + 1 WHERE key = ?", hits)
+                if rows:
+                    self._conn.executemany(
+                        "INSERT INTO query_log (ts, endpoint, question, k, scope, index_version, outcome, "
+                        "chunk_ids, timings, total_s) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                    )
+                    # Journal borné : on garde les `log_max_rows` requêtes les plus récentes
+                    self._conn.execute(
+                        "DELETE FROM query_log WHERE id <= (SELECT MAX(id) FROM query_log) - ?", (self.log_max_rows,)
+                    )
+                self._conn.commit()
+
+    def iter_log(self, limit: int = None, endpoint: str = None) -> Iterator[dict]:
+        """Requêtes journalisées, des plus anciennes aux plus récentes."""
+        sql = "SELECT ts, endpoint, question, k, scope, index_version, outcome, chunk_ids, timings, total_s FROM query_log"
+        params = []
+        if endpoint:
+            sql += " WHERE endpoint = ?"
+            params.append(endpoint)
+        sql += " ORDER BY id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        for ts, endpoint, question, k, scope, version, outcome, chunk_ids, timings, total_s in rows:
+            yield {
+                "ts": ts, "endpoint": endpoint, "question": question, "k": k, "scope": scope,
+                "index_version": version, "outcome": outcome, "chunk_ids": json.loads(chunk_ids),
+                "timings": json.loads(timings), "total_s": total_s,
+            }
+
+    def hot_questions(self, limit: int) -> List[dict]:
+        """Questions les plus fréquentes du journal (sans filtres), candidates au pré-calcul."""
+        counts = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT question, k FROM query_log WHERE scope = ''").fetchall()
+        for question, k in rows:
+            key = (normalize_query(question), k)
+            entry = counts.setdefault(key, {"question": question, "k": k, "count": 0})
+            entry["count"] += 1
+        return sorted(counts.values(), key=lambda entry: -entry["count"])[:limit]
+
+    def stats(self) -> dict:
+        with self._lock:
+            answers = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            logged = self._conn.execute("SELECT COUNT(*) FROM query_log").fetchone()[0]
+        return {"answers": answers, "hits": self.hits, "misses": self.misses, "logged_queries": logged}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
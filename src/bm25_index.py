@@ -0,0 +1,220 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Index BM25 compact et persistable (remplace BM25Retriever, qui ne se sauvegarde pas).
+    Stockage sur disque à côté de FAISS :
+      - bm25.json       : vocabulaire, clés des chunks, paramètres
+      - indptr.npy      : début des postings de chaque terme (format CSR)
+      - doc_ids.npy     : postings (index des documents)
+      - tfs.npy         : fréquence du terme dans chaque document
+      - doc_lens.npy    : longueur de chaque document
+      - idf.npy         : IDF de chaque terme
+    Les tableaux sont rechargés en mmap : le démarrage ne coûte que la lecture du vocabulaire.
+    """
+
+    ARRAYS = ("indptr", "doc_ids", "tfs", "doc_lens", "idf")
+
+    def __init__(self, vocabulary: dict, keys: List[str], indptr, doc_ids, tfs, doc_lens, idf,
+                 k1: float = 1.5, b: float = 0.75):
+        self.vocabulary = vocabulary
+        self.keys = keys
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_lens.mean()) if len(doc_lens) else 0.0
+
+    @classmethod
+    def build(cls, texts: List[str], keys: List[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        postings = {}
+        doc_lens = np.zeros(len(texts), dtype=np.float32)
+        for doc_idx, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lens[doc_idx] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((doc_idx, tf))
+
+        terms = sorted(postings)
+        vocabulary = {term: i for i, term in enumerate(terms)}
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            indptr[i + 1] = indptr[i] + len(postings[term])
+
+        doc_ids = np.empty(indptr[-1], dtype=np.int32)
+        tfs = np.empty(indptr[-1], dtype=np.float32)
+        for i, term in enumerate(terms):
+            entries = np.asarray(postings[term], dtype=np.int64)
+            doc_ids[indptr[i]:indptr[i + 1]] = entries[:, 0]
+            tfs[indptr[i]:indptr[i + 1]] = entries[:, 1]
+
+        # IDF "Lucene" : toujours positive, même pour les termes très fréquents
+        n_docs = len(texts)
+        df = np.diff(indptr).astype(np.float32)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        return cls(vocabulary, list(keys), indptr, doc_ids, tfs, doc_lens, idf, k1=k1, b=b)
+
+    def save(self, folder: str):
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        # Écriture dans un fichier temporaire puis os.replace : un index déjà chargé en mmap
+        # garde l'ancien fichier au lieu de lire un fichier tronqué
+        for name in self.ARRAYS:
+            path = os.path.join(folder, f"{name}.npy")
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, np.ascontiguousarray(getattr(self, name)))
+            os.replace(path + ".tmp", path)
+        terms = [None] * len(self.vocabulary)
+        for term, i in self.vocabulary.items():
+            terms[i] = term
+        path = os.path.join(folder, "bm25.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump({"terms": terms, "keys": self.keys, "k1": self.k1, "b": self.b}, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, folder: str) -> "BM25Index":
+        with open(os.path.join(folder, "bm25.json"), "r") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")
+            for name in cls.ARRAYS
+        }
+        vocabulary = {term: i for i, term in enumerate(meta["terms"])}
+        return cls(vocabulary, meta["keys"], k1=meta["k1"], b=meta["b"], **arrays)
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, "bm25.json"))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_scores(self, query: str) -> np.ndarray:
+        """Scores BM25 de tous les documents (une passe NumPy par terme de la requête)."""
+        scores = np.zeros(len(self.keys), dtype=np.float32)
+        if not len(self.keys):
+            return scores
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lens[docs] / self.avgdl)
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def document_frequency(self, term: str) -> int:
+        term_id = self.vocabulary.get(term)
+        return 0 if term_id is None else int(self.indptr[term_id + 1] - self.indptr[term_id])
+
+    def get_scores_batch(self, queries: List[str], idf: Dict[str, float] = None,
+                         avgdl: float = None) -> np.ndarray:
+        """
+        Matrice (requêtes, documents) des scores BM25. La contribution de chaque terme n'est
+        calculée qu'une fois, puis ajoutée aux lignes de toutes les requêtes qui le contiennent.
+        `idf` ({terme: idf}) et `avgdl` remplacent les statistiques propres à l'index (voir search_segments).
+        """
+        scores = np.zeros((len(queries), len(self.keys)), dtype=np.float32)
+        if not len(self.keys):
+            return scores
+        avgdl = avgdl or self.avgdl
+        rows_by_term = {}
+        for row, query in enumerate(queries):
+            for term in set(tokenize(query)):
+                term_id = self.vocabulary.get(term)
+                if term_id is not None:
+                    rows_by_term.setdefault(term, []).append(row)
+        for term, rows in rows_by_term.items():
+            term_id = self.vocabulary[term]
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lens[docs] / avgdl)
+            weight = self.idf[term_id] if idf is None else idf[term]
+            contribution = weight * tf * (self.k1 + 1) / (tf + norm)
+            scores[np.ix_(rows, docs)] += contribution
+        return scores
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top-k (clé du chunk, score), scores nuls exclus."""
+        return self._top_k(self.get_scores(query), k)
+
+    def search_batch(self, queries: List[str], k: int, block_size: int = 64, idf: Dict[str, float] = None,
+                     avgdl: float = None) -> List[List[Tuple[str, float]]]:
+        """search() pour plusieurs requêtes ; la matrice des scores est calculée par blocs de requêtes."""
+        results = []
+        for begin in range(0, len(queries), block_size):
+            scores = self.get_scores_batch(queries[begin:begin + block_size], idf, avgdl)
+            results += [self._top_k(row, k) for row in scores]
+        return results
+
+    def _top_k(self, scores: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.keys[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+def segment_statistics(segments: List[BM25Index], queries: List[str]) -> Tuple[Dict[str, float], float]:
+    """
+    (IDF des termes des requêtes, longueur moyenne des documents) calculées sur l'ensemble des
+    segments, comme si un seul index les contenait tous (voir search_segments).
+    """
+    segments = [segment for segment in segments if segment is not None and len(segment)]
+    n_docs = sum(len(segment) for segment in segments)
+    if not n_docs:
+        return {}, 0.0
+    avgdl = sum(segment.avgdl * len(segment) for segment in segments) / n_docs
+    terms = {term for query in queries for term in tokenize(query)}
+    df = {term: sum(segment.document_frequency(term) for segment in segments) for term in terms}
+    # IDF "Lucene", calculée comme dans BM25Index.build
+    idf = {term: float(np.float32(np.log1p((n_docs - n + 0.5) / (n + 0.5)))) for term, n in df.items() if n}
+    return idf, float(avgdl)
+
+
+def search_segments(segments: List[BM25Index], queries: List[str], k: int, block_size: int = 64,
+                    stats: Tuple[Dict[str, float], float] = None) -> List[List[Tuple[str, float]]]:
+    """
+    search_batch() sur plusieurs segments (index de base + delta des chunks ajoutés depuis la
+    dernière compaction) avec des statistiques communes (nombre de documents, df, longueur
+    moyenne) : mêmes scores qu'un index unique construit sur l'ensemble des segments.
+    `stats` : statistiques déjà calculées sur un ensemble plus large (tous les shards d'un corpus).
+    """
+    segments = [segment for segment in segments if segment is not None and len(segment)]
+    if not segments:
+        return [[] for _ in queries]
+    if len(segments) == 1 and stats is None:
+        return segments[0].search_batch(queries, k, block_size)
+
+    idf, avgdl = stats or segment_statistics(segments, queries)
+    per_segment = [segment.search_batch(queries, k, block_size, idf, avgdl) for segment in segments]
+    results = []
+    for hits in zip(*per_segment):
+        best = {}
+        for key, score in (hit for segment_hits in hits for hit in segment_hits):
+            # Une clé présente dans deux segments (compaction interrompue) : on garde un score
+            best[key] = max(score, best.get(key, score))
+        results.append(sorted(best.items(), key=lambda hit: -hit[1])[:k])
+    return results
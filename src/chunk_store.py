@@ -0,0 +1,225 @@
+import json
+import os
+from collections.abc import Mapping, MutableMapping
+from typing import Iterable, Iterator, Tuple
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+
+class ChunkStore(MutableMapping):
+    """
+    Docstore des chunks sans pickle, en colonnes rechargées en mmap (remplace index.pkl) :
+      - keys.npy          : clés des chunks (octets, largeur fixe), dans l'ordre des positions FAISS
+      - key_order.npy     : permutation qui trie les clés (recherche dichotomique clé -> position)
+      - texts.bin         : textes UTF-8 concaténés
+      - text_offsets.npy  : début de chaque texte (n + 1 entrées)
+      - meta.bin          : métadonnées JSON concaténées
+      - meta_offsets.npy  : début de chaque entrée de métadonnées (n + 1 entrées)
+      - vectors.npy       : vecteurs float32 (optionnel, index quantifié : voir ann_index.rescore)
+      - chunks.json       : nombre de chunks, écrit en dernier
+    Aucun objet Python par chunk (ni dict clé -> position, ni liste de clés) : plusieurs processus
+    qui chargent le même dossier partagent ces pages dans le page cache.
+    Les Document sont décodés à la demande. Ajouts et suppressions restent dans une surcouche
+    en mémoire jusqu'à la prochaine écriture (voir HybridStore._save).
+    """
+
+    __slots__ = ("_keys", "_order", "_texts", "_text_offsets", "_metas", "_meta_offsets",
+                 "vectors", "_overlay", "_deleted")
+
+    KEYS_FILE = "chunks.json"
+
+    def __init__(self, keys=None, texts=None, text_offsets=None, metas=None, meta_offsets=None,
+                 order=None, vectors=None):
+        # `keys` : tableau d'octets (chargé en mmap) ou liste de str (ancien chunks.json)
+        self._keys = keys if isinstance(keys, np.ndarray) else _encode_keys(keys or [])
+        self._order = order if order is not None else np.argsort(self._keys, kind="stable")
+        self._texts = texts
+        self._text_offsets = text_offsets
+        self._metas = metas
+        self._meta_offsets = meta_offsets
+        self.vectors = vectors
+        self._overlay = {}
+        self._deleted = set()
+
+    @staticmethod
+    def exists(folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, ChunkStore.KEYS_FILE))
+
+    @classmethod
+    def load(cls, folder: str) -> "ChunkStore":
+        with open(os.path.join(folder, cls.KEYS_FILE), "r") as f:
+            header = json.load(f)
+        vectors_path = os.path.join(folder, "vectors.npy")
+        if "keys" in header:
+            # Premier format : clés en JSON, sans vecteurs
+            keys, order, vectors = header["keys"], None, None
+        else:
+            keys = np.load(os.path.join(folder, "keys.npy"), mmap_mode="r")
+            order = np.load(os.path.join(folder, "key_order.npy"), mmap_mode="r")
+            vectors = np.load(vectors_path, mmap_mode="r") if header.get("vectors") else None
+        return cls(
+            keys,
+            texts=_map_bytes(os.path.join(folder, "texts.bin")),
+            text_offsets=np.load(os.path.join(folder, "text_offsets.npy"), mmap_mode="r"),
+            metas=_map_bytes(os.path.join(folder, "meta.bin")),
+            meta_offsets=np.load(os.path.join(folder, "meta_offsets.npy"), mmap_mode="r"),
+            order=order,
+            vectors=vectors,
+        )
+
+    @classmethod
+    def write(cls, folder: str, items: Iterable[Tuple[str, Document]], vectors: np.ndarray = None):
+        """
+        Écrit les chunks dans l'ordre donné (fichiers temporaires puis os.replace).
+        `vectors` : vecteurs float32 alignés sur `items`, conservés pour le rescoring.
+        """
+        keys, texts, metas = [], [], []
+        for key, doc in items:
+            keys.append(key)
+            texts.append(doc.page_content.encode("utf-8"))
+            metas.append(json.dumps(doc.metadata, ensure_ascii=False, default=str).encode("utf-8"))
+        encoded_keys = _encode_keys(keys)
+
+        def offsets(blobs):
+            out = np.zeros(len(blobs) + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in blobs], out=out[1:])
+            return out
+
+        files = {
+            "keys.npy": lambda f: np.save(f, encoded_keys),
+            "key_order.npy": lambda f: np.save(f, np.argsort(encoded_keys, kind="stable")),
+            "texts.bin": lambda f: f.write(b"".join(texts)),
+            "text_offsets.npy": lambda f: np.save(f, offsets(texts)),
+            "meta.bin": lambda f: f.write(b"".join(metas)),
+            "meta_offsets.npy": lambda f: np.save(f, offsets(metas)),
+        }
+        if vectors is not None:
+            files["vectors.npy"] = lambda f: np.save(f, np.ascontiguousarray(vectors, dtype=np.float32))
+        for name, dump in files.items():
+            path = os.path.join(folder, name)
+            with open(path + ".tmp", "wb") as f:
+                dump(f)
+            os.replace(path + ".tmp", path)
+        if vectors is None and os.path.exists(os.path.join(folder, "vectors.npy")):
+            os.remove(os.path.join(folder, "vectors.npy"))
+        # L'en-tête en dernier : sa présence signale un store complet
+        path = os.path.join(folder, cls.KEYS_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"count": len(keys), "vectors": vectors is not None}, f)
+        os.replace(path + ".tmp", path)
+
+    def _position(self, key: str) -> int:
+        """Position de `key` dans les colonnes (-1 si absente), par dichotomie sur key_order."""
+        if not len(self._keys):
+            return -1
+        encoded = key.encode("utf-8")
+        i = int(np.searchsorted(self._keys, encoded, sorter=self._order))
+        if i < len(self._order):
+            position = int(self._order[i])
+            if self._keys[position] == encoded:
+                return position
+        return -1
+
+    def key_at(self, position: int) -> str:
+        return self._keys[position].decode("utf-8")
+
+    def position_keys(self) -> "PositionKeys":
+        """Vue position FAISS -> clé (index_to_docstore_id de LangChain) sur les colonnes."""
+        return PositionKeys(self)
+
+    def _decode(self, position: int) -> Document:
+        start, end = int(self._text_offsets[position]), int(self._text_offsets[position + 1])
+        text = bytes(self._texts[start:end]).decode("utf-8")
+        start, end = int(self._meta_offsets[position]), int(self._meta_offsets[position + 1])
+        metadata = json.loads(bytes(self._metas[start:end]).decode("utf-8"))
+        return Document(page_content=text, metadata=metadata)
+
+    # --- Interface dict (utilisée par InMemoryDocstore de LangChain) ---
+    def __getitem__(self, key: str) -> Document:
+        if key in self._overlay:
+            return self._overlay[key]
+        position = -1 if key in self._deleted else self._position(key)
+        if position < 0:
+            raise KeyError(key)
+        return self._decode(position)
+
+    def __setitem__(self, key: str, doc: Document):
+        self._overlay[key] = doc
+        self._deleted.discard(key)
+
+    def __delitem__(self, key: str):
+        if key not in self:
+            raise KeyError(key)
+        self._overlay.pop(key, None)
+        if self._position(key) >= 0:
+            self._deleted.add(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._overlay or (key not in self._deleted and self._position(key) >= 0)
+
+    def __iter__(self) -> Iterator[str]:
+        for start in range(0, len(self._keys), 4096):
+            for raw in self._keys[start:start + 4096].tolist():
+                key = raw.decode("utf-8")
+                if key not in self._deleted:
+                    yield key
+        yield from [key for key in self._overlay if self._position(key) < 0]
+
+    def __len__(self) -> int:
+        return len(self._keys) - len(self._deleted) + sum(1 for key in self._overlay if self._position(key) < 0)
+
+
+class PositionKeys(Mapping):
+    """
+    index_to_docstore_id de LangChain lu dans les colonnes d'un ChunkStore chargé (positions
+    0..n-1 = ordre d'écriture) ; seules les positions ajoutées ensuite sont tenues dans un dict.
+    """
+
+    __slots__ = ("_store", "_added")
+
+    def __init__(self, store: ChunkStore):
+        self._store = store
+        self._added = {}
+
+    def __getitem__(self, position: int) -> str:
+        if position in self._added:
+            return self._added[position]
+        if 0 <= position < len(self._store._keys):
+            return self._store.key_at(position)
+        raise KeyError(position)
+
+    def update(self, positions: dict):
+        # Seule écriture faite par FAISS.add_embeddings (FAISS.delete remplace la vue par un dict)
+        self._added.update(positions)
+
+    def __iter__(self) -> Iterator[int]:
+        yield from range(len(self._store._keys))
+        yield from self._added
+
+    def __len__(self) -> int:
+        return len(self._store._keys) + len(self._added)
+
+
+class ChunkDocstore(InMemoryDocstore):
+    """InMemoryDocstore dont add() complète le store sur place (l'original recopie tout dans un dict)."""
+
+    def add(self, texts):
+        overlapping = [key for key in texts if key in self._dict]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._dict.update(texts)
+
+
+def _map_bytes(path: str):
+    # np.memmap refuse les fichiers vides (store sans chunk)
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def _encode_keys(keys) -> np.ndarray:
+    """Clés en octets de largeur fixe (les clés sont des hachages hexadécimaux : ASCII, sans NUL)."""
+    encoded = [key.encode("utf-8") for key in keys]
+    return np.array(encoded, dtype=f"S{max(1, max(map(len, encoded), default=1))}")
@@ -19,4 +19,155 @@ class Config:
     FAISS_INDEX_PATH = "data/faiss_index" # Dossier où l'index sera stocké
     INDEX_METADATA_FILE = "data/faiss_index/metadata.json"
     VECTOR_DB_PATH = "data/chroma_db"
-    COLLECTION_NAME = "research_paper_cohere"
\ No newline at end of file
+    COLLECTION_NAME = "research_paper_cohere"
+
+    # --- Contextualisation (ingestion) ---
+    # Nombre d'appels LLM simultanés pendant la génération des contextes
+    CONTEXTUAL_CONCURRENCY = int(os.getenv("CONTEXTUAL_CONCURRENCY", 8))
+    # Budgets de l'API Cohere (une clé trial est limitée à ~20 appels chat/minute)
+    COHERE_REQUESTS_PER_MINUTE = float(os.getenv("COHERE_REQUESTS_PER_MINUTE", 20))
+    COHERE_TOKENS_PER_MINUTE = float(os.getenv("COHERE_TOKENS_PER_MINUTE", 100000))
+    # Réessais sur erreur 429 (backoff exponentiel avec jitter)
+    LLM_MAX_RETRIES = 5
+    LLM_BACKOFF_BASE_SECONDS = 1.0
+    LLM_BACKOFF_MAX_SECONDS = 30.0
+
+    # Cache disque des contextes générés (évite de repayer le LLM à chaque ré-ingestion)
+    CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "1") == "1"
+    CONTEXT_CACHE_PATH = "data/cache/contexts.sqlite"
+    CONTEXT_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+    # --- Serveur de requêtes ---
+    # Threads dédiés aux étapes CPU de la recherche (embedding, FAISS, BM25)
+    QUERY_EXECUTOR_WORKERS = int(os.getenv("QUERY_EXECUTOR_WORKERS", 8))
+    # Requêtes traitées simultanément (recherche + LLM)
+    MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", 16))
+    # Requêtes en attente au-delà desquelles on répond 429 (backpressure)
+    MAX_QUEUED_QUERIES = int(os.getenv("MAX_QUEUED_QUERIES", 64))
+
+    # /query/batch : taille maximale d'un lot et appels LLM (et reranker) simultanés par lot
+    BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", 256))
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+
+    # Cache des réponses (exact + sémantique) devant la recherche et le LLM
+    QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "1") == "1"
+    QUERY_CACHE_MAX_ENTRIES = 1024
+    QUERY_CACHE_TTL_SECONDS = 3600
+    # Cosinus minimal entre deux requêtes pour réutiliser une réponse (prudent : 0.95)
+    QUERY_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("QUERY_CACHE_SIMILARITY_THRESHOLD", 0.95))
+
+    # Contexte envoyé au LLM : doublons retirés, phrases utiles seulement, dans un budget de tokens
+    CONTEXT_PACKING_ENABLED = os.getenv("CONTEXT_PACKING_ENABLED", "1") == "1"
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1000))
+    CONTEXT_MAX_SENTENCES_PER_CHUNK = int(os.getenv("CONTEXT_MAX_SENTENCES_PER_CHUNK", 4))
+    # Part d'un chunk déjà présente dans un chunk mieux classé au-delà de laquelle on l'écarte
+    CONTEXT_DEDUP_THRESHOLD = 0.8
+
+    # Réponses préparées (FAQ, voir warm_answers.py) et journal des requêtes pour rejeu hors ligne
+    ANSWER_STORE_ENABLED = os.getenv("ANSWER_STORE_ENABLED", "1") == "1"
+    ANSWER_STORE_PATH = "data/cache/answers.sqlite"
+    QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "0") == "1"
+    QUERY_LOG_MAX_ROWS = 100000
+
+    # Traces des requêtes (durée de chaque étape) : histogrammes toujours, journal échantillonné
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+    # Au-delà, la trace est journalisée quel que soit l'échantillonnage
+    TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", 5.0))
+
+    # --- Service d'embedding ---
+    EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+    EMBEDDING_BATCH_SIZE = 32
+    # Fenêtre de regroupement des requêtes concurrentes en un seul batch
+    EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", 5))
+    EMBEDDING_CACHE_SIZE = 4096
+    # Threads intra-op de torch (0 = valeur par défaut de torch)
+    EMBEDDING_NUM_THREADS = int(os.getenv("EMBEDDING_NUM_THREADS", 0))
+    # all-MiniLM-L6-v2 sort déjà des vecteurs unitaires : L2 et cosinus donnent le même classement
+    EMBEDDING_NORMALIZE = True
+
+    # --- Reranking ---
+    # "cohere" (API), "cross-encoder" (local CPU) ou "none"
+    RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "cohere")
+    COHERE_RERANK_MODEL = "rerank-english-v3.0"
+    CROSS_ENCODER_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    # "torch" ou "onnx" ; quantification int8 dynamique possible avec torch
+    CROSS_ENCODER_BACKEND = os.getenv("CROSS_ENCODER_BACKEND", "torch")
+    CROSS_ENCODER_QUANTIZE = os.getenv("CROSS_ENCODER_QUANTIZE", "0") == "1"
+    RERANK_BATCH_SIZE = 16
+    # Nombre max de candidats envoyés au cross-encoder
+    RERANK_MAX_CANDIDATES = 20
+
+    # --- Fusion FAISS + BM25 ---
+    # "rrf" (Reciprocal Rank Fusion) ou "weighted" (scores normalisés min-max)
+    FUSION_METHOD = os.getenv("FUSION_METHOD", "rrf")
+    FUSION_VECTOR_WEIGHT = float(os.getenv("FUSION_VECTOR_WEIGHT", 1.0))
+    FUSION_BM25_WEIGHT = float(os.getenv("FUSION_BM25_WEIGHT", 1.0))
+    RRF_K = 60
+
+    # --- Index vectoriel FAISS ---
+    # "flat" (exact), "ivf_flat", "hnsw" ou "ivf_pq"
+    FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+    # Stockage des vecteurs pour flat / ivf_flat / hnsw : "float32", "float16", "int8"
+    # ou "binary" (flat seulement : 1 bit par dimension, 32x moins de mémoire que float32).
+    # int8 + rescoring : index 4x plus petit, même recall@k que float32 (voir tune_index.py)
+    FAISS_STORAGE = os.getenv("FAISS_STORAGE", "int8")
+    # Index quantifié : FAISS renvoie `facteur * k` candidats, re-classés avec les vecteurs float32
+    # gardés sur disque (mmap, hors mémoire des workers) ; 0 = pas de rescoring
+    FAISS_RESCORE_FACTOR = int(os.getenv("FAISS_RESCORE_FACTOR", 4))
+    FAISS_IVF_NLIST = 1024  # plafonné automatiquement à ~4*sqrt(n)
+    FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", 16))
+    FAISS_HNSW_M = 32
+    FAISS_HNSW_EF_CONSTRUCTION = 200
+    FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", 64))
+    FAISS_PQ_M = 48  # doit diviser la dimension (384 pour all-MiniLM-L6-v2)
+
+    # --- Recherche hiérarchique (sections -> fenêtres de phrases -> chunk parent) ---
+    # Construite à l'ingestion ; à la recherche, remplace FAISS pour les shards qui l'ont.
+    # Désactivée par défaut : à activer après mesure sur le corpus (benchmark.py)
+    HIERARCHICAL_RETRIEVAL = os.getenv("HIERARCHICAL_RETRIEVAL", "0") == "1"
+    # Sections retenues par la passe grossière : la passe fine ne compare que leurs phrases
+    HIERARCHY_SECTIONS = int(os.getenv("HIERARCHY_SECTIONS", 3))
+    # Chunks au plus par section (les sections plus longues sont découpées)
+    HIERARCHY_MAX_SECTION_CHUNKS = 8
+    # Phrases de part et d'autre de la phrase centrale d'une fenêtre
+    HIERARCHY_SENTENCE_WINDOW = 1
+
+    # --- Corpus multi-documents ---
+    # Dossier scanné à l'ingestion (tous les PDF qu'il contient)
+    CORPUS_SOURCE_DIR = os.getenv("CORPUS_SOURCE_DIR", "data")
+    # Un shard (FAISS + BM25) par document sous ce dossier
+    CORPUS_PATH = "data/corpus"
+    SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", 4))
+    # Facteur de sur-échantillonnage quand un filtre de pages est actif
+    FILTER_OVERFETCH = 4
+    # Début du document passé comme contexte global à la contextualisation
+    GLOBAL_CONTEXT_CHARS = 2000
+
+    # --- Pipeline d'ingestion en flux ---
+    # Processus de découpage des pages (0 = découpage dans le processus courant)
+    INGEST_SPLIT_WORKERS = int(os.getenv("INGEST_SPLIT_WORKERS", 2))
+    # Taille des files entre étapes : borne la mémoire quelle que soit la taille du PDF
+    INGEST_QUEUE_SIZE = 64
+    # Chunks contextualisés embeddés par batch pendant que la contextualisation continue
+    INGEST_EMBED_BATCH = 32
+    # Compaction (purge des tombstones, BM25 de base reconstruit, index réécrit en entier) déclenchée
+    # seulement au-delà de ces seuils ; en dessous, un upsert ne persiste que le journal d'ajouts
+    COMPACTION_TOMBSTONE_RATIO = float(os.getenv("COMPACTION_TOMBSTONE_RATIO", 0.2))
+    COMPACTION_DELTA_RATIO = float(os.getenv("COMPACTION_DELTA_RATIO", 0.2))
+    # Borne absolue du segment BM25 delta (reconstruit à chaque upsert)
+    COMPACTION_MAX_DELTA_CHUNKS = int(os.getenv("COMPACTION_MAX_DELTA_CHUNKS", 20000))
+
+    # --- Jobs d'ingestion (processus séparé, API /admin/jobs) ---
+    # Jobs terminés conservés pour consultation
+    INGEST_JOB_HISTORY = 50
+    # Si défini, les endpoints /admin exigent l'en-tête X-Admin-Key
+    ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
+    # --- Démarrage à froid ---
+    # Chargement des modèles (embedding, reranker, LLM) : "lazy" (premier usage),
+    # "background" (thread lancé au démarrage, le serveur répond déjà) ou "eager" (bloquant)
+    MODEL_LOADING = os.getenv("MODEL_LOADING", "background")
+    # Index FAISS des shards figés lus en mmap (partagés entre workers uvicorn via le page cache)
+    FAISS_MMAP = os.getenv("FAISS_MMAP", "1") == "1"
+    # Workers uvicorn qui ne mènent pas l'ingestion : intervalle de relecture du manifeste du corpus
+    CORPUS_REFRESH_SECONDS = float(os.getenv("CORPUS_REFRESH_SECONDS", 5))
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class ContextCache:
+    """
+    Cache disque (SQLite) des contextes générés par le LLM.
+    La clé est un hash du contexte global, du texte du chunk, du template de prompt et du modèle :
+    ré-indexer un document inchangé ne coûte aucun appel LLM.
+    Éviction LRU dès que la taille totale dépasse `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # Connexion partagée entre les threads de contextualisation (protégée par le lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS contexts ("
+            "key TEXT PRIMARY KEY, context TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON contexts(last_access)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM contexts").fetchone()[0]
+
+    @staticmethod
+    def make_key(global_context: str, chunk_text: str, prompt_template: str, model_name: str) -> str:
+        h = hashlib.sha256()
+        for part in (model_name, prompt_template, global_context, chunk_text):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")  # séparateur : évite les collisions par concaténation
+        return h.hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT context FROM contexts WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE contexts SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, context: str):
+        size = len(context.encode("utf-8"))
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM contexts WHERE key = ?", (key,)).fetchone()
+            if previous:
+                self.total_bytes -= previous[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO contexts (key, context, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, context, size, time.time())
+            )
+            self.total_bytes += size
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Supprime les entrées les moins récemment utilisées jusqu'à repasser sous la limite."""
+        while self.total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM contexts ORDER BY last_access ASC LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for key, size in rows:
+                self._conn.execute("DELETE FROM contexts WHERE key = ?", (key,))
+                self.total_bytes -= size
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM contexts").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": self.total_bytes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,114 @@
+import math
+import re
+from collections import Counter
+from typing import List, Optional, Tuple
+
+from src.bm25_index import tokenize
+from src.rate_limiter import estimate_tokens
+
+# Fin de phrase suivie d'un blanc, ou paragraphe (le contexte généré est séparé du chunk par une ligne vide)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [part.strip() for part in _SENTENCE_RE.split(text) if part and part.strip()]
+
+
+def _shingles(tokens: List[str], n: int = 3) -> set:
+    if len(tokens) < n:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1)}
+
+
+def _containment(a: set, b: set) -> float:
+    """Part du plus petit ensemble contenue dans l'autre (un chunk inclus dans un autre = 1.0)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def pack_context(question: str, passages: List[str], token_budget: int, max_sentences: int = 4,
+                 dedup_threshold: float = 0.8, anchors: List[Optional[str]] = None) -> List[Tuple[int, str]]:
+    """
+    Assemble le contexte envoyé au LLM dans un budget de tokens :
+      1. retire les passages quasi identiques à un passage mieux classé (chevauchement du découpage) ;
+      2. découpe en phrases, ignore les phrases déjà vues (zone de recouvrement de 200 caractères) ;
+      3. note chaque phrase par les termes de la question qu'elle contient (pondérés par leur rareté
+         parmi les phrases candidates) et garde au plus `max_sentences` phrases par passage ;
+      4. remplit le budget : la meilleure phrase de chaque passage d'abord (dans l'ordre du classement),
+         puis les autres par score décroissant.
+    `anchors` (optionnel, un par passage) : extrait qui a fait retenir le passage (fenêtre de phrases
+    de la recherche hiérarchique) ; ses phrases passent avant les autres, même sans terme commun.
+    Renvoie [(indice du passage d'origine, texte compressé)] dans l'ordre du classement : les
+    numéros de source restent ceux des passages reçus.
+    """
+    # Chaque phrase n'est tokenisée qu'une fois (doublons et score)
+    split = [[(sentence, tokenize(sentence)) for sentence in split_sentences(text)] for text in passages]
+
+    # 1. Quasi-doublons
+    kept, kept_shingles = [], []
+    for index, passage in enumerate(split):
+        shingles = _shingles([token for _, tokens in passage for token in tokens])
+        if any(_containment(shingles, other) >= dedup_threshold for other in kept_shingles):
+            continue
+        kept.append(index)
+        kept_shingles.append(shingles)
+
+    # 2. Phrases, sans répéter celles d'un passage précédent
+    seen = set()
+    sentences = []  # (passage, position, texte, termes)
+    for index in kept:
+        for position, (sentence, tokens) in enumerate(split[index]):
+            key = " ".join(tokens)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            sentences.append((index, position, sentence, set(tokens)))
+    if not sentences:
+        return []
+
+    # 3. Score lexical : termes de la question présents dans la phrase, pondérés par IDF
+    query_terms = set(tokenize(question))
+    document_frequency = Counter(term for *_, terms in sentences for term in terms & query_terms)
+    idf = {term: math.log(1 + len(sentences) / df) for term, df in document_frequency.items()}
+    # Bonus d'ancre supérieur à tout score lexical possible
+    anchor_bonus = sum(idf.values()) + 1.0
+    by_passage = {}
+    for index, position, sentence, terms in sentences:
+        score = sum(idf.get(term, 0.0) for term in terms & query_terms)
+        if anchors and anchors[index] and sentence in anchors[index]:
+            score += anchor_bonus
+        by_passage.setdefault(index, []).append((score, position, sentence))
+    for index, scored in by_passage.items():
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        del scored[max_sentences:]
+
+    # 4. Remplissage du budget
+    selected = {index: [] for index in by_passage}
+    remaining = token_budget
+
+    def take(index, item) -> bool:
+        nonlocal remaining
+        cost = estimate_tokens(item[2])
+        if cost > remaining:
+            return False
+        selected[index].append(item)
+        remaining -= cost
+        return True
+
+    leftovers = []
+    for index in kept:
+        if index not in by_passage:
+            continue
+        best, *rest = by_passage[index]
+        take(index, best)
+        leftovers += [(index, item) for item in rest if item[0] > 0]
+    for index, item in sorted(leftovers, key=lambda entry: -entry[1][0]):
+        take(index, item)
+
+    packed = []
+    for index in kept:
+        if selected.get(index):
+            # Phrases remises dans leur ordre d'origine
+            packed.append((index, " ".join(sentence for _, _, sentence in sorted(selected[index], key=lambda item: item[1]))))
+    return packed
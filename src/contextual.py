@@ -1,73 +1,120 @@
-import time  # <--- N'oubliez pas l'import
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List
 from langchain_core.documents import Document
 from langchain_community.document_loaders import PyPDFLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from src.config import Config
+from src.context_cache import ContextCache
 from src.models import ModelFactory
+from src.rate_limiter import RateLimiter, call_with_backoff, estimate_tokens
+from src.splitting import make_splitter
+from src.telemetry import CONTEXTUALIZE_FALLBACKS, STAGE_SECONDS
+
+CONTEXT_PROMPT_TEMPLATE = (
+    "<document_context>{global_context}</document_context>\n"
+    "<chunk>{chunk}</chunk>\n"
+    "Please give a short concise context to situate this chunk within the overall document for the purposes of improving search retrieval of the chunk. Answer only with the succinct context."
+)
+# Réserve de tokens de sortie comptée dans le budget tokens/minute
+CONTEXT_OUTPUT_TOKENS = 100
 
 class ContextualProcessor:
-    def __init__(self):
-        self.llm = ModelFactory.get_llm()
+    def __init__(self, llm=None, rate_limiter: RateLimiter = None, cache: ContextCache = None):
+        self.llm = llm or ModelFactory.get_llm()
+        # Partagé entre tous les threads : c'est lui qui évite les 429
+        self.rate_limiter = rate_limiter or RateLimiter(
+            Config.COHERE_REQUESTS_PER_MINUTE,
+            Config.COHERE_TOKENS_PER_MINUTE
+        )
+        if cache is None and Config.CONTEXT_CACHE_ENABLED:
+            cache = ContextCache(Config.CONTEXT_CACHE_PATH, Config.CONTEXT_CACHE_MAX_BYTES)
+        self.cache = cache
 
-    # def load_and_split(self, file_path: str) -> tuple[List[Document], List[Document]]:
-    #     loader = PyPDFLoader(file_path)
-    #     raw_docs = loader.load()
-    #     splitter = RecursiveCharacterTextSplitter(
-    #         chunk_size=1000,
-    #         chunk_overlap=200
-    #     )
-    #     chunks = splitter.split_documents(raw_docs)
-    #     return raw_docs, chunks
     def load_and_split(self, file_path: str, strategy: str = "recursive") -> tuple:
-            loader = PyPDFLoader(file_path)
-            raw_docs = loader.load()
-            
-            if strategy == "recursive":
-                splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            elif strategy == "token":
-                # Stratégie 2 : Découpage par tokens (plus précis pour les LLMs)
-                splitter = TokenTextSplitter(chunk_size=256, chunk_overlap=20)
-            else:
-                raise ValueError("Stratégie inconnue")
-                
-            chunks = splitter.split_documents(raw_docs)
-            return raw_docs, chunks
-    def generate_contextual_chunks(self, global_context: str, chunks: List[Document]) -> List[Document]:
-        print(f"Génération du contexte pour {len(chunks)} chunks... (Cela va prendre ~2 minutes)")
-        
-        contextualized_docs = []
-        
-        for i, chunk in enumerate(chunks):
-            # --- PAUSE DE SÉCURITÉ ANTI-429 ---
-            if i > 0: 
-                time.sleep(3.1)  # On attend 3.1 secondes entre chaque chunk
-            # ----------------------------------
+        """Chargement complet + découpage (voir src/ingestion.py pour la version en flux)."""
+        loader = PyPDFLoader(file_path)
+        raw_docs = loader.load()
+        chunks = make_splitter(strategy).split_documents(raw_docs)
+        return raw_docs, chunks
+
+    def _contextualize(self, global_context: str, chunk: Document) -> str:
+        """Un appel LLM pour un chunk, sous contrôle du rate limiter et avec réessais sur 429."""
+        prompt = CONTEXT_PROMPT_TEMPLATE.format(global_context=global_context, chunk=chunk.page_content)
+
+        def call():
+            # Chaque tentative (y compris les réessais) consomme du budget
+            self.rate_limiter.acquire(estimate_tokens(prompt) + CONTEXT_OUTPUT_TOKENS)
+            return self.llm.invoke(prompt).content
+
+        return call_with_backoff(
+            call,
+            max_retries=Config.LLM_MAX_RETRIES,
+            base_delay=Config.LLM_BACKOFF_BASE_SECONDS,
+            max_delay=Config.LLM_BACKOFF_MAX_SECONDS,
+        )
+
+    def _cached_contextualize(self, global_context: str, chunk: Document) -> str:
+        """Consulte le cache disque avant d'appeler le LLM."""
+        if self.cache is None:
+            return self._contextualize(global_context, chunk)
+
+        key = ContextCache.make_key(
+            global_context, chunk.page_content, CONTEXT_PROMPT_TEMPLATE, Config.LLM_MODEL_NAME
+        )
+        context = self.cache.get(key)
+        if context is None:
+            context = self._contextualize(global_context, chunk)
+            self.cache.put(key, context)
+        return context
 
-            prompt = (
-                f"<document_context>{global_context}</document_context>\n"
-                f"<chunk>{chunk.page_content}</chunk>\n"
-                "Please give a short concise context to situate this chunk within the overall document for the purposes of improving search retrieval of the chunk. Answer only with the succinct context."
+    def contextualize_chunk(self, i: int, global_context: str, chunk: Document) -> Document:
+        start = time.perf_counter()
+        try:
+            context = self._cached_contextualize(global_context, chunk)
+            # Cache, attente du rate limiter et réessais compris
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="contextualize")
+
+            # On crée un nouveau document avec le contexte ajouté
+            new_doc = Document(
+                page_content=f"{context}\n\n{chunk.page_content}",
+                metadata=chunk.metadata.copy()
             )
-            
-            try:
-                response = self.llm.invoke(prompt)
-                context = response.content
-                
-                # On crée un nouveau document avec le contexte ajouté
-                new_doc = Document(
-                    page_content=f"{context}\n\n{chunk.page_content}",
-                    metadata=chunk.metadata.copy()
-                )
-                # Important : On injecte l'ID ici pour FAISS
-                new_doc.metadata["chunk_id"] = i 
-                
-                contextualized_docs.append(new_doc)
-                print(f"Traité {i+1}/{len(chunks)} chunks...")
-                
-            except Exception as e:
-                print(f"⚠️ Erreur sur chunk {i}: {e}")
-                # En cas d'erreur, on garde le chunk original pour ne pas le perdre
-                chunk.metadata["chunk_id"] = i
-                contextualized_docs.append(chunk)
+            # Important : On injecte l'ID ici pour FAISS
+            new_doc.metadata["chunk_id"] = i
+            # Début du texte du PDF (le contexte sert de résumé aux sections, voir src/hierarchy.py)
+            new_doc.metadata["context_chars"] = len(context) + 2
+            return new_doc
+
+        except Exception as e:
+            print(f"⚠️ Erreur sur chunk {i}: {e}")
+            CONTEXTUALIZE_FALLBACKS.inc()
+            # En cas d'erreur, on garde le chunk original pour ne pas le perdre
+            chunk.metadata["chunk_id"] = i
+            return chunk
+
+    def generate_contextual_chunks(self, global_context: str, chunks: List[Document], concurrency: int = None) -> List[Document]:
+        """
+        Génère le contexte de chaque chunk avec plusieurs appels LLM en parallèle.
+        Le débit est piloté par le rate limiter (budgets de Config) et non plus par un sleep fixe.
+        L'ordre de sortie et les chunk_id restent ceux de la liste d'entrée.
+        """
+        concurrency = max(1, concurrency or Config.CONTEXTUAL_CONCURRENCY)
+        print(f"Génération du contexte pour {len(chunks)} chunks ({concurrency} en parallèle)...")
+
+        contextualized_docs = [None] * len(chunks)
+        done = 0
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(self.contextualize_chunk, i, global_context, chunk): i
+                for i, chunk in enumerate(chunks)
+            }
+            for future in as_completed(futures):
+                contextualized_docs[futures[future]] = future.result()
+                done += 1
+                print(f"Traité {done}/{len(chunks)} chunks...")
+
+        if self.cache is not None:
+            stats = self.cache.stats()
+            print(f"🗃️ Cache de contextes : {stats['hits']} hits / {stats['misses']} miss ({stats['entries']} entrées)")
 
-        return contextualized_docs
\ No newline at end of file
+        return contextualized_docs
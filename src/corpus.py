@@ -0,0 +1,435 @@
+import os
+import re
+import json
+import glob
+import shutil
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.bm25_index import segment_statistics
+from src.config import Config
+from src.fusion import fuse
+from src.ingestion import StreamingIngestion, pdf_date  # noqa: F401  (pdf_date ré-exporté)
+from src.models import ModelFactory
+from src.telemetry import record_stage
+from src.vector_store import HybridStore, RerankedSearch, embed_queries
+
+
+def make_doc_id(filename: str) -> str:
+    """Identifiant stable et lisible d'un document : nom de fichier sans extension, en slug."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return re.sub(r"[^a-z0-9]+", "-", stem.lower()).strip("-") or "document"
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def build_shard_version(pdf_path: str, processor, embeddings, root: str, current_path: str = None,
+                        version: str = None, progress=None) -> dict:
+    """
+    Construit la nouvelle version du shard d'un PDF dans un dossier neuf `<root>/<doc_id>@<version>` :
+    copie de la version courante puis mise à jour incrémentale. La version en service n'est jamais
+    modifiée. Renvoie l'entrée du manifeste du corpus, à passer à CorpusManager.install_shard.
+    """
+    filename = os.path.basename(pdf_path)
+    doc_id = make_doc_id(filename)
+    sha = file_sha256(pdf_path)
+    path = os.path.join(root, f"{doc_id}@{version or uuid.uuid4().hex[:8]}")
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        store = HybridStore(index_path=path, embeddings=embeddings, reranker=None)
+        if current_path and os.path.exists(current_path):
+            shutil.copytree(current_path, path)
+            store.load_index()
+        # Pages, découpage, contextualisation et embedding en flux (voir src/ingestion.py)
+        contextualized, vectors, doc_date = StreamingIngestion(processor, embeddings).run(
+            pdf_path, filename, doc_id, is_known=store.has_chunk, progress=progress
+        )
+        store.upsert_document(contextualized, filename, vectors=vectors)
+        store.wait_for_compaction()
+        if Config.HIERARCHICAL_RETRIEVAL:
+            store.build_hierarchy()
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    return {
+        "doc_id": doc_id,
+        "filename": filename,
+        "path": path,
+        "sha256": sha,
+        "date": doc_date,
+        "chunks": len(contextualized),
+    }
+
+
+class CorpusManager(RerankedSearch):
+    """
+    Corpus multi-documents : un shard HybridStore (FAISS + BM25) par PDF sous `root`.
+    Chaque chunk reçoit un identifiant global `<doc_id>:<chunk_id>`.
+    Une requête filtrée (documents, pages, dates) n'interroge que les shards concernés,
+    en parallèle, puis les résultats sont re-fusionnés et rerankés globalement.
+
+    Les shards en service sont figés : une mise à jour construit une nouvelle version à part
+    puis remplace la référence (copy-on-write). La recherche ne prend donc aucun verrou ;
+    self._lock ne sérialise que les écrivains.
+    """
+
+    def __init__(self, root: str = None, embeddings=None):
+        self.root = root or Config.CORPUS_PATH
+        self.manifest_path = os.path.join(self.root, "corpus.json")
+        self.embeddings = embeddings or ModelFactory.get_embeddings()
+        # Chargé au premier usage (ou en arrière-plan, voir Config.MODEL_LOADING)
+        self.reranker = ModelFactory.get_reranker(lazy=True)
+        # doc_id -> {"filename", "path", "sha256", "date", "chunks"}
+        self.documents: Dict[str, dict] = {}
+        self.shards: Dict[str, HybridStore] = {}
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._index_listeners = []
+        self._executor = ThreadPoolExecutor(
+            max_workers=Config.SHARD_SEARCH_WORKERS,
+            thread_name_prefix="shard-search"
+        )
+
+    # --- Cycle de vie ---
+    def add_index_listener(self, callback):
+        self._index_listeners.append(callback)
+
+    def _notify_index_changed(self):
+        for callback in self._index_listeners:
+            callback()
+
+    def index_version(self) -> str:
+        """
+        Empreinte des shards en service (chemin versionné et hash de chaque PDF) : elle change
+        à chaque bascule, suppression ou rechargement d'une nouvelle version.
+        """
+        documents = self.documents
+        state = sorted((doc_id, info.get("path"), info.get("sha256")) for doc_id, info in documents.items())
+        return hashlib.sha256(json.dumps(state).encode("utf-8")).hexdigest()[:16]
+
+    def _new_shard(self, path: str) -> HybridStore:
+        # Shards sans reranker propre : le reranking est fait une fois, sur le résultat global
+        shard = HybridStore(index_path=path, embeddings=self.embeddings, reranker=None)
+        shard.add_index_listener(self._notify_index_changed)
+        return shard
+
+    def _load_shard(self, doc_id: str, info: dict) -> Optional[HybridStore]:
+        """Charge et fige le shard d'un document (None s'il est illisible)."""
+        shard = self._new_shard(info["path"])
+        if not shard.load_index(read_only=True):
+            return None
+        if os.path.abspath(info["path"]) == os.path.abspath(Config.FAISS_INDEX_PATH):
+            self._tag_legacy_chunks(shard, doc_id)
+        shard.freeze()
+        return shard
+
+    @staticmethod
+    def _tag_legacy_chunks(shard: HybridStore, doc_id: str):
+        """
+        Les chunks de l'ancien index mono-document n'ont ni doc_id ni global_id : ils sont ajoutés
+        en mémoire à chaque chargement, sans réécrire les fichiers de data/faiss_index.
+        """
+        with shard._lock:
+            docstore = shard.vector_db.docstore._dict
+            for key in list(docstore):
+                # Les documents du ChunkStore sont décodés à chaque accès : on réécrit l'entrée
+                doc = docstore[key]
+                if "doc_id" in doc.metadata:
+                    continue
+                doc.metadata["doc_id"] = doc_id
+                doc.metadata.setdefault("global_id", f"{doc_id}:{doc.metadata.get('chunk_id')}")
+                docstore[key] = doc
+
+    def _save_manifest(self):
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        with open(self.manifest_path + ".tmp", "w") as f:
+            json.dump(self.documents, f, indent=2)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        self._manifest_mtime = self._read_manifest_mtime()
+
+    def load(self) -> bool:
+        """Charge tous les shards connus. Reprend l'ancien index unique s'il n'y a pas encore de corpus."""
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                self.documents = json.load(f)
+        else:
+            self._adopt_legacy_index()
+
+        shards = dict(self.shards)
+        for doc_id, info in self.documents.items():
+            if doc_id in shards:
+                continue
+            shard = self._load_shard(doc_id, info)
+            if shard:
+                shards[doc_id] = shard
+            else:
+                print(f"⚠️ Shard illisible pour {info['filename']} : il sera ré-ingéré")
+                info["sha256"] = None
+        self.shards = shards
+        self._manifest_mtime = self._read_manifest_mtime()
+        return self.is_ready()
+
+    def _read_manifest_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.manifest_path)
+        except OSError:
+            return None
+
+    def refresh(self) -> bool:
+        """
+        Suit les bascules faites par un autre processus (le worker uvicorn qui mène l'ingestion) :
+        relit le manifeste s'il a changé et charge les nouvelles versions de shards.
+        """
+        mtime = self._read_manifest_mtime()
+        if mtime is None or mtime == self._manifest_mtime:
+            return False
+        with open(self.manifest_path, "r") as f:
+            documents = json.load(f)
+
+        current_shards, current_documents = self.shards, self.documents
+        shards = {}
+        for doc_id, info in documents.items():
+            if doc_id in current_shards and current_documents.get(doc_id, {}).get("path") == info["path"]:
+                shards[doc_id] = current_shards[doc_id]
+                continue
+            shard = self._load_shard(doc_id, info)
+            # Version déjà remplacée entre-temps : la prochaine synchronisation la rattrapera
+            if shard:
+                shards[doc_id] = shard
+        with self._lock:
+            self.shards, self.documents = shards, documents
+            self._manifest_mtime = mtime
+        print(f"🔁 Corpus rechargé depuis le manifeste ({len(shards)} shard(s))")
+        self._notify_index_changed()
+        return True
+
+    def start_auto_refresh(self, interval: float):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"⚠️ Rechargement du corpus impossible : {e}")
+
+        threading.Thread(target=loop, name="corpus-refresh", daemon=True).start()
+
+    def _adopt_legacy_index(self):
+        """L'index mono-document (data/faiss_index) devient le shard de son fichier."""
+        legacy = self._new_shard(Config.FAISS_INDEX_PATH)
+        filename = legacy.get_indexed_filename()
+        if not filename or not legacy.load_index(read_only=True):
+            return
+
+        doc_id = make_doc_id(filename)
+        source = os.path.join(Config.CORPUS_SOURCE_DIR, filename)
+        # Rien n'est écrit dans data/faiss_index : seul le manifeste du corpus référence l'index
+        self._tag_legacy_chunks(legacy, doc_id)
+        legacy.freeze()
+        self.documents = {**self.documents, doc_id: {
+            "filename": filename,
+            "path": Config.FAISS_INDEX_PATH,
+            # L'index a été construit depuis ce fichier : inutile de le ré-ingérer s'il est présent
+            "sha256": file_sha256(source) if os.path.exists(source) else None,
+            "date": None,
+            "chunks": len(legacy.vector_db.docstore._dict),
+        }}
+        self.shards = {**self.shards, doc_id: legacy}
+        self._save_manifest()
+        print(f"📦 Index existant repris comme shard '{doc_id}'")
+
+    def is_ready(self) -> bool:
+        return any(shard.vector_db for shard in self.shards.values())
+
+    # --- Ingestion ---
+    def is_current(self, pdf_path: str) -> bool:
+        """Vrai si le PDF est déjà indexé dans cette version exacte."""
+        doc_id = make_doc_id(pdf_path)
+        info = self.documents.get(doc_id)
+        return bool(info) and doc_id in self.shards and info.get("sha256") == file_sha256(pdf_path)
+
+    def install_shard(self, info: dict):
+        """
+        Met en service une version de shard construite par build_shard_version (dans un worker
+        d'ingestion, voir src/jobs.py). Les requêtes en cours finissent sur l'ancienne version.
+        """
+        doc_id = info["doc_id"]
+        shard = self._new_shard(info["path"])
+        if not shard.load_index(read_only=True):
+            raise RuntimeError(f"Version de shard illisible : {info['path']}")
+        shard.freeze()
+
+        with self._lock:
+            previous = self.documents.get(doc_id)
+            shards = {**self.shards, doc_id: shard}
+            documents = {**self.documents, doc_id: {k: v for k, v in info.items() if k != "doc_id"}}
+            # Simple remplacement de références : aucun lecteur ne voit un dictionnaire en cours de modification
+            self.shards, self.documents = shards, documents
+            self._save_manifest()
+        print(f"🔀 Shard '{doc_id}' basculé sur {info['path']}")
+        self._notify_index_changed()
+        if previous and previous["path"] != info["path"]:
+            self._discard_files(previous["path"])
+
+    def _discard_files(self, path: str):
+        # On ne supprime sur disque que les shards gérés par le corpus
+        if self._is_managed(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            info = self.documents.get(doc_id)
+            self.documents = {k: v for k, v in self.documents.items() if k != doc_id}
+            self.shards = {k: v for k, v in self.shards.items() if k != doc_id}
+            self._save_manifest()
+        if info:
+            self._discard_files(info["path"])
+        self._notify_index_changed()
+
+    def _is_managed(self, path: str) -> bool:
+        return os.path.abspath(path).startswith(os.path.abspath(self.root) + os.sep)
+
+    def plan_sync(self, folder: str, prune: bool = False) -> Tuple[List[str], List[str]]:
+        """
+        (PDF nouveaux ou modifiés à ingérer, doc_id à retirer). Une synchronisation n'ajoute et ne
+        met à jour que par défaut : les shards dont le PDF est absent de `folder` ne sont retirés
+        qu'avec `prune` (action d'administration explicite), et jamais l'index repris de l'ancien
+        format ni un shard sans source connue (sha256 absent).
+        """
+        pdf_paths = sorted(glob.glob(os.path.join(folder, "*.pdf")))
+        present = {make_doc_id(p) for p in pdf_paths}
+        todo = [path for path in pdf_paths if not self.is_current(path)]
+        missing = [doc_id for doc_id in self.documents if doc_id not in present]
+        removed = [
+            doc_id for doc_id in missing
+            if prune and self._is_managed(self.documents[doc_id]["path"]) and self.documents[doc_id].get("sha256")
+        ]
+        if len(missing) > len(removed):
+            print(f"ℹ️ {len(missing) - len(removed)} shard(s) sans PDF dans {folder} conservé(s)"
+                  f"{'' if prune else ' (prune pour les retirer)'}")
+        return todo, removed
+
+    # --- Recherche ---
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.embeddings.encode_query(query)
+
+    def select_shards(self, documents: List[str] = None, date_from: str = None,
+                      date_to: str = None) -> List[HybridStore]:
+        """Shards correspondant aux filtres (doc_id ou nom de fichier, dates ISO incluses)."""
+        wanted = set(documents) if documents else None
+        selected = []
+        # Instantanés sans verrou : les écrivains remplacent les dictionnaires, ils ne les modifient pas
+        shards, infos = self.shards, self.documents
+        for doc_id, shard in shards.items():
+            info = infos.get(doc_id, {})
+            if wanted and doc_id not in wanted and info.get("filename") not in wanted:
+                continue
+            doc_date = info.get("date")
+            if (date_from or date_to) and not doc_date:
+                continue
+            if date_from and doc_date < date_from:
+                continue
+            if date_to and doc_date > date_to:
+                continue
+            if shard.vector_db:
+                selected.append(shard)
+        return selected
+
+    def retrieve_candidates(self, query: str, k: int = 5, query_vector: np.ndarray = None,
+                            documents: List[str] = None, pages: Tuple[int, int] = None,
+                            date_from: str = None, date_to: str = None,
+                            timings: Dict[str, float] = None) -> List[Document]:
+        """`timings` : durées par étape, sommées sur les shards (voir HybridStore.retrieve_candidates)."""
+        query_vectors = None if query_vector is None else np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        return self.retrieve_candidates_batch([query], k, query_vectors, documents=documents, pages=pages,
+                                              date_from=date_from, date_to=date_to, timings=timings)[0]
+
+    def retrieve_candidates_batch(self, queries: List[str], k: int = 5, query_vectors: np.ndarray = None,
+                                  documents: List[str] = None, pages: Tuple[int, int] = None,
+                                  date_from: str = None, date_to: str = None,
+                                  timings: Dict[str, float] = None) -> List[List[Document]]:
+        """Candidats de plusieurs requêtes (mêmes filtres), dans l'ordre des requêtes."""
+        shards = self.select_shards(documents, date_from, date_to)
+        if not shards or not queries:
+            return [[] for _ in queries]
+        if query_vectors is None:
+            start = time.perf_counter()
+            query_vectors = embed_queries(self.embeddings, queries)
+            record_stage(timings, "embed_s", start)
+        if len(shards) == 1:
+            return shards[0].retrieve_candidates_batch(queries, k, query_vectors, pages=pages, timings=timings)
+
+        # BM25 avec les statistiques de tout le corpus (df, longueur moyenne) : scores comparables
+        bm25_stats = segment_statistics([segment for shard in shards for segment in shard.bm25_segments()], queries)
+        # Shards interrogés en parallèle (FAISS et NumPy relâchent le GIL) ; un dict de mesures par shard
+        shard_timings = [{} if timings is not None else None for _ in shards]
+        per_shard = list(self._executor.map(
+            lambda shard, t: shard.retrieve_candidates_batch(
+                queries, k, query_vectors, pages=pages, timings=t, bm25_stats=bm25_stats
+            ),
+            shards, shard_timings
+        ))
+        start = time.perf_counter()
+        hierarchical = [shard.uses_hierarchy() for shard in shards]
+        merged = [
+            self._merge_shards([docs[i] for docs in per_shard], k, hierarchical) for i in range(len(queries))
+        ]
+        if timings is not None:
+            for measured in shard_timings:
+                for stage, seconds in measured.items():
+                    timings[stage] = timings.get(stage, 0.0) + seconds
+            record_stage(timings, "fusion_s", start)
+        return merged
+
+    @staticmethod
+    def _merge_shards(per_shard: List[List[Document]], k: int, hierarchical: List[bool] = None) -> List[Document]:
+        """
+        Re-fusion globale sur les scores bruts, comparables d'un shard à l'autre : distances L2 (même
+        modèle d'embedding pour tous les shards) et scores BM25 calculés avec les statistiques du
+        corpus. Une liste vectorielle et une liste BM25 pour tout le corpus, fusionnées comme dans
+        un shard. Seuls les shards hiérarchiques (distances de fenêtres de phrases, d'une autre
+        nature) gardent chacun leur liste vectorielle, qui ne compte que par son rang.
+        """
+        hierarchical = hierarchical or [False] * len(per_shard)
+        candidates = {}
+        result_lists = {"vector": [], "bm25": []}
+        weights = {"vector": Config.FUSION_VECTOR_WEIGHT, "bm25": Config.FUSION_BM25_WEIGHT}
+        for shard, (docs, by_rank) in enumerate(zip(per_shard, hierarchical)):
+            vector_list = "vector"
+            if by_rank:
+                vector_list = f"vector:{shard}"
+                result_lists[vector_list], weights[vector_list] = [], Config.FUSION_VECTOR_WEIGHT
+            for d in docs:
+                key = d.metadata["chunk_key"]
+                candidates[key] = d
+                if d.metadata.get("vector_distance") is not None:
+                    result_lists[vector_list].append((key, -d.metadata["vector_distance"]))
+                if d.metadata.get("bm25_score") is not None:
+                    result_lists["bm25"].append((key, d.metadata["bm25_score"]))
+        for name in result_lists:
+            result_lists[name].sort(key=lambda hit: hit[1], reverse=True)
+        fused = fuse(result_lists, weights=weights, method=Config.FUSION_METHOD, rrf_k=Config.RRF_K)
+        merged = []
+        for key, score, _ in fused[:k * 2]:
+            doc = candidates[key]
+            doc.metadata["fusion_score"] = score
+            merged.append(doc)
+        return merged
+
+    def list_documents(self) -> List[dict]:
+        return [{"doc_id": doc_id, **{k: v for k, v in info.items() if k != "path"}}
+                for doc_id, info in self.documents.items()]
@@ -0,0 +1,187 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class _MicroBatcher:
+    """
+    Regroupe les requêtes arrivées dans une fenêtre de `max_wait_ms` (ou jusqu'à `max_batch_size`)
+    et les encode en une seule passe du modèle.
+    """
+
+    def __init__(self, encode_fn, max_batch_size: int, max_wait_ms: float):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self.encode_fn([text for text, _ in items])
+                for (_, future), vector in zip(items, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+
+
+class EmbeddingService(Embeddings):
+    """
+    Couche d'embedding au-dessus de sentence-transformers (remplace HuggingFaceEmbeddings) :
+      - micro-batching des requêtes concurrentes (une seule passe forward)
+      - cache LRU des vecteurs de requêtes déjà calculés (les documents n'y passent pas)
+      - nombre de threads intra-op configurable (hôtes CPU)
+      - sortie en np.float32 contiguë, utilisable telle quelle par FAISS
+    Reste compatible avec l'interface LangChain (embed_documents / embed_query).
+    Le modèle (et torch) n'est chargé qu'au premier encodage ou par warmup().
+    """
+
+    def __init__(self, model_name: str, device: str = "cpu", batch_size: int = 32,
+                 max_batch_wait_ms: float = 5.0, cache_size: int = 4096,
+                 num_threads: int = 0, normalize: bool = True):
+        self.model_name = model_name
+        self.device = device
+        self.num_threads = num_threads
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.load_seconds = None
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._batcher = _MicroBatcher(self._encode_batch, batch_size, max_batch_wait_ms)
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    from sentence_transformers import SentenceTransformer
+
+                    if self.num_threads:
+                        import torch
+                        torch.set_num_threads(self.num_threads)
+                    self._model = SentenceTransformer(self.model_name, device=self.device)
+                    self.load_seconds = time.perf_counter() - start
+                    print(f"🧠 Modèle d'embedding chargé en {self.load_seconds:.2f}s")
+        return self._model
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    def warmup(self):
+        """Charge le modèle et fait une première passe (allocations, caches internes)."""
+        self._encode_batch(["warmup"])
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=self.normalize,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def _cache_get(self, text: str):
+        with self._cache_lock:
+            vector = self._cache.get(text)
+            if vector is None:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(text)
+            self.cache_hits += 1
+            return vector
+
+    def _cache_put(self, text: str, vector: np.ndarray):
+        if not self.cache_size:
+            return
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)  # partagé entre requêtes : lecture seule
+        with self._cache_lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def encode_query(self, text: str) -> np.ndarray:
+        """Vecteur (dim,) float32 d'une requête : cache, sinon micro-batch partagé."""
+        vector = self._cache_get(text)
+        if vector is None:
+            vector = self._batcher.submit(text).result()
+            self._cache_put(text, vector)
+        return vector
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Lot de requêtes : matrice (n, dim) float32 contiguë ; seuls les textes absents du cache
+        sont encodés.
+        """
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        missing = []
+        for i, text in enumerate(texts):
+            vector = self._cache_get(text)
+            if vector is None:
+                missing.append(i)
+            else:
+                out[i] = vector
+        if missing:
+            vectors = self._encode_batch([texts[i] for i in missing])
+            for i, vector in zip(missing, vectors):
+                out[i] = vector
+                self._cache_put(texts[i], vector)
+        return out
+
+    def encode_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        Chunks à indexer : directement au modèle, sans le cache LRU ni ses compteurs (métriques du
+        cache de requêtes). Une ingestion évincerait sinon les requêtes fréquentes du cache.
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return self._encode_batch(texts)
+
+    def stats(self) -> dict:
+        with self._cache_lock:
+            return {"entries": len(self._cache), "hits": self.cache_hits, "misses": self.cache_misses}
+
+    # --- Interface LangChain ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode_documents(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode_query(text).tolist()
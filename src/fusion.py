@@ -0,0 +1,47 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Une liste de résultats : (clé du chunk, score) triée du meilleur au moins bon,
+# score "plus grand = meilleur" (les distances FAISS sont passées en négatif)
+Hits = List[Tuple[str, float]]
+
+
+def _min_max(scores: np.ndarray) -> np.ndarray:
+    if not len(scores):
+        return scores
+    low, high = scores.min(), scores.max()
+    if high == low:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def fuse(result_lists: Dict[str, Hits], weights: Dict[str, float], method: str = "rrf",
+         rrf_k: int = 60) -> List[Tuple[str, float, List[str]]]:
+    """
+    Fusionne plusieurs listes de résultats (ex : {"vector": ..., "bm25": ...}).
+      - "rrf"      : Reciprocal Rank Fusion, somme de poids / (rrf_k + rang)
+      - "weighted" : somme pondérée des scores normalisés min-max dans chaque liste
+    Renvoie [(clé, score fusionné, [listes d'origine])] trié par score décroissant.
+    """
+    keys = list(dict.fromkeys(key for hits in result_lists.values() for key, _ in hits))
+    position = {key: i for i, key in enumerate(keys)}
+    fused = np.zeros(len(keys), dtype=np.float64)
+    origins = [[] for _ in keys]
+
+    for name, hits in result_lists.items():
+        if not hits:
+            continue
+        idx = np.fromiter((position[key] for key, _ in hits), dtype=np.int64, count=len(hits))
+        if method == "rrf":
+            contribution = 1.0 / (rrf_k + np.arange(1, len(hits) + 1))
+        elif method == "weighted":
+            contribution = _min_max(np.fromiter((s for _, s in hits), dtype=np.float64, count=len(hits)))
+        else:
+            raise ValueError(f"Méthode de fusion inconnue : {method}")
+        fused[idx] += weights.get(name, 1.0) * contribution
+        for i in idx:
+            origins[i].append(name)
+
+    order = np.argsort(-fused, kind="stable")
+    return [(keys[i], float(fused[i]), origins[i]) for i in order]
@@ -0,0 +1,293 @@
+import hashlib
+import json
+import os
+import re
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.context_packing import split_sentences
+
+# Titre de section : numéroté ("3", "3.2 Scaled Dot-Product Attention") ou titre usuel d'article
+_HEADING_RE = re.compile(
+    r"^[ \t]*(?:\d{1,2}(?:\.\d{1,2}){0,2}\.?[ \t]+[A-Z][^\n]{2,80}"
+    r"|Abstract|Introduction|Conclusions?|References|Acknowledge?ments?)[ \t]*$",
+    re.MULTILINE,
+)
+# Longueur max du résumé de section embeddé (le modèle tronque de toute façon vers 256 tokens)
+SUMMARY_MAX_CHARS = 2000
+
+
+def _body_start(doc: Document) -> int:
+    """Début du texte du PDF dans le chunk (après le contexte généré, voir contextual.py)."""
+    return int(doc.metadata.get("context_chars") or 0)
+
+
+def detect_sections(docs: List[Document], max_chunks: int = 8) -> List[Tuple[str, List[int]]]:
+    """
+    Regroupe les chunks (triés par chunk_id) en sections : un chunk dont la première moitié contient
+    un titre ouvre une section. Les sections trop longues (ou un document sans titre détecté) sont
+    découpées en blocs de `max_chunks` chunks consécutifs. Renvoie [(titre, [indices des chunks])].
+    """
+    sections, title, members = [], None, []
+    for i, doc in enumerate(docs):
+        body = doc.page_content[_body_start(doc):]
+        match = _HEADING_RE.search(body)
+        if match and match.start() < len(body) // 2:
+            if members:
+                sections.append((title, members))
+            title, members = " ".join(match.group(0).split()), []
+        members.append(i)
+    if members:
+        sections.append((title, members))
+
+    out = []
+    for title, members in sections:
+        for start in range(0, len(members), max(1, max_chunks)):
+            part = members[start:start + max_chunks]
+            page = docs[part[0]].metadata.get("page")
+            label = title or (f"p. {int(page) + 1}" if page is not None else "Début du document")
+            out.append((label if start == 0 else f"{label} (suite)", part))
+    return out
+
+
+def sentence_windows(text: str, start: int = 0, window: int = 1) -> List[Tuple[int, int]]:
+    """
+    Fenêtres de phrases de text[start:] : pour chaque phrase, elle et `window` phrases de part et
+    d'autre. Renvoie des plages (début, fin) en caractères dans `text`.
+    """
+    spans, cursor = [], start
+    for sentence in split_sentences(text[start:]):
+        begin = text.find(sentence, cursor)
+        if begin < 0:
+            continue
+        spans.append((begin, begin + len(sentence)))
+        cursor = begin + len(sentence)
+    if not spans:
+        return [(start, len(text))] if text[start:].strip() else []
+    return [
+        (spans[max(0, i - window)][0], spans[min(len(spans) - 1, i + window)][1])
+        for i in range(len(spans))
+    ]
+
+
+def summarize_section(title: str, docs: Sequence[Document]) -> str:
+    """
+    Résumé d'une section sans appel LLM : son titre puis le contexte généré de chacun de ses chunks
+    (qui situe déjà le chunk dans le document), ou à défaut leur première phrase.
+    """
+    parts = [title]
+    for doc in docs:
+        context_chars = _body_start(doc)
+        if context_chars:
+            parts.append(doc.page_content[:context_chars].strip())
+        else:
+            sentences = split_sentences(doc.page_content)
+            if sentences:
+                parts.append(sentences[0])
+    return " ".join(parts)[:SUMMARY_MAX_CHARS]
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _squared_distances(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    # Distance L2 au carré, comme FAISS
+    diff = np.asarray(vectors, dtype=np.float32) - query
+    return np.einsum("ij,ij->i", diff, diff)
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantification int8 symétrique par dimension : (codes int8, échelle float32 par dimension)."""
+    scale = np.abs(vectors).max(axis=0) / 127 if len(vectors) else np.ones(vectors.shape[1])
+    scale = np.where(scale == 0, 1, scale).astype(np.float32)
+    return np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8), scale
+
+
+class SectionIndex:
+    """
+    Index hiérarchique d'un shard, à côté de FAISS :
+      section (résumé + centroïde) -> fenêtres de phrases (enfants) -> chunk parent.
+    La passe grossière compare la requête aux sections, la passe fine aux seuls enfants des
+    sections retenues ; chaque chunk parent est classé par sa meilleure fenêtre et c'est lui,
+    entier, qui est renvoyé pour la réponse.
+    Les enfants sont rangés par section (plage contiguë par section). La passe fine parcourt
+    leurs vecteurs quantifiés en int8 ; les vecteurs float32, lus en mmap, ne servent qu'à
+    re-classer les meilleurs candidats (comme l'index FAISS quantifié, voir ann_index.rescore).
+    Fichiers dans le dossier du shard, rechargés en mmap : hierarchy.json, section_vectors.npy,
+    child_codes.npy, child_scale.npy, child_vectors.npy, child_parents.npy, child_spans.npy,
+    child_digests.npy.
+    """
+
+    FILE = "hierarchy.json"
+    ARRAYS = ("section_vectors", "child_codes", "child_scale", "child_vectors", "child_parents", "child_spans",
+              "child_digests")
+
+    def __init__(self, sections: List[dict], parents: List[str], fingerprint: str, section_vectors: np.ndarray,
+                 child_codes: np.ndarray, child_scale: np.ndarray, child_vectors: np.ndarray,
+                 child_parents: np.ndarray, child_spans: np.ndarray, child_digests: np.ndarray):
+        self.sections = sections        # [{"title", "summary", "start", "end"}] : plage d'enfants
+        self.parents = parents          # clés des chunks parents
+        self.fingerprint = fingerprint  # chunks couverts (voir make_fingerprint)
+        self.section_vectors = np.asarray(section_vectors, dtype=np.float32)
+        self.child_codes = child_codes
+        self.child_scale = child_scale
+        self.child_vectors = child_vectors
+        self.child_parents = child_parents
+        self.child_spans = child_spans
+        self.child_digests = child_digests
+        # Bornes des plages d'enfants et nombre de chunks parents distincts par section
+        self.section_starts = np.array([section["start"] for section in sections], dtype=np.int64)
+        self.section_ends = np.array([section["end"] for section in sections], dtype=np.int64)
+        self.section_chunks = np.array([
+            len(np.unique(child_parents[section["start"]:section["end"]])) for section in sections
+        ], dtype=np.int64)
+
+    @staticmethod
+    def make_fingerprint(keys) -> str:
+        return hashlib.sha256("\0".join(sorted(keys)).encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def build(cls, docs: List[Document], embeddings, window: int = 1, max_chunks: int = 8,
+              previous: "SectionIndex" = None) -> "SectionIndex":
+        """
+        Construit l'index des chunks `docs` (triés par chunk_id) et renseigne metadata["section"]
+        sur chacun. Les fenêtres déjà embeddées dans `previous` (même texte) ne sont pas ré-embeddées.
+        """
+        sections, texts, child_parents, child_spans = [], [], [], []
+        for title, members in detect_sections(docs, max_chunks):
+            start = len(texts)
+            for i in members:
+                docs[i].metadata["section"] = title
+                for begin, end in sentence_windows(docs[i].page_content, _body_start(docs[i]), window):
+                    texts.append(docs[i].page_content[begin:end])
+                    child_parents.append(i)
+                    child_spans.append((begin, end))
+            sections.append({
+                "title": title,
+                "summary": summarize_section(title, [docs[i] for i in members]),
+                "start": start,
+                "end": len(texts),
+            })
+
+        digests = np.array([hashlib.sha1(text.encode("utf-8")).hexdigest()[:24] for text in texts], dtype="S24")
+        dim = embeddings.dimension
+        child_vectors = np.empty((len(texts), dim), dtype=np.float32)
+        known = {}
+        if previous is not None:
+            known = {digest: row for row, digest in enumerate(previous.child_digests.tolist())}
+        missing = [row for row, digest in enumerate(digests.tolist()) if digest not in known]
+        if missing:
+            child_vectors[missing] = embeddings.encode_documents([texts[row] for row in missing])
+        for row, digest in enumerate(digests.tolist()):
+            if digest in known:
+                child_vectors[row] = previous.child_vectors[known[digest]]
+
+        # Vecteur de section : résumé + centroïde de ses fenêtres, renormalisé
+        section_vectors = np.zeros((len(sections), dim), dtype=np.float32)
+        if sections:
+            section_vectors += embeddings.encode_documents([section["summary"] for section in sections])
+            for row, section in enumerate(sections):
+                if section["end"] > section["start"]:
+                    section_vectors[row] += _normalize(
+                        child_vectors[section["start"]:section["end"]].mean(axis=0, keepdims=True)
+                    )[0]
+            section_vectors = _normalize(section_vectors)
+
+        parents = [doc.metadata["chunk_key"] for doc in docs]
+        print(f"🗂️ Index hiérarchique : {len(sections)} sections, {len(texts)} fenêtres "
+              f"({len(missing)} embeddées) pour {len(docs)} chunks")
+        return cls(
+            sections, parents, cls.make_fingerprint(parents), section_vectors.astype(np.float32),
+            *quantize(child_vectors), child_vectors, np.array(child_parents, dtype=np.int32),
+            np.array(child_spans, dtype=np.int32).reshape(-1, 2), digests
+        )
+
+    @classmethod
+    def exists(cls, folder: str) -> bool:
+        return os.path.exists(os.path.join(folder, cls.FILE))
+
+    def save(self, folder: str):
+        """Tableaux puis hierarchy.json (écrit en dernier : sa présence signale un index complet)."""
+        for name in self.ARRAYS:
+            path = os.path.join(folder, f"{name}.npy")
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(path + ".tmp", path)
+        path = os.path.join(folder, self.FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"sections": self.sections, "parents": self.parents, "fingerprint": self.fingerprint}, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, folder: str) -> "SectionIndex":
+        with open(os.path.join(folder, cls.FILE), "r") as f:
+            header = json.load(f)
+        arrays = {
+            name: np.load(path, mmap_mode="r")
+            for name in cls.ARRAYS if os.path.exists(path := os.path.join(folder, f"{name}.npy"))
+        }
+        if "child_codes" not in arrays:
+            # Index écrit avant la quantification : codes calculés en mémoire (réécrits au prochain build)
+            arrays["child_codes"], arrays["child_scale"] = quantize(np.asarray(arrays["child_vectors"]))
+        return cls(header["sections"], header["parents"], header["fingerprint"], **arrays)
+
+    def search(self, query_vectors: np.ndarray, k: int, n_sections: int = 3,
+               rescore_factor: int = 4) -> List[List[Tuple[str, float, Tuple[int, int]]]]:
+        """
+        Par requête : [(clé du chunk parent, distance L2², plage de sa meilleure fenêtre)], meilleurs
+        d'abord, au plus `k`. Les sections sont parcourues par proximité : au moins `n_sections`,
+        davantage si elles ne contiennent pas encore `k` chunks. Les `rescore_factor * k` meilleurs
+        chunks (distance int8) sont re-classés par la distance float32 de leur meilleure fenêtre.
+        """
+        query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+        if not self.sections:
+            return [[] for _ in query_vectors]
+
+        # 1. Passe grossière : toutes les requêtes contre toutes les sections (quelques dizaines par document)
+        section_distances = (
+            (query_vectors ** 2).sum(axis=1, keepdims=True)
+            - 2 * query_vectors @ self.section_vectors.T
+            + (self.section_vectors ** 2).sum(axis=1)
+        )
+        section_order = np.argsort(section_distances, axis=1, kind="stable")
+        keep = max(1, k * rescore_factor) if rescore_factor > 0 else k
+
+        results = []
+        for query, order in zip(query_vectors, section_order):
+            # Sections retenues : les n_sections plus proches, plus celles qu'il faut pour couvrir k chunks
+            covered = np.cumsum(self.section_chunks[order])
+            taken = order[:max(n_sections, int(np.searchsorted(covered, k)) + 1)]
+            starts, lengths = self.section_starts[taken], self.section_ends[taken] - self.section_starts[taken]
+            if not lengths.sum():
+                results.append([])
+                continue
+            rows = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+            # 2. Passe fine sur les codes int8 des fenêtres de ces sections
+            windows = np.asarray(self.child_codes[rows], dtype=np.float32) * self.child_scale
+            distances = _squared_distances(windows, query)
+            parents = np.asarray(self.child_parents[rows])
+            # Meilleure fenêtre de chaque chunk parent, puis les `keep` meilleurs chunks
+            by_parent = np.lexsort((distances, parents))
+            best = by_parent[np.unique(parents[by_parent], return_index=True)[1]]
+            best = best[np.argsort(distances[best], kind="stable")[:keep]]
+
+            # 3. Re-classement float32 (mmap : seules les lignes retenues sont lues)
+            if rescore_factor > 0:
+                candidates = rows[best]
+                ordered = np.sort(candidates)  # lecture du fichier dans l'ordre
+                exact = _squared_distances(self.child_vectors[ordered], query)
+                best_distances = exact[np.searchsorted(ordered, candidates)]
+            else:
+                best_distances = distances[best]
+            top = np.argsort(best_distances, kind="stable")[:k]
+            spans = np.asarray(self.child_spans[rows[best[top]]]).tolist()
+            results.append([
+                (self.parents[parent], distance, tuple(span))
+                for parent, distance, span in zip(parents[best[top]].tolist(), best_distances[top].tolist(), spans)
+            ])
+        return results
@@ -0,0 +1,176 @@
+import re
+import time
+import queue
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from src.config import Config
+from src.splitting import split_page
+from src.telemetry import STAGE_SECONDS
+from src.vector_store import HybridStore
+
+# Marque de fin de flux entre la contextualisation et l'embedding
+_DONE = object()
+
+
+def pdf_date(raw_docs: List[Document]) -> Optional[str]:
+    """Date de création du PDF (YYYY-MM-DD) si les métadonnées la donnent."""
+    if not raw_docs:
+        return None
+    value = str(raw_docs[0].metadata.get("creationdate") or raw_docs[0].metadata.get("creation_date") or "")
+    digits = re.sub(r"\D", "", value)
+    if len(digits) >= 8:
+        return f"{digits[0:4]}-{digits[4:6]}-{digits[6:8]}"
+    return None
+
+
+def iter_pages(pdf_path: str) -> Iterator[Document]:
+    """Pages extraites une à une : le PDF complet n'est jamais chargé en mémoire."""
+    # Import local : inutile au serveur de requêtes, qui importe ce module via src.corpus
+    from langchain_community.document_loaders import PyPDFLoader
+
+    yield from PyPDFLoader(pdf_path).lazy_load()
+
+
+def iter_chunks(pages: Iterable[Document], strategy: str = "recursive", workers: int = None,
+                window: int = None) -> Iterator[Document]:
+    """
+    Découpe les pages sur un pool de processus, au plus `window` pages en vol.
+    Les chunks sont rendus dans l'ordre des pages, dès que leur page est découpée.
+    """
+    workers = Config.INGEST_SPLIT_WORKERS if workers is None else workers
+    window = max(1, window or Config.INGEST_QUEUE_SIZE)
+    if workers <= 0:
+        for page in pages:
+            yield from _as_documents(split_page(page.page_content, page.metadata, strategy))
+        return
+
+    # fork : les workers n'ont pas à réimporter main.py (et ses modèles) comme avec spawn
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else None)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        for page in pages:
+            pending.append(pool.submit(split_page, page.page_content, page.metadata, strategy))
+            if len(pending) >= window:
+                yield from _as_documents(pending.popleft().result())
+        while pending:
+            yield from _as_documents(pending.popleft().result())
+
+
+def _as_documents(chunks: List[Tuple[str, dict]]) -> Iterator[Document]:
+    for content, metadata in chunks:
+        yield Document(page_content=content, metadata=metadata)
+
+
+class StreamingIngestion:
+    """
+    Ingestion d'un PDF en flux, étapes qui se chevauchent :
+      pages (générateur) -> découpage (processus) -> contextualisation LLM (threads)
+      -> embedding par batch (thread dédié)
+    Les étapes communiquent par des files bornées : la mémoire en vol ne dépend pas de la taille
+    du PDF, et l'embedding avance pendant que les appels LLM sont encore en cours.
+    """
+
+    def __init__(self, processor, embeddings, strategy: str = "recursive"):
+        self.processor = processor
+        self.embeddings = embeddings
+        self.strategy = strategy
+        self.queue_size = Config.INGEST_QUEUE_SIZE
+        self.embed_batch = Config.INGEST_EMBED_BATCH
+
+    def run(self, pdf_path: str, filename: str, doc_id: str, is_known: Callable[[str], bool] = None,
+            progress: Callable[[int], None] = None) -> Tuple[List[Document], Dict[str, np.ndarray], str]:
+        """
+        Renvoie (chunks contextualisés triés par chunk_id, {chunk_digest: vecteur}, date du document).
+        `is_known(digest)` évite d'embedder un chunk déjà présent dans le shard.
+        `progress(n)` est appelé après chaque batch avec le nombre de chunks terminés.
+        """
+        is_known = is_known or (lambda digest: False)
+        pages = iter_pages(pdf_path)
+        first_page = next(pages, None)
+        if first_page is None:
+            return [], {}, date.today().isoformat()
+
+        # Contexte global : le début du document (titre, auteurs, résumé)
+        global_context = first_page.page_content[:Config.GLOBAL_CONTEXT_CHARS]
+        doc_date = pdf_date([first_page]) or date.today().isoformat()
+
+        ready = queue.Queue(maxsize=self.queue_size)
+        in_flight = threading.BoundedSemaphore(self.queue_size)
+        results: List[Document] = []
+        vectors: Dict[str, np.ndarray] = {}
+        errors = []
+
+        def embed_stage():
+            batch = []
+            while True:
+                item = ready.get()
+                if item is not _DONE:
+                    item.metadata["doc_id"] = doc_id
+                    item.metadata["global_id"] = f"{doc_id}:{item.metadata['chunk_id']}"
+                    item.metadata["doc_date"] = doc_date
+                    results.append(item)
+                    batch.append(item)
+                if batch and (item is _DONE or len(batch) >= self.embed_batch):
+                    try:
+                        self._embed_batch(batch, filename, vectors, is_known)
+                        if progress:
+                            progress(len(results))
+                    except Exception as e:
+                        # On continue à vider la file pour ne pas bloquer les threads LLM
+                        errors.append(e)
+                    print(f"Traité {len(results)} chunks ({len(vectors)} embeddés)...")
+                    batch = []
+                if item is _DONE:
+                    return
+
+        def forward(future):
+            try:
+                ready.put(future.result())
+            finally:
+                in_flight.release()
+
+        embedder = threading.Thread(target=embed_stage, name="ingest-embed", daemon=True)
+        embedder.start()
+        concurrency = max(1, Config.CONTEXTUAL_CONCURRENCY)
+        print(f"🚚 Ingestion en flux de {filename} ({concurrency} appels LLM en parallèle)...")
+        contextualizers = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="contextualize")
+        try:
+            chunks = iter_chunks(chain([first_page], pages), self.strategy)
+            for i, chunk in enumerate(chunks):
+                # Bloque quand trop de chunks sont en vol : le découpage attend le LLM
+                in_flight.acquire()
+                contextualizers.submit(
+                    self.processor.contextualize_chunk, i, global_context, chunk
+                ).add_done_callback(forward)
+        finally:
+            contextualizers.shutdown(wait=True)
+            ready.put(_DONE)
+            embedder.join()
+        if errors:
+            raise errors[0]
+
+        results.sort(key=lambda doc: doc.metadata["chunk_id"])
+        return results, vectors, doc_date
+
+    def _embed_batch(self, batch: List[Document], filename: str, vectors: Dict[str, np.ndarray],
+                     is_known: Callable[[str], bool]):
+        todo = {}
+        for doc in batch:
+            digest = HybridStore.chunk_digest(filename, doc.page_content)
+            if digest not in vectors and not is_known(digest):
+                todo[digest] = doc.page_content
+        if todo:
+            start = time.perf_counter()
+            for digest, vector in zip(todo, self.embeddings.encode_documents(list(todo.values()))):
+                vectors[digest] = vector
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="ingest_embed_batch")
@@ -0,0 +1,275 @@
+import os
+import time
+import queue
+import shutil
+import threading
+import multiprocessing
+try:
+    import fcntl
+except ImportError:  # Windows : un seul worker uvicorn
+    fcntl = None
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from src.config import Config
+from src.corpus import CorpusManager, build_shard_version, make_doc_id
+from src.telemetry import REGISTRY, STAGE_SECONDS
+
+JOB_STATES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+
+def ingestion_worker(job_id: str, tasks: List[dict], root: str, events):
+    """
+    Point d'entrée du processus d'ingestion. Chaque PDF est construit dans une nouvelle version
+    de shard (voir build_shard_version) ; le serveur la met en service dès l'évènement "shard".
+    Un arrêt brutal (annulation) ne laisse donc jamais un shard en service à moitié écrit.
+    """
+    # Imports ici : le processus parent n'a pas besoin du client LLM
+    from src.contextual import ContextualProcessor
+    from src.models import ModelFactory
+
+    try:
+        processor = ContextualProcessor()
+        embeddings = ModelFactory.get_embeddings()
+        for task in tasks:
+            events.put(("file", os.path.basename(task["pdf_path"])))
+            start = time.perf_counter()
+            info = build_shard_version(
+                task["pdf_path"], processor, embeddings, root,
+                current_path=task.get("current_path"),
+                version=job_id,
+                progress=lambda n: events.put(("chunks", n))
+            )
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="ingest_file")
+            # Les métriques du worker rejoignent celles du serveur (exposées par /metrics)
+            events.put(("metrics", REGISTRY.drain()))
+            events.put(("shard", info))
+        events.put(("done", None))
+    except Exception as e:
+        events.put(("error", f"{type(e).__name__}: {e}"))
+
+
+class IngestionJob:
+    def __init__(self, job_id: str, pdf_paths: List[str], removed: List[str], force: bool):
+        self.id = job_id
+        self.pdf_paths = pdf_paths
+        self.removed = removed
+        self.force = force
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.current_file: Optional[str] = None
+        self.files_done = 0
+        self.chunks_done = 0
+        self.process = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "files": [os.path.basename(p) for p in self.pdf_paths],
+            "removed": self.removed,
+            "progress": {
+                "files_total": len(self.pdf_paths),
+                "files_done": self.files_done,
+                "current_file": self.current_file,
+                "chunks_done": self.chunks_done,
+            },
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionJobManager:
+    """
+    File de jobs d'ingestion exécutés un par un dans un processus séparé (ils partagent le
+    budget de l'API LLM). Le serveur continue de répondre avec les shards en service ;
+    chaque PDF terminé est basculé atomiquement via CorpusManager.install_shard.
+    Avec plusieurs workers uvicorn, un seul (celui qui obtient le verrou fichier) mène
+    l'ingestion ; les autres suivent les bascules via CorpusManager.refresh.
+    """
+
+    def __init__(self, corpus: CorpusManager, source_dir: str = None):
+        self.corpus = corpus
+        self.source_dir = source_dir or Config.CORPUS_SOURCE_DIR
+        self._jobs: Dict[str, IngestionJob] = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._counter = 0
+        # spawn : le worker ne doit pas hériter des threads (et de torch) du serveur
+        self._context = multiprocessing.get_context("spawn")
+        self._dispatcher = None
+        self._lock_file = None
+        self.is_leader = False
+
+    def _acquire_leadership(self) -> bool:
+        if fcntl is None:
+            return True
+        os.makedirs(self.corpus.root, exist_ok=True)
+        self._lock_file = open(os.path.join(self.corpus.root, ".ingestion.lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def start(self) -> bool:
+        """Démarre la file si ce processus obtient la main sur l'ingestion ; renvoie is_leader."""
+        if self._dispatcher is None and self._acquire_leadership():
+            self.is_leader = True
+            self._dispatcher = threading.Thread(target=self._run, name="ingestion-jobs", daemon=True)
+            self._dispatcher.start()
+        return self.is_leader
+
+    def stop(self):
+        with self._lock:
+            running = [job for job in self._jobs.values() if job.status == "running"]
+        for job in running:
+            self.cancel(job.id)
+
+    # --- API ---
+    def submit(self, filenames: List[str] = None, force: bool = False, prune: bool = False) -> IngestionJob:
+        """
+        Sans `filenames` : synchronisation du dossier source (nouveaux et modifiés ; disparus
+        seulement avec `prune`, voir CorpusManager.plan_sync).
+        Sinon : ingestion des PDF indiqués (noms relatifs au dossier source).
+        """
+        if not self.is_leader:
+            raise RuntimeError("L'ingestion est menée par un autre worker : réessayez.")
+        if filenames:
+            pdf_paths = [os.path.join(self.source_dir, os.path.basename(name)) for name in filenames]
+            missing = [p for p in pdf_paths if not os.path.isfile(p)]
+            if missing:
+                raise FileNotFoundError(f"PDF introuvable(s) : {', '.join(missing)}")
+            removed = []
+        else:
+            pdf_paths, removed = self.corpus.plan_sync(self.source_dir, prune)
+            force = False
+
+        with self._lock:
+            self._counter += 1
+            job = IngestionJob(f"{int(time.time())}-{self._counter}", pdf_paths, removed, force)
+            self._jobs[job.id] = job
+            # On ne garde qu'un historique borné des jobs terminés
+            finished = [j.id for j in self._jobs.values() if j.status in FINISHED_STATES]
+            for job_id in finished[:max(0, len(finished) - Config.INGEST_JOB_HISTORY)]:
+                del self._jobs[job_id]
+        self._queue.put(job.id)
+        print(f"📥 Job d'ingestion {job.id} : {len(pdf_paths)} PDF, {len(removed)} retrait(s)")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestionJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        """Annule un job en attente ou en cours. False s'il est déjà terminé."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED_STATES:
+                return False
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            process = job.process
+        if process is not None and process.is_alive():
+            # Sûr : le worker n'écrit que dans des versions de shard pas encore en service
+            process.terminate()
+        print(f"🛑 Job d'ingestion {job_id} annulé")
+        return True
+
+    # --- Exécution ---
+    def _run(self):
+        while True:
+            job = self._jobs.get(self._queue.get())
+            if job is None or job.status != "queued":
+                continue
+            try:
+                self._execute(job)
+            except Exception as e:
+                job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+                job.finished_at = time.time()
+                print(f"❌ Job d'ingestion {job.id} en échec : {job.error}")
+
+    def _execute(self, job: IngestionJob):
+        job.status, job.started_at = "running", time.time()
+        for doc_id in job.removed:
+            self.corpus.remove(doc_id)
+
+        tasks = [
+            {"pdf_path": path, "current_path": self.corpus.documents.get(make_doc_id(path), {}).get("path")}
+            for path in job.pdf_paths
+            if job.force or not self.corpus.is_current(path)
+        ]
+        job.files_done = len(job.pdf_paths) - len(tasks)
+        if tasks:
+            self._run_worker(job, tasks)
+        if job.status == "running":
+            job.status, job.current_file = "succeeded", None
+        job.finished_at = job.finished_at or time.time()
+        print(f"🏁 Job d'ingestion {job.id} : {job.status}")
+
+    def _run_worker(self, job: IngestionJob, tasks: List[dict]):
+        events = self._context.Queue()
+        process = self._context.Process(
+            target=ingestion_worker,
+            args=(job.id, tasks, self.corpus.root, events),
+            name=f"ingestion-{job.id}",
+            daemon=True
+        )
+        with self._lock:
+            if job.status != "running":
+                return
+            job.process = process
+            process.start()
+
+        finished = False
+        while not finished:
+            try:
+                kind, payload = events.get(timeout=0.5)
+            except queue.Empty:
+                if not process.is_alive():
+                    break
+                continue
+            if job.status == "cancelled":
+                break
+            if kind == "file":
+                job.current_file, job.chunks_done = payload, 0
+            elif kind == "chunks":
+                job.chunks_done = payload
+            elif kind == "metrics":
+                REGISTRY.merge(payload)
+            elif kind == "shard":
+                self.corpus.install_shard(payload)
+                job.files_done += 1
+            elif kind == "error":
+                job.status, job.error = "failed", payload
+                finished = True
+            elif kind == "done":
+                finished = True
+
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        if job.status == "running" and not finished:
+            job.status, job.error = "failed", f"Worker arrêté (code {process.exitcode})"
+        if job.status in ("failed", "cancelled"):
+            self._cleanup_staging(job)
+
+    def _cleanup_staging(self, job: IngestionJob):
+        """Supprime les versions de shard que le job n'a pas pu mettre en service."""
+        live = {os.path.abspath(info["path"]) for info in self.corpus.documents.values()}
+        for path in job.pdf_paths:
+            staging = os.path.join(self.corpus.root, f"{make_doc_id(path)}@{job.id}")
+            if os.path.abspath(staging) not in live:
+                shutil.rmtree(staging, ignore_errors=True)
@@ -1,11 +1,14 @@
-from langchain_cohere import ChatCohere
-from langchain_huggingface import HuggingFaceEmbeddings
 from src.config import Config
+from src.embedding_service import EmbeddingService
+from src.rerankers import CohereReranker, CrossEncoderReranker, LazyReranker
 
 class ModelFactory:
     @staticmethod
     def get_llm():
         """Retourne une instance de Cohere Chat Model"""
+        # Import local : langchain_cohere est long à importer et inutile tant qu'on ne génère rien
+        from langchain_cohere import ChatCohere
+
         if not Config.COHERE_API_KEY:
             raise ValueError("COHERE_API_KEY manquante dans .env")
         
@@ -18,4 +21,38 @@ class ModelFactory:
     @staticmethod
     def get_embeddings():
         # On peut garder les embeddings gratuits ou passer à CohereEmbeddings
-        return HuggingFaceEmbeddings(model_name=Config.EMBEDDING_MODEL_NAME)
\ No newline at end of file
+        # EmbeddingService : micro-batching + cache LRU autour de sentence-transformers
+        return EmbeddingService(
+            model_name=Config.EMBEDDING_MODEL_NAME,
+            device=Config.EMBEDDING_DEVICE,
+            batch_size=Config.EMBEDDING_BATCH_SIZE,
+            max_batch_wait_ms=Config.EMBEDDING_BATCH_WAIT_MS,
+            cache_size=Config.EMBEDDING_CACHE_SIZE,
+            num_threads=Config.EMBEDDING_NUM_THREADS,
+            normalize=Config.EMBEDDING_NORMALIZE
+        )
+
+    @staticmethod
+    def get_reranker(backend: str = None, lazy: bool = False):
+        """
+        Retourne le reranker configuré, ou None s'il est désactivé / indisponible.
+        `lazy=True` : renvoie un LazyReranker, construit au premier usage.
+        """
+        backend = backend or Config.RERANKER_BACKEND
+        if lazy and backend in ("cohere", "cross-encoder"):
+            return LazyReranker(backend, lambda: ModelFactory.get_reranker(backend))
+        try:
+            if backend == "cohere":
+                return CohereReranker(Config.COHERE_API_KEY, Config.COHERE_RERANK_MODEL)
+            if backend == "cross-encoder":
+                return CrossEncoderReranker(
+                    Config.CROSS_ENCODER_MODEL_NAME,
+                    device=Config.EMBEDDING_DEVICE,
+                    batch_size=Config.RERANK_BATCH_SIZE,
+                    max_candidates=Config.RERANK_MAX_CANDIDATES,
+                    backend=Config.CROSS_ENCODER_BACKEND,
+                    quantize=Config.CROSS_ENCODER_QUANTIZE
+                )
+        except Exception as e:
+            print(f"⚠️ Reranker '{backend}' non dispo: {e}")
+        return None
@@ -0,0 +1,103 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Minuscules, espaces compactés, ponctuation finale retirée."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip(" ?!.")
+
+
+class QueryCache:
+    """
+    Cache de réponses à deux niveaux devant la recherche et le LLM :
+      1. exact     : LRU sur (requête normalisée, k, portée)
+      2. sémantique : réutilise une réponse si l'embedding de la requête est à moins de
+                      `similarity_threshold` (cosinus) d'une requête déjà servie avec le même k
+    La portée (`scope`) distingue les requêtes filtrées (ex : filtres sérialisés).
+    Chaque entrée expire après `ttl_seconds`. invalidate() vide tout (appelé quand l'index change).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # Incrémentée à chaque invalidation : une réponse calculée sur l'ancien index est ignorée
+        self.generation = 0
+        self._exact = OrderedDict()      # (query, k, scope) -> (expires_at, value, vector)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get_exact(self, query: str, k: int, scope: str = "") -> Optional[Any]:
+        key = (normalize_query(query), k, scope)
+        with self._lock:
+            entry = self._exact.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._exact.move_to_end(key)
+                self.exact_hits += 1
+                return entry[1]
+            if entry:
+                del self._exact[key]
+            return None
+
+    def get_semantic(self, vector: np.ndarray, k: int, scope: str = "") -> Optional[Any]:
+        """Cherche la requête en cache la plus proche (même k, mêmes filtres, non expirée)."""
+        vector = self._unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            keys, vectors = [], []
+            for key, (expires_at, _, cached_vector) in self._exact.items():
+                if key[1] == k and key[2] == scope and cached_vector is not None and expires_at > now:
+                    keys.append(key)
+                    vectors.append(cached_vector)
+            if vectors:
+                similarities = np.stack(vectors) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self._exact.move_to_end(keys[best])
+                    self.semantic_hits += 1
+                    return self._exact[keys[best]][1]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, k: int, value: Any, vector: np.ndarray = None, generation: int = None,
+            scope: str = ""):
+        key = (normalize_query(query), k, scope)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            cached_vector = self._unit(vector) if vector is not None else None
+            self._exact[key] = (time.monotonic() + self.ttl_seconds, value, cached_vector)
+            self._exact.move_to_end(key)
+            while len(self._exact) > self.max_entries:
+                self._exact.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._exact.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._exact),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "generation": self.generation,
+            }
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
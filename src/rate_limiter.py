@@ -0,0 +1,73 @@
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Seau à jetons thread-safe : `capacity` jetons max, rechargé de `rate_per_minute` par minute."""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1.0):
+        """Bloque jusqu'à ce que `amount` jetons soient disponibles, puis les consomme."""
+        # Une demande plus grosse que le seau ne pourrait jamais passer
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter:
+    """Combine un budget requêtes/minute et un budget tokens/minute (limites de l'API Cohere)."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens: int):
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimation grossière (~4 caractères par token), suffisante pour le budget."""
+    return max(1, len(text) // 4)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Détecte une erreur 429, quel que soit le client qui l'a levée."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "too many requests" in message or "rate limit" in message
+
+
+def call_with_backoff(fn, max_retries: int, base_delay: float, max_delay: float):
+    """Appelle `fn` et réessaie les 429 avec un backoff exponentiel à jitter complet."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt == max_retries or not is_rate_limit_error(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            print(f"⏳ 429 reçu, nouvel essai dans {delay:.1f}s ({attempt + 1}/{max_retries})")
+            time.sleep(delay)
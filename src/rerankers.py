@@ -0,0 +1,142 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+
+class BaseReranker:
+    """Interface commune : `rerank` renvoie les `top_n` meilleurs (document, score), score décroissant."""
+
+    name = "base"
+
+    def rerank(self, query: str, documents: List[Document], top_n: int) -> List[Tuple[Document, float]]:
+        raise NotImplementedError
+
+    async def arerank(self, query: str, documents: List[Document], top_n: int,
+                      executor: Executor = None) -> List[Tuple[Document, float]]:
+        # Par défaut : version synchrone dans un thread (les backends réseau surchargent)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self.rerank, query, documents, top_n)
+
+
+class LazyReranker(BaseReranker):
+    """
+    Reranker construit au premier appel (ou par warmup) : le démarrage ne paie ni l'import
+    du SDK ni le chargement du modèle. Si la construction échoue, il se comporte comme
+    "pas de reranker" (bool(reranker) est faux) et la recherche garde l'ordre de la fusion.
+    """
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self._factory = factory
+        self._reranker = None
+        self._failed = False
+        self._lock = threading.Lock()
+        self.load_seconds = None
+
+    def _get(self) -> BaseReranker:
+        if self._reranker is None and not self._failed:
+            with self._lock:
+                if self._reranker is None and not self._failed:
+                    start = time.perf_counter()
+                    self._reranker = self._factory()
+                    self._failed = self._reranker is None
+                    self.load_seconds = time.perf_counter() - start
+        if self._reranker is None:
+            raise RuntimeError(f"Reranker '{self.name}' indisponible")
+        return self._reranker
+
+    def __bool__(self):
+        return not self._failed
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._reranker is not None
+
+    def warmup(self):
+        try:
+            self._get()
+        except RuntimeError:
+            pass
+
+    def rerank(self, query, documents, top_n):
+        return self._get().rerank(query, documents, top_n)
+
+    async def arerank(self, query, documents, top_n, executor=None):
+        if not self.is_loaded:
+            # Premier appel : construction dans le pool, pas dans l'event loop
+            await asyncio.get_running_loop().run_in_executor(executor, self.warmup)
+        return await self._get().arerank(query, documents, top_n, executor=executor)
+
+
+class CohereReranker(BaseReranker):
+    """Reranking distant via l'API Cohere (clients synchrone et asynchrone)."""
+
+    name = "cohere"
+
+    def __init__(self, api_key: str, model: str):
+        import cohere
+
+        if not api_key:
+            raise ValueError("COHERE_API_KEY manquante dans .env")
+        self.model = model
+        self.client = cohere.ClientV2(api_key=api_key)
+        self.async_client = cohere.AsyncClientV2(api_key=api_key)
+
+    def rerank(self, query, documents, top_n):
+        if not documents:
+            return []
+        response = self.client.rerank(
+            model=self.model, query=query, documents=[d.page_content for d in documents], top_n=top_n
+        )
+        return [(documents[r.index], float(r.relevance_score)) for r in response.results]
+
+    async def arerank(self, query, documents, top_n, executor=None):
+        if not documents:
+            return []
+        response = await self.async_client.rerank(
+            model=self.model, query=query, documents=[d.page_content for d in documents], top_n=top_n
+        )
+        return [(documents[r.index], float(r.relevance_score)) for r in response.results]
+
+
+class CrossEncoderReranker(BaseReranker):
+    """
+    Reranking local sur CPU avec un cross-encoder (ex : MiniLM entraîné sur MS MARCO).
+    Pas d'appel réseau ; les candidats sont scorés par batchs et plafonnés à `max_candidates`.
+    `backend="onnx"` utilise ONNX Runtime ; `quantize=True` applique une quantification int8
+    dynamique des couches linéaires (backend torch).
+    """
+
+    name = "cross-encoder"
+
+    def __init__(self, model_name: str, device: str = "cpu", batch_size: int = 16,
+                 max_candidates: int = 20, backend: str = "torch", quantize: bool = False):
+        from sentence_transformers import CrossEncoder
+
+        kwargs = {"device": device}
+        if backend != "torch":
+            kwargs["backend"] = backend
+        self.model = CrossEncoder(model_name, **kwargs)
+        if quantize and backend == "torch":
+            import torch
+            self.model.model = torch.quantization.quantize_dynamic(
+                self.model.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.batch_size = batch_size
+        self.max_candidates = max_candidates
+
+    def rerank(self, query, documents, top_n):
+        documents = documents[:self.max_candidates]
+        if not documents:
+            return []
+        scores = self.model.predict(
+            [(query, d.page_content) for d in documents],
+            batch_size=self.batch_size,
+            show_progress_bar=False
+        )
+        ranked = sorted(zip(documents, (float(s) for s in scores)), key=lambda x: x[1], reverse=True)
+        return ranked[:top_n]
@@ -0,0 +1,25 @@
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter, TokenTextSplitter
+
+# Module volontairement léger : il est importé par les processus de découpage
+_splitters = {}
+
+
+def make_splitter(strategy: str = "recursive"):
+    if strategy == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    if strategy == "token":
+        # Stratégie 2 : Découpage par tokens (plus précis pour les LLMs)
+        return TokenTextSplitter(chunk_size=256, chunk_overlap=20)
+    raise ValueError("Stratégie inconnue")
+
+
+def split_page(page_content: str, metadata: dict, strategy: str = "recursive") -> List[Tuple[str, dict]]:
+    """Découpe une page ; renvoie des tuples simples (sérialisation rapide entre processus)."""
+    splitter = _splitters.get(strategy)
+    if splitter is None:
+        splitter = _splitters[strategy] = make_splitter(strategy)
+    chunks = splitter.split_documents([Document(page_content=page_content, metadata=metadata)])
+    return [(chunk.page_content, chunk.metadata) for chunk in chunks]
@@ -0,0 +1,231 @@
+import json
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from src.config import Config
+
+# Bornes (secondes) des histogrammes de durée : de la milliseconde (FAISS) à la dizaine de secondes (LLM)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, values: dict):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = self._values.get(key, 0.0) + value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    """Histogramme cumulatif au format Prometheus ; observe() coûte une recherche dichotomique."""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # clé des labels -> [comptes par tranche (+ dernière tranche +Inf), somme, nombre]
+        self._values: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: [list(counts), total, n] for key, (counts, total, n) in self._values.items()}
+
+    def merge(self, values: dict):
+        """Ajoute les observations d'un autre processus (voir Registry.drain)."""
+        with self._lock:
+            for key, (counts, total, n) in values.items():
+                entry = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+                entry[2] += n
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, n) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class Registry:
+    """
+    Métriques d'un processus. Les valeurs tenues ailleurs (cache de réponses, shards...) sont
+    lues au moment du rendu par des collecteurs, sans rien ajouter au chemin des requêtes.
+    Avec plusieurs workers uvicorn, chaque processus expose ses propres séries (label `pid` côté scrape).
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+        self.collectors: List[Callable[[], Iterable[tuple]]] = []
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple]]):
+        """`collector()` renvoie des tuples (nom, type, aide, [(labels, valeur), ...])."""
+        self.collectors.append(collector)
+
+    def drain(self) -> dict:
+        """Instantané puis remise à zéro : un processus d'ingestion envoie ainsi ses deltas au serveur."""
+        snapshot = {}
+        for name, metric in self.metrics.items():
+            snapshot[name] = metric.snapshot()
+            metric.reset()
+        return snapshot
+
+    def merge(self, snapshot: dict):
+        for name, values in snapshot.items():
+            if name in self.metrics:
+                self.metrics[name].merge(values)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        for collector in self.collectors:
+            try:
+                for name, kind, help, samples in collector():
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                    for labels, value in samples:
+                        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value:g}")
+            except Exception as e:
+                print(f"⚠️ Collecteur de métriques en échec : {e}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Durée de chaque étape (embed, faiss, bm25, fusion, rerank, llm, contextualize...)",
+    ("stage",)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_request_seconds", "Durée totale des requêtes par endpoint et issue", ("endpoint", "outcome")
+)
+RERANK_CANDIDATES = REGISTRY.histogram(
+    "rag_rerank_candidates", "Nombre de candidats envoyés au reranker",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)
+)
+PROMPT_TOKENS = REGISTRY.histogram(
+    "rag_prompt_context_tokens", "Tokens de contexte envoyés au LLM (estimation)",
+    buckets=(100, 250, 500, 1000, 1500, 2000, 3000, 5000, 10000)
+)
+RERANKER_FALLBACKS = REGISTRY.counter(
+    "rag_reranker_fallbacks_total", "Recherches servies dans l'ordre de fusion faute de reranker", ("reason",)
+)
+CONTEXTUALIZE_FALLBACKS = REGISTRY.counter(
+    "rag_contextualize_fallbacks_total", "Chunks ingérés sans contexte après une erreur LLM"
+)
+REJECTED_REQUESTS = REGISTRY.counter(
+    "rag_rejected_requests_total", "Requêtes refusées en 429 (file d'attente pleine)"
+)
+
+
+def record_stage(timings: Dict[str, float], stage: str, start: float):
+    """Ajoute la durée écoulée depuis `start` (perf_counter) à timings[stage], si on mesure."""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def observe_stages(spans: Dict[str, float]):
+    """Reporte un dict de durées (clés `<étape>_s`, voir vector_store.record_stage) dans les histogrammes."""
+    for stage, seconds in spans.items():
+        STAGE_SECONDS.observe(seconds, stage=stage[:-2] if stage.endswith("_s") else stage)
+
+
+class Trace:
+    """Trace d'une requête : durée de chaque étape (`spans`) et issue, remplies au fil du traitement."""
+
+    __slots__ = ("endpoint", "spans", "outcome", "start")
+
+    def __init__(self, endpoint: str = ""):
+        self.endpoint = endpoint
+        self.spans: Dict[str, float] = {}
+        self.outcome = "ok"
+        self.start = time.perf_counter()
+
+
+@contextmanager
+def trace_request(endpoint: str):
+    """
+    Ouvre une trace, puis alimente les histogrammes à la sortie (y compris sur erreur).
+    Le détail est journalisé pour une fraction TRACE_SAMPLE_RATE des requêtes et pour toutes
+    les requêtes plus lentes que TRACE_SLOW_SECONDS.
+    """
+    trace = Trace(endpoint)
+    try:
+        yield trace
+    except BaseException as e:
+        # GeneratorExit / CancelledError : client parti en cours de flux
+        trace.outcome = str(getattr(e, "status_code", "error" if isinstance(e, Exception) else "cancelled"))
+        raise
+    finally:
+        total = time.perf_counter() - trace.start
+        REQUEST_SECONDS.observe(total, endpoint=endpoint, outcome=trace.outcome)
+        observe_stages(trace.spans)
+        if total >= Config.TRACE_SLOW_SECONDS or random.random() < Config.TRACE_SAMPLE_RATE:
+            spans = {stage: round(seconds, 5) for stage, seconds in trace.spans.items()}
+            print(f"🔎 Trace {json.dumps({'endpoint': endpoint, 'outcome': trace.outcome, 'total_s': round(total, 5), 'spans': spans})}")
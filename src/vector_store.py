@@ -1,32 +1,192 @@
 import os
 import json  # <--- C'était l'import manquant !
-from typing import List, Dict, Any
+import time
+import asyncio
+import hashlib
+import threading
+from contextlib import nullcontext
+from concurrent.futures import Executor
+from functools import partial
+from typing import List, Dict, Any, Tuple
 
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
-from langchain_cohere import CohereRerank
 from langchain_core.documents import Document
 
-from src.models import ModelFactory
+from src.ann_index import (
+    apply_search_params, build_faiss_index, empty_like, is_exact, reconstruct_vectors, rescore, supports_remove
+)
+from src.bm25_index import BM25Index, search_segments
+from src.chunk_store import ChunkDocstore, ChunkStore
 from src.config import Config
+from src.fusion import fuse
+from src.hierarchy import SectionIndex
+from src.models import ModelFactory
+from src.telemetry import RERANK_CANDIDATES, RERANKER_FALLBACKS, record_stage
+
+# Valeur par défaut distincte de None (None = pas de reranker)
+_DEFAULT = object()
+
+# Lecture FAISS en mmap pour les shards figés (vecteurs partagés entre processus via le page cache)
+# (codes Flat / SQ / HNSW-Flat ; les listes IVF restent chargées en mémoire)
+_MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+
+def embed_queries(embeddings, queries: List[str]) -> np.ndarray:
+    """Matrice des requêtes : un seul encode() pour un lot, cache LRU et micro-batching pour une requête seule."""
+    if len(queries) == 1:
+        return embeddings.encode_query(queries[0]).reshape(1, -1)
+    return embeddings.encode(queries)
+
+class RerankedSearch:
+    """
+    Étape commune de reranking et de formatage des résultats.
+    Les sous-classes fournissent `retrieve_candidates(query, k, query_vector=None, **filtres)`,
+    sa version par lot `retrieve_candidates_batch(queries, k, query_vectors=None, **filtres)`
+    (candidats triés par fusion) et l'attribut `reranker`.
+    """
+
+    @staticmethod
+    def _format_result(doc: Document, score: float, default_method: str = None) -> Dict[str, Any]:
+        return {
+            "chunk_id": doc.metadata.get("chunk_id"),
+            "global_id": doc.metadata.get("global_id"),
+            "doc_id": doc.metadata.get("doc_id"),
+            "page": doc.metadata.get("page"),
+            "content": doc.page_content,
+            "score": round(float(score), 4),
+            "source_method": doc.metadata.get("retrieval_source", default_method),
+            "section": doc.metadata.get("section"),
+            # Fenêtre de phrases qui a fait retenir le chunk (recherche hiérarchique)
+            "match": doc.page_content[span[0]:span[1]] if (span := doc.metadata.get("matched_span")) else None,
+        }
+
+    def _fallback_results(self, candidates: List[Document], k: int) -> List[Dict[str, Any]]:
+        # Fallback si pas de Rerank : les candidats sont déjà classés par la fusion
+        return [self._format_result(d, d.metadata.get("fusion_score", 0.0)) for d in candidates[:k]]
+
+    def _rerank_enabled(self, candidates: List[Document]) -> bool:
+        """Compte les recherches servies sans reranker alors qu'un reranker est configuré."""
+        if self.reranker is not None and not self.reranker:
+            RERANKER_FALLBACKS.inc(reason="unavailable")
+        if not (self.reranker and candidates):
+            return False
+        RERANK_CANDIDATES.observe(len(candidates))
+        return True
+
+    def _rerank(self, query: str, candidates: List[Document], k: int,
+                timings: Dict[str, float] = None) -> List[Dict[str, Any]]:
+        # D. Reranking
+        if self._rerank_enabled(candidates):
+            start = time.perf_counter()
+            try:
+                reranked = self.reranker.rerank(query, candidates, k)
+                return [self._format_result(doc, score, "hybrid_reranked") for doc, score in reranked]
+            except Exception as e:
+                print(f"⚠️ Erreur Rerank: {e}")
+                RERANKER_FALLBACKS.inc(reason="error")
+            finally:
+                record_stage(timings, "rerank_s", start)
+
+        return self._fallback_results(candidates, k)
 
-class HybridStore:
-    def __init__(self):
-        self.embeddings = ModelFactory.get_embeddings()
+    async def _arerank(self, query: str, candidates: List[Document], k: int, executor: Executor = None,
+                       timings: Dict[str, float] = None) -> List[Dict[str, Any]]:
+        if self._rerank_enabled(candidates):
+            start = time.perf_counter()
+            try:
+                reranked = await self.reranker.arerank(query, candidates, k, executor=executor)
+                return [self._format_result(doc, score, "hybrid_reranked") for doc, score in reranked]
+            except Exception as e:
+                print(f"⚠️ Erreur Rerank: {e}")
+                RERANKER_FALLBACKS.inc(reason="error")
+            finally:
+                record_stage(timings, "rerank_s", start)
+
+        return self._fallback_results(candidates, k)
+
+    def search(self, query: str, k: int = 5, timings: Dict[str, float] = None, **filters) -> List[Dict[str, Any]]:
+        """Recherche hybride avec Reranking. `timings` reçoit la durée de chaque étape (voir record_stage)."""
+        candidates = self.retrieve_candidates(query, k, timings=timings, **filters)
+        return self._rerank(query, candidates, k, timings)
+
+    def search_batch(self, queries: List[str], k: int = 5, timings: Dict[str, float] = None,
+                     **filters) -> List[List[Dict[str, Any]]]:
+        """search() pour un lot de requêtes (mêmes filtres) : voir retrieve_candidates_batch."""
+        batches = self.retrieve_candidates_batch(queries, k, timings=timings, **filters)
+        return [self._rerank(query, candidates, k, timings) for query, candidates in zip(queries, batches)]
+
+    async def asearch(self, query: str, k: int = 5, executor: Executor = None,
+                      query_vector: np.ndarray = None, timings: Dict[str, float] = None,
+                      **filters) -> List[Dict[str, Any]]:
+        """
+        Version asynchrone de search() : FAISS/BM25 tournent dans `executor` (pool borné),
+        le reranking passe par arerank (client asynchrone pour Cohere, pool pour le cross-encoder).
+        L'event loop n'est jamais bloquée.
+        """
+        loop = asyncio.get_running_loop()
+        candidates = await loop.run_in_executor(
+            executor, partial(self.retrieve_candidates, query, k, query_vector=query_vector, timings=timings,
+                              **filters)
+        )
+        return await self._arerank(query, candidates, k, executor, timings)
+
+    async def asearch_batch(self, queries: List[str], k: int = 5, executor: Executor = None,
+                            query_vectors: np.ndarray = None, concurrency: int = 4,
+                            timings: Dict[str, float] = None, **filters) -> List[List[Dict[str, Any]]]:
+        """
+        Version asynchrone de search_batch() : les candidats de tout le lot sont calculés en une
+        fois dans `executor`, puis reranqués avec au plus `concurrency` appels simultanés.
+        """
+        loop = asyncio.get_running_loop()
+        batches = await loop.run_in_executor(
+            executor, partial(self.retrieve_candidates_batch, queries, k, query_vectors, timings=timings, **filters)
+        )
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def rerank(query, candidates):
+            async with semaphore:
+                return await self._arerank(query, candidates, k, executor, timings)
+
+        return await asyncio.gather(*(rerank(query, candidates) for query, candidates in zip(queries, batches)))
+
+class HybridStore(RerankedSearch):
+    def __init__(self, index_path: str = None, embeddings=None, reranker=_DEFAULT):
+        # Les shards d'un corpus partagent le même modèle d'embedding et le même reranker
+        self.embeddings = embeddings or ModelFactory.get_embeddings()
         self.vector_db = None
-        self.bm25_retriever = None
-        # Chemins fixes pour la persistance
-        self.index_path = "data/faiss_index"
-        self.metadata_path = "data/faiss_index/metadata.json"
+        self.bm25_index = None
+        # Segment BM25 des chunks ajoutés depuis la dernière compaction (fusionné à la recherche,
+        # voir bm25_index.search_segments) : ils sont trouvables par BM25 dès l'upsert
+        self.bm25_delta = None
+        self._bm25_delta_keys = []
+        # Vecteurs float32 (ordre des positions FAISS) gardés quand l'index est quantifié :
+        # rescoring des candidats et compaction sans perte. En mmap pour un shard chargé.
+        self.vectors = None
+        # Index hiérarchique (sections -> fenêtres de phrases -> chunks), voir build_hierarchy
+        self.hierarchy = None
+        # Chemins pour la persistance
+        self.index_path = index_path or Config.FAISS_INDEX_PATH
+        self.metadata_path = os.path.join(self.index_path, "metadata.json")
+        self.faiss_path = os.path.join(self.index_path, "index.faiss")
+        self.bm25_path = os.path.join(self.index_path, "bm25")
+        # Journal des chunks ajoutés depuis la dernière écriture complète (voir _append_log)
+        self.append_log_path = os.path.join(self.index_path, "append_log.jsonl")
+        self.append_vectors_path = os.path.join(self.index_path, "append_log.f32")
+        # Manifeste : {filename: [chunk_key, ...]} + chunks supprimés en attente de compaction
+        self.manifest = {"filename": None, "documents": {}, "tombstones": []}
+        self.tombstones = set()
+        self._lock = threading.RLock()
+        # Verrou pris par la recherche ; supprimé par freeze() quand plus rien n'écrit dans le shard
+        self._read_lock = self._lock
+        self.frozen = False
+        self._compaction_thread = None
+        self._compaction_pending = False
+        # Callbacks appelés quand le contenu de l'index change (invalidation des caches)
+        self._index_listeners = []
         
-        try:
-            self.reranker = CohereRerank(
-                cohere_api_key=Config.COHERE_API_KEY, 
-                model="rerank-english-v3.0"
-            )
-        except Exception as e:
-            print(f"⚠️ Cohere Rerank non dispo: {e}")
-            self.reranker = None
+        # Reranker interchangeable (Cohere, cross-encoder local ou aucun) selon Config
+        self.reranker = ModelFactory.get_reranker() if reranker is _DEFAULT else reranker
 
     def get_indexed_filename(self):
         """Récupère le nom du fichier actuellement stocké sur le disque."""
@@ -35,105 +195,674 @@ class HybridStore:
                 return json.load(f).get("filename")
         return None
 
-    def build_index(self, documents: List[Document], filename: str):
-        """Construit, sauvegarde l'index et enregistre le nom du fichier."""
-        print(f"🏗️ Ingestion complète pour {filename}...")
-        
-        # 1. Création FAISS
-        self.vector_db = FAISS.from_documents(documents, self.embeddings)
-        
-        # 2. Sauvegarde Locale
+    @staticmethod
+    def chunk_digest(filename: str, content: str) -> str:
+        return hashlib.sha256(f"{filename}\0{content}".encode("utf-8")).hexdigest()[:24]
+
+    def has_chunk(self, key: str) -> bool:
+        """Vrai si ce chunk est déjà embeddé dans l'index (utile pour ne pas le ré-embedder)."""
+        return self.vector_db is not None and key in self.vector_db.docstore._dict
+
+    @classmethod
+    def _assign_chunk_keys(cls, documents: List[Document], filename: str) -> List[str]:
+        """Clé stable par chunk = hash(fichier + contenu). Un chunk inchangé garde sa clé."""
+        keys, seen = [], {}
+        for doc in documents:
+            digest = cls.chunk_digest(filename, doc.page_content)
+            # Deux chunks identiques dans le même fichier : on les distingue par leur rang
+            n = seen.get(digest, 0)
+            seen[digest] = n + 1
+            key = digest if n == 0 else f"{digest}-{n}"
+            doc.metadata["chunk_key"] = key
+            doc.metadata["source_file"] = filename
+            keys.append(key)
+        return keys
+
+    def freeze(self):
+        """
+        Rend le shard immuable : la recherche ne prend plus de verrou.
+        Un shard figé est remplacé en bloc (voir CorpusManager.install_shard), jamais modifié.
+        """
+        self.wait_for_compaction()
+        self.frozen = True
+        self._read_lock = nullcontext()
+
+    def _check_writable(self):
+        if self.frozen:
+            raise RuntimeError(f"Shard figé ({self.index_path}) : construire une nouvelle version")
+
+    def _save(self):
+        """
+        Écriture complète : FAISS + ChunkStore + manifeste, puis le journal d'ajouts est vidé
+        (appelé sous self._lock ; O(corpus) : construction, compaction, index hiérarchique).
+        """
         if not os.path.exists(self.index_path):
             os.makedirs(self.index_path)
-            
-        self.vector_db.save_local(self.index_path)
-        
-        # 3. Sauvegarde des métadonnées (C'est ici que ça plantait)
-        with open(self.metadata_path, "w") as f:
-            json.dump({"filename": filename}, f)
-            
-        # 4. Création BM25
-        self.bm25_retriever = BM25Retriever.from_documents(documents)
+        # Formats sans pickle : index FAISS natif + ChunkStore en colonnes
+        faiss.write_index(self.vector_db.index, self.faiss_path + ".tmp")
+        os.replace(self.faiss_path + ".tmp", self.faiss_path)
+        docstore = self.vector_db.docstore._dict
+        ChunkStore.write(self.index_path, (
+            (key, docstore[key]) for _, key in sorted(self.vector_db.index_to_docstore_id.items())
+        ), vectors=self.vectors)
+        # Chunks écrits dans le ChunkStore mais pas encore dans l'index BM25 de base
+        self.manifest["bm25_pending"] = list(self._bm25_delta_keys)
+        self._save_manifest()
+        for path in (self.append_log_path, self.append_vectors_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _save_manifest(self):
+        """Manifeste seul (documents, tombstones) : petit, réécrit à chaque upsert (sous self._lock)."""
+        if not os.path.exists(self.index_path):
+            os.makedirs(self.index_path)
+        self.manifest["tombstones"] = sorted(self.tombstones)
+        with open(self.metadata_path + ".tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(self.metadata_path + ".tmp", self.metadata_path)
+
+    def _append_log(self, keys: List[str], documents: List[Document], vectors: np.ndarray):
+        """
+        Persiste les chunks ajoutés par un upsert sans réécrire l'index : vecteurs à la fin de
+        append_log.f32, une ligne JSON par chunk (avec la ligne de son vecteur) dans append_log.jsonl.
+        Rejoué au chargement (voir _replay_append_log), vidé par la prochaine écriture complète.
+        """
+        if not os.path.exists(self.index_path):
+            os.makedirs(self.index_path)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with open(self.append_vectors_path, "ab") as f:
+            first_row = f.tell() // (4 * vectors.shape[1])
+            f.write(vectors.tobytes())
+        with open(self.append_log_path, "a", encoding="utf-8") as f:
+            for row, (key, doc) in enumerate(zip(keys, documents), start=first_row):
+                f.write(json.dumps(
+                    {"key": key, "row": row, "text": doc.page_content, "metadata": doc.metadata},
+                    ensure_ascii=False, default=str
+                ) + "\n")
+
+    def _append_log_updates(self, documents: Dict[str, Document]):
+        """Métadonnées réécrites de chunks déjà indexés : entrées sans vecteur du journal d'ajouts."""
+        with open(self.append_log_path, "a", encoding="utf-8") as f:
+            for key, doc in documents.items():
+                f.write(json.dumps(
+                    {"key": key, "update": True, "metadata": doc.metadata}, ensure_ascii=False, default=str
+                ) + "\n")
+
+    def _replay_append_log(self) -> List[str]:
+        """Ajoute à l'index chargé les chunks du journal encore référencés par le manifeste."""
+        if not os.path.exists(self.append_log_path):
+            return []
+        dim = self.vector_db.index.d
+        vectors = np.zeros(0, dtype=np.float32)
+        if os.path.exists(self.append_vectors_path):
+            vectors = np.fromfile(self.append_vectors_path, dtype=np.float32)
+        # Dernier vecteur incomplet (arrêt pendant l'écriture) ignoré
+        vectors = vectors[:len(vectors) - len(vectors) % dim].reshape(-1, dim)
+        referenced = {key for keys in self.manifest["documents"].values() for key in keys}
+        docstore = self.vector_db.docstore._dict
+        entries, updates = {}, {}
+        with open(self.append_log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # dernière ligne tronquée (arrêt pendant l'écriture)
+                key = entry["key"]
+                if entry.get("update"):
+                    updates[key] = entry["metadata"]
+                elif entry["row"] < len(vectors) and key in referenced and key not in docstore:
+                    entries[key] = entry
+        if entries:
+            rows = [entry["row"] for entry in entries.values()]
+            self.vector_db.add_embeddings(
+                zip([entry["text"] for entry in entries.values()], vectors[rows]),
+                metadatas=[entry["metadata"] for entry in entries.values()],
+                ids=list(entries)
+            )
+            if self.vectors is not None:
+                self.vectors = np.vstack([self.vectors, vectors[rows]])
+            print(f"📜 {len(entries)} chunk(s) rejoué(s) depuis le journal d'ajouts ({self.index_path})")
+        # Les mises à jour suivent les ajouts qu'elles concernent dans le journal
+        for key, metadata in updates.items():
+            if key in docstore:
+                docstore[key] = Document(page_content=docstore[key].page_content, metadata=metadata)
+        return list(entries)
+
+    def _rebuild_bm25_delta(self):
+        """Segment BM25 des chunks ajoutés depuis la dernière compaction (O(delta), sous self._lock)."""
+        docstore = self.vector_db.docstore._dict
+        self._bm25_delta_keys = [key for key in dict.fromkeys(self._bm25_delta_keys) if key in docstore]
+        self.bm25_delta = BM25Index.build(
+            [docstore[key].page_content for key in self._bm25_delta_keys], self._bm25_delta_keys
+        ) if self._bm25_delta_keys else None
+
+    def add_index_listener(self, callback):
+        self._index_listeners.append(callback)
+
+    def _notify_index_changed(self):
+        for callback in self._index_listeners:
+            callback()
+
+    def _live_documents(self) -> List[Document]:
+        return [
+            doc for doc_id, doc in self.vector_db.docstore._dict.items()
+            if doc_id not in self.tombstones
+        ]
+
+    def _wrap_index(self, index, docs_by_key: Dict[str, Document]) -> FAISS:
+        """
+        Enveloppe LangChain autour d'un index FAISS déjà rempli (ordre d'insertion = ordre du dict).
+        `docs_by_key` est un dict ou un ChunkStore chargé en mmap (positions lues dans ses colonnes).
+        """
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=ChunkDocstore(docs_by_key),
+            index_to_docstore_id=(
+                docs_by_key.position_keys() if isinstance(docs_by_key, ChunkStore) else dict(enumerate(docs_by_key))
+            )
+        )
+
+    def _embed(self, documents: List[Document], keys: List[str], vectors: Dict[str, np.ndarray] = None) -> np.ndarray:
+        """
+        Vecteurs des documents : ceux fournis (déjà calculés en amont, indexés par chunk_digest)
+        sinon embedding en batch.
+        """
+        vectors = vectors or {}
+        # Les doublons "<digest>-n" ont le même contenu, donc le même vecteur
+        digests = [key.split("-", 1)[0] for key in keys]
+        out = np.empty((len(documents), self.embeddings.dimension), dtype=np.float32)
+        missing = [i for i, digest in enumerate(digests) if digest not in vectors]
+        if missing:
+            out[missing] = self.embeddings.encode_documents([documents[i].page_content for i in missing])
+        for i, digest in enumerate(digests):
+            if digest in vectors:
+                out[i] = vectors[digest]
+        return out
+
+    def build_index(self, documents: List[Document], filename: str, vectors: Dict[str, np.ndarray] = None):
+        """Construit, sauvegarde l'index et enregistre le nom du fichier (`vectors` : voir _embed)."""
+        self._check_writable()
+        print(f"🏗️ Ingestion complète pour {filename}...")
+        keys = self._assign_chunk_keys(documents, filename)
+        vectors = self._embed(documents, keys, vectors)
+
+        with self._lock:
+            # 1. Création FAISS (type d'index choisi dans Config)
+            index = build_faiss_index(
+                vectors,
+                index_type=Config.FAISS_INDEX_TYPE,
+                storage=Config.FAISS_STORAGE,
+                nlist=Config.FAISS_IVF_NLIST,
+                nprobe=Config.FAISS_IVF_NPROBE,
+                hnsw_m=Config.FAISS_HNSW_M,
+                ef_construction=Config.FAISS_HNSW_EF_CONSTRUCTION,
+                ef_search=Config.FAISS_HNSW_EF_SEARCH,
+                pq_m=Config.FAISS_PQ_M
+            )
+            self.vector_db = self._wrap_index(index, dict(zip(keys, documents)))
+            self.vectors = None if is_exact(index) else vectors
+
+            # 2. Sauvegarde Locale (index + manifeste)
+            self.manifest = {"filename": filename, "documents": {filename: keys}, "tombstones": []}
+            self.tombstones = set()
+            self._bm25_delta_keys, self.bm25_delta = [], None
+            self._save()
+
+            # 3. Création BM25 (persisté à côté de FAISS)
+            self.bm25_index = BM25Index.build([d.page_content for d in documents], keys)
+            self.bm25_index.save(self.bm25_path)
+        self._notify_index_changed()
         print(f"✅ Index sauvegardé pour {filename}")
 
-    def load_index(self, documents: List[Document] = None):
-        """Charge l'index existant et initialise BM25."""
+    def upsert_document(self, documents: List[Document], filename: str, vectors: Dict[str, np.ndarray] = None):
+        """
+        Ingestion incrémentale d'un document : seuls les chunks nouveaux ou modifiés sont embeddés,
+        les chunks disparus sont marqués (tombstones) puis purgés par une compaction en arrière-plan
+        une fois les seuils de compaction_due() franchis.
+        Le coût est proportionnel au changement, pas à la taille du corpus.
+        `vectors` ({chunk_digest: vecteur}) évite de ré-embedder ce qui l'a déjà été en amont.
+        """
+        self._check_writable()
+        if self.vector_db is None:
+            self.build_index(documents, filename, vectors)
+            return
+
+        keys = self._assign_chunk_keys(documents, filename)
+        new_docs = [d for d, key in zip(documents, keys) if not self.has_chunk(key)]
+        new_keys = [key for key in keys if not self.has_chunk(key)]
+        # Embedding hors verrou : les recherches continuent pendant ce temps
+        new_vectors = self._embed(new_docs, new_keys, vectors)
+
+        with self._lock:
+            old_keys = set(self.manifest["documents"].get(filename, []))
+            removed = old_keys - set(keys)
+            # Un chunk revenu à l'identique redevient simplement actif
+            self.tombstones -= set(keys)
+            self.tombstones |= removed
+            # Un chunk inchangé a pu changer de position (chunk_id, page, global_id) ou de date
+            updated = self._refresh_metadata(documents, keys, set(new_keys))
+
+            if new_docs:
+                self.vector_db.add_embeddings(
+                    zip([d.page_content for d in new_docs], new_vectors),
+                    metadatas=[d.metadata for d in new_docs],
+                    ids=new_keys
+                )
+                if self.vectors is not None:
+                    self.vectors = np.vstack([self.vectors, new_vectors])
+                # Cherchables par BM25 tout de suite, sans attendre la compaction
+                self._bm25_delta_keys += new_keys
+                self._rebuild_bm25_delta()
+                # Persistance proportionnelle au changement : journal d'ajouts, pas de réécriture de l'index
+                self._append_log(new_keys, new_docs, new_vectors)
+            if updated:
+                self._append_log_updates(updated)
+
+            self.manifest["documents"][filename] = keys
+            self.manifest["filename"] = filename
+            # Les sections ne couvrent plus les chunks actifs : recherche à plat jusqu'à build_hierarchy
+            if new_docs or removed:
+                self.hierarchy = None
+            self._save_manifest()
+
+        print(f"✅ {filename} : {len(new_docs)} chunks ajoutés, {len(removed)} retirés, "
+              f"{len(keys) - len(new_docs)} inchangés ({len(updated)} déplacés)")
+        if new_docs or removed or updated:
+            self._notify_index_changed()
+        if (new_docs or removed) and self.compaction_due():
+            self.schedule_compaction()
+
+    def _refresh_metadata(self, documents: List[Document], keys: List[str], new_keys: set) -> Dict[str, Document]:
+        """
+        Réécrit dans le docstore les métadonnées des chunks conservés qui ont changé (sous self._lock).
+        Le texte est identique (même clé) : seule la surcouche du ChunkStore est modifiée.
+        """
+        docstore = self.vector_db.docstore._dict
+        updated = {}
+        for doc, key in zip(documents, keys):
+            if key in new_keys or key not in docstore:
+                continue
+            current = docstore[key]
+            if current.metadata != doc.metadata:
+                updated[key] = Document(page_content=current.page_content, metadata=dict(doc.metadata))
+                docstore[key] = updated[key]
+        return updated
+
+    def remove_document(self, filename: str):
+        """Retire un document du corpus (tombstones + compaction différée)."""
+        self._check_writable()
+        with self._lock:
+            keys = self.manifest["documents"].pop(filename, [])
+            self.tombstones |= set(keys)
+            if keys:
+                self.hierarchy = None
+            self._save_manifest()
+        if keys:
+            self._notify_index_changed()
+            if self.compaction_due():
+                self.schedule_compaction()
+
+    def compact(self):
+        """
+        Purge physiquement les tombstones de FAISS, reconstruit BM25 sur les chunks actifs (le
+        segment delta y est replié) et réécrit l'index complet, ce qui vide le journal d'ajouts.
+        """
+        with self._lock:
+            if self.vector_db is None:
+                return
+            live_docs = self._live_documents()
+            covered = {d.metadata["chunk_key"] for d in live_docs}
+
+        # La tokenisation BM25 est la partie lente : on la fait hors du verrou
+        bm25 = BM25Index.build(
+            [d.page_content for d in live_docs],
+            [d.metadata["chunk_key"] for d in live_docs]
+        )
+
+        with self._lock:
+            purged = [doc_id for doc_id in self.tombstones if doc_id in self.vector_db.docstore._dict]
+            if purged and supports_remove(self.vector_db.index):
+                self.vector_db.delete(purged)
+            elif purged:
+                # IVF / HNSW / quantifié : on reconstruit l'index à partir des vecteurs stockés
+                # (sans ré-embedder), en gardant l'entraînement de l'index courant
+                purged_set = set(purged)
+                docstore = self.vector_db.docstore._dict
+                live = [
+                    (position, doc_id)
+                    for position, doc_id in sorted(self.vector_db.index_to_docstore_id.items())
+                    if doc_id not in purged_set
+                ]
+                positions = [p for p, _ in live]
+                if self.vectors is not None:
+                    # Vecteurs float32 d'origine : pas de seconde quantification
+                    vectors = np.asarray(self.vectors[positions], dtype=np.float32)
+                    self.vectors = vectors
+                else:
+                    vectors = reconstruct_vectors(self.vector_db.index, positions)
+                index = empty_like(self.vector_db.index)
+                index.add(vectors)
+                self.vector_db = self._wrap_index(index, {doc_id: docstore[doc_id] for _, doc_id in live})
+            self.tombstones -= set(purged)
+            self.bm25_index = bm25
+            # Chunks ajoutés pendant la compaction : ils restent dans le delta (compaction relancée)
+            self._bm25_delta_keys = [key for key in self._bm25_delta_keys if key not in covered]
+            self._rebuild_bm25_delta()
+            self.bm25_index.save(self.bm25_path)
+            self._save()
+        print(f"🧹 Compaction terminée : {len(purged)} chunks purgés")
+
+    def build_hierarchy(self):
+        """
+        Construit l'index hiérarchique (voir SectionIndex) sur les chunks actifs et le sauvegarde
+        dans le dossier du shard ; les chunks reçoivent leur titre de section (metadata["section"]).
+        Les fenêtres inchangées depuis la version précédente ne sont pas ré-embeddées.
+        """
+        self._check_writable()
+        with self._lock:
+            if self.vector_db is None:
+                return
+            docs = sorted(self._live_documents(), key=lambda d: d.metadata.get("chunk_id") or 0)
+            previous = SectionIndex.load(self.index_path) if SectionIndex.exists(self.index_path) else None
+
+        # Embedding des fenêtres hors verrou
+        hierarchy = SectionIndex.build(
+            docs, self.embeddings, window=Config.HIERARCHY_SENTENCE_WINDOW,
+            max_chunks=Config.HIERARCHY_MAX_SECTION_CHUNKS, previous=previous
+        )
+
+        with self._lock:
+            docstore = self.vector_db.docstore._dict
+            for doc in docs:
+                # Documents décodés à la demande par le ChunkStore : on réécrit l'entrée
+                docstore[doc.metadata["chunk_key"]] = doc
+            self._save()
+            hierarchy.save(self.index_path)
+            self.hierarchy = hierarchy
+        self._notify_index_changed()
+
+    def _load_hierarchy(self):
+        """Index hiérarchique du dossier, s'il couvre exactement les chunks actifs."""
+        if not SectionIndex.exists(self.index_path):
+            return None
+        hierarchy = SectionIndex.load(self.index_path)
+        live = [key for keys in self.manifest["documents"].values() for key in keys]
+        if hierarchy.fingerprint != SectionIndex.make_fingerprint(live):
+            print(f"⚠️ Index hiérarchique périmé ({self.index_path}) : recherche à plat")
+            return None
+        return hierarchy
+
+    def compaction_due(self) -> bool:
+        """
+        Vrai si les tombstones ou le segment delta dépassent les seuils de Config : la compaction
+        est O(corpus), le journal d'ajouts et le delta suffisent tant qu'ils restent petits.
+        """
+        with self._lock:
+            total = max(1, len(self.vector_db.docstore._dict)) if self.vector_db is not None else 1
+            delta = len(self._bm25_delta_keys)
+            return (
+                len(self.tombstones) > Config.COMPACTION_TOMBSTONE_RATIO * total
+                or delta > Config.COMPACTION_DELTA_RATIO * total
+                or delta > Config.COMPACTION_MAX_DELTA_CHUNKS
+            )
+
+    def schedule_compaction(self):
+        """
+        Lance compact() dans un thread de fond (une seule compaction à la fois). Demandée pendant
+        une compaction, elle est relancée à la fin de celle-ci : rien de ce qui a été ajouté
+        entre-temps ne reste hors de l'index BM25 de base.
+        """
+        with self._lock:
+            self._compaction_pending = True
+            if self._compaction_thread is not None:
+                return
+            self._compaction_thread = threading.Thread(target=self._run_compactions, daemon=True)
+            self._compaction_thread.start()
+
+    def _run_compactions(self):
+        while True:
+            with self._lock:
+                if not self._compaction_pending:
+                    self._compaction_thread = None
+                    return
+                self._compaction_pending = False
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"❌ Compaction en échec ({self.index_path}) : {e}")
+
+    def wait_for_compaction(self):
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join()
+
+    def load_index(self, documents: List[Document] = None, read_only: bool = False):
+        """
+        Charge l'index existant et BM25 (`documents` n'est plus nécessaire, gardé pour compatibilité).
+        `read_only` : index FAISS en mmap, pour un shard qui sera figé (voir freeze).
+        """
         if os.path.exists(self.index_path):
             try:
-                self.vector_db = FAISS.load_local(
-                    self.index_path, 
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
-                )
-                # BM25 doit être recréé à partir des documents car il ne se sauvegarde pas seul
-                # Note : Si documents est None, BM25 ne sera pas actif (recherche vectorielle pure)
-                if documents:
-                    self.bm25_retriever = BM25Retriever.from_documents(documents)
-                
+                legacy = not ChunkStore.exists(self.index_path)
+                if legacy:
+                    # Ancien format LangChain (docstore picklé) : chargé en mémoire seulement, les
+                    # fichiers restent intacts (conversion explicite : migrate_index.py)
+                    self.vector_db = FAISS.load_local(
+                        self.index_path,
+                        self.embeddings,
+                        allow_dangerous_deserialization=True
+                    )
+                else:
+                    # Journal d'ajouts à rejouer : l'index doit accepter des ajouts (pas de mmap)
+                    mmap = read_only and Config.FAISS_MMAP and not os.path.exists(self.append_log_path)
+                    flags = _MMAP_FLAGS if mmap else 0
+                    index = faiss.read_index(self.faiss_path, flags)
+                    chunks = ChunkStore.load(self.index_path)
+                    self.vector_db = self._wrap_index(index, chunks)
+                    self.vectors = None if is_exact(index) else chunks.vectors
+                apply_search_params(self.vector_db.index, Config.FAISS_IVF_NPROBE, Config.FAISS_HNSW_EF_SEARCH)
+                self._load_manifest()
+                replayed = [] if legacy else self._replay_append_log()
+                # BM25 est persisté : rechargement en mmap, sans les documents sources
+                if BM25Index.exists(self.bm25_path):
+                    self.bm25_index = BM25Index.load(self.bm25_path)
+                    # Chunks absents de l'index de base : segment delta jusqu'à la prochaine compaction
+                    self._bm25_delta_keys = self.manifest.get("bm25_pending", []) + replayed
+                    self._rebuild_bm25_delta()
+                else:
+                    # Index créé avant la persistance de BM25 : on le reconstruit depuis le docstore
+                    # FAISS (et on le sauvegarde, sauf pour l'ancien format qui reste en lecture seule)
+                    docs = self._live_documents()
+                    self.bm25_index = BM25Index.build(
+                        [d.page_content for d in docs],
+                        [d.metadata["chunk_key"] for d in docs]
+                    )
+                    if not legacy:
+                        self.bm25_index.save(self.bm25_path)
+                self.hierarchy = self._load_hierarchy()
+
                 return True
             except Exception as e:
                 print(f"❌ Erreur chargement: {e}")
         return False
 
-    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Recherche hybride avec Reranking."""
+    def is_legacy_format(self) -> bool:
+        """Vrai si l'index sur disque est encore au format LangChain picklé (index.pkl)."""
+        return os.path.exists(os.path.join(self.index_path, "index.pkl")) and not ChunkStore.exists(self.index_path)
+
+    def migrate_legacy_format(self):
+        """
+        Écrit l'index chargé (ancien format) au format sans pickle, à côté de index.pkl qui n'est
+        pas supprimé. Action explicite uniquement (migrate_index.py), jamais au chargement.
+        """
+        self._check_writable()
+        with self._lock:
+            self._save()
+        self.bm25_index.save(self.bm25_path)
+        print(f"♻️ {self.index_path} converti au format sans pickle (index.pkl conservé)")
+
+    def _load_manifest(self):
+        if os.path.exists(self.metadata_path):
+            with open(self.metadata_path, "r") as f:
+                self.manifest.update(json.load(f))
+        # Ancien format ({"filename": ...} seul) : tout l'index appartient à ce fichier
+        if not self.manifest.get("documents") and self.manifest.get("filename"):
+            for doc_id, doc in self.vector_db.docstore._dict.items():
+                doc.metadata.setdefault("chunk_key", doc_id)
+            self.manifest["documents"] = {
+                self.manifest["filename"]: list(self.vector_db.docstore._dict.keys())
+            }
+        self.tombstones = set(self.manifest.get("tombstones", []))
+
+    def bm25_segments(self) -> List[BM25Index]:
+        return [self.bm25_index, self.bm25_delta]
+
+    def uses_hierarchy(self) -> bool:
+        """Vrai si la recherche vectorielle passe par les fenêtres de phrases (distances d'une autre nature)."""
+        return self.hierarchy is not None and Config.HIERARCHICAL_RETRIEVAL
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Vecteur float32 de la requête (cache LRU + micro-batching de l'EmbeddingService)."""
+        return self.embeddings.encode_query(query)
+
+    def retrieve_candidates(self, query: str, k: int = 5, query_vector: np.ndarray = None,
+                            pages: Tuple[int, int] = None, timings: Dict[str, float] = None) -> List[Document]:
+        """
+        Étapes CPU de la recherche (FAISS + BM25 + fusion), sans reranking.
+        Les candidats sont renvoyés triés par score de fusion décroissant.
+        `query_vector` évite de ré-embedder une requête déjà embeddée (ex : par le cache sémantique).
+        `pages` (première, dernière, numérotées à partir de 1) restreint les chunks retenus.
+        `timings` (optionnel) reçoit la durée de chaque étape : embed_s, faiss_s, bm25_s, fusion_s.
+        """
+        query_vectors = None if query_vector is None else np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        return self.retrieve_candidates_batch([query], k, query_vectors, pages=pages, timings=timings)[0]
+
+    def retrieve_candidates_batch(self, queries: List[str], k: int = 5, query_vectors: np.ndarray = None,
+                                  pages: Tuple[int, int] = None, timings: Dict[str, float] = None,
+                                  bm25_stats: Tuple[Dict[str, float], float] = None) -> List[List[Document]]:
+        """
+        retrieve_candidates() pour plusieurs requêtes : un seul encode() pour toutes les requêtes,
+        une recherche FAISS sur la matrice des requêtes et des scores BM25 calculés par blocs.
+        Les listes de candidats sont renvoyées dans l'ordre des requêtes.
+        `bm25_stats` : statistiques BM25 de tout le corpus (voir CorpusManager.retrieve_candidates_batch).
+        """
         if not self.vector_db:
             raise ValueError("L'index n'est pas prêt.")
+        if not queries:
+            return []
 
         fetch_k = k * 2
-        
-        # A. Recherche Vectorielle (FAISS)
-        vector_docs = self.vector_db.similarity_search_with_score(query, k=fetch_k)
-        
-        # B. Recherche BM25 (Si disponible)
-        bm25_docs = []
-        if self.bm25_retriever:
-            self.bm25_retriever.k = fetch_k
-            bm25_docs = self.bm25_retriever.invoke(query)
-
-        # C. Fusion
-        unique_docs = {}
-        for doc, score in vector_docs:
-            doc.metadata["retrieval_source"] = "vector (faiss)"
-            doc.metadata["original_score"] = float(score)
-            unique_docs[doc.metadata.get("chunk_id")] = doc
-            
-        for doc in bm25_docs:
-            c_id = doc.metadata.get("chunk_id")
-            if c_id not in unique_docs:
-                doc.metadata["retrieval_source"] = "bm25"
-                doc.metadata["original_score"] = 0.0
-                unique_docs[c_id] = doc
+        # Filtre de pages appliqué après coup : on va chercher plus loin pour garder assez de candidats
+        scan_k = fetch_k * Config.FILTER_OVERFETCH if pages else fetch_k
+        if query_vectors is None:
+            start = time.perf_counter()
+            query_vectors = embed_queries(self.embeddings, queries)
+            record_stage(timings, "embed_s", start)
+
+        with self._read_lock:
+            tombstones = set(self.tombstones)
+            # On sur-échantillonne pour compenser les chunks supprimés pas encore compactés
+            vector_fetch_k = scan_k + len(tombstones)
+
+            # A. Recherche Vectorielle (FAISS) : une seule recherche pour toute la matrice
+            start = time.perf_counter()
+            index = self.vector_db.index
+            query_vectors = np.ascontiguousarray(query_vectors, dtype=np.float32)
+            search_k = min(vector_fetch_k, max(1, index.ntotal))
+            vectors = self.vectors
+            docstore = self.vector_db.docstore._dict
+            hierarchy = self.hierarchy if self.uses_hierarchy() else None
+            if hierarchy is not None:
+                # Sections puis fenêtres de phrases des sections retenues : FAISS n'est pas parcouru
+                hits = hierarchy.search(query_vectors, search_k, Config.HIERARCHY_SECTIONS, Config.FAISS_RESCORE_FACTOR)
+                vector_docs = [
+                    [(docstore[key], distance, span) for key, distance, span in row if key in docstore]
+                    for row in hits
+                ]
             else:
-                unique_docs[c_id].metadata["retrieval_source"] = "hybrid"
+                if vectors is not None and Config.FAISS_RESCORE_FACTOR > 0 and len(vectors) == index.ntotal:
+                    # Index quantifié : plus de candidats, re-classés par la distance exacte
+                    distances, positions = index.search(
+                        query_vectors, min(search_k * Config.FAISS_RESCORE_FACTOR, max(1, index.ntotal))
+                    )
+                    distances, positions = rescore(query_vectors, vectors, positions, search_k)
+                else:
+                    distances, positions = index.search(query_vectors, search_k)
+                position_to_key = self.vector_db.index_to_docstore_id
+                vector_docs = [
+                    [(docstore[position_to_key[int(p)]], float(d), None) for p, d in zip(row_p, row_d) if p != -1]
+                    for row_p, row_d in zip(positions, distances)
+                ]
+            # Étape vectorielle (FAISS ou hiérarchique), sous le même nom pour les tableaux de bord
+            record_stage(timings, "faiss_s", start)
 
-        candidates = list(unique_docs.values())
-        
-        # D. Reranking (Cohere)
-        if self.reranker:
-            try:
-                reranked = self.reranker.compress_documents(candidates, query=query)
-                formatted = []
-                for res in reranked[:k]:
-                    # Récupération blindée du score
-                    score_val = getattr(res, "relevance_score", 0.0)
-                    if score_val == 0.0:
-                        score_val = res.metadata.get("relevance_score", 0.0)
-
-                    formatted.append({
-                        "chunk_id": res.metadata.get("chunk_id"),
-                        "content": res.page_content,
-                        "score": round(float(score_val), 4),
-                        "source_method": res.metadata.get("retrieval_source", "hybrid_reranked")
-                    })
-                return formatted
-            except Exception as e:
-                print(f"⚠️ Erreur Rerank: {e}")
+            # B. Recherche BM25 (Si disponible)
+            start = time.perf_counter()
+            if self.bm25_index or self.bm25_delta:
+                bm25_results = search_segments(self.bm25_segments(), queries, vector_fetch_k, stats=bm25_stats)
+            else:
+                bm25_results = [[] for _ in queries]
+            record_stage(timings, "bm25_s", start)
+
+        start = time.perf_counter()
+        candidates = [
+            self._fuse_hits(vector_hits, bm25_hits, fetch_k, tombstones, docstore, pages)
+            for vector_hits, bm25_hits in zip(vector_docs, bm25_results)
+        ]
+        record_stage(timings, "fusion_s", start)
+        return candidates
 
-        # Fallback si pas de Rerank
-        return [{
-            "chunk_id": d.metadata.get("chunk_id"), 
-            "content": d.page_content, 
-            "score": 0.0, 
-            "source_method": d.metadata.get("retrieval_source")
-        } for d in candidates[:k]]
\ No newline at end of file
+    @staticmethod
+    def _fuse_hits(vector_docs: List[Tuple[Document, float, Tuple[int, int]]], bm25_hits: List[Tuple[str, float]], fetch_k: int,
+                   tombstones: set, docstore, pages: Tuple[int, int] = None) -> List[Document]:
+        """C. Filtres (tombstones, pages) puis fusion des résultats FAISS et BM25 d'une requête."""
+
+        def keep(doc):
+            if pages is None:
+                return True
+            page = doc.metadata.get("page")
+            return page is not None and pages[0] <= int(page) + 1 <= pages[1]
+
+        vector_hits, docs_by_key, spans = [], {}, {}
+        for doc, distance, span in vector_docs:
+            key = doc.metadata.get("chunk_key")
+            if key not in tombstones and keep(doc):
+                # Distance L2 : plus petite = meilleure -> score négatif pour la fusion
+                vector_hits.append((key, -float(distance)))
+                docs_by_key[key] = doc
+                spans[key] = span
+        bm25_hits = [
+            (key, score) for key, score in bm25_hits
+            if key not in tombstones and key in docstore and keep(docstore[key])
+        ]
+        vector_hits, bm25_hits = vector_hits[:fetch_k], bm25_hits[:fetch_k]
+
+        # C. Fusion par scores (RRF ou somme pondérée normalisée)
+        fused = fuse(
+            {"vector": vector_hits, "bm25": bm25_hits},
+            weights={"vector": Config.FUSION_VECTOR_WEIGHT, "bm25": Config.FUSION_BM25_WEIGHT},
+            method=Config.FUSION_METHOD,
+            rrf_k=Config.RRF_K
+        )
+        original_scores = {"bm25": dict(bm25_hits), "vector": {key: -s for key, s in vector_hits}}
+
+        # Copies : les documents du docstore sont partagés entre requêtes
+        candidates = []
+        for key, score, origins in fused:
+            source = docs_by_key.get(key) or docstore[key]
+            doc = Document(page_content=source.page_content, metadata=dict(source.metadata))
+            vector_label = "vector (sections)" if spans.get(key) else "vector (faiss)"
+            doc.metadata["retrieval_source"] = (
+                "hybrid" if len(origins) > 1 else vector_label if origins[0] == "vector" else "bm25"
+            )
+            if spans.get(key):
+                # Chunk parent retenu par l'une de ses fenêtres de phrases
+                doc.metadata["matched_span"] = spans[key]
+            doc.metadata["original_score"] = original_scores[origins[0]][key]
+            doc.metadata["fusion_score"] = score
+            # Scores bruts conservés pour re-fusionner les résultats de plusieurs shards
+            doc.metadata["vector_distance"] = original_scores["vector"].get(key)
+            doc.metadata["bm25_score"] = original_scores["bm25"].get(key)
+            candidates.append(doc)
+        return candidates
@@ -0,0 +1,129 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from src import rate_limiter
+from src.config import Config
+from src.contextual import ContextualProcessor
+from src.rate_limiter import RateLimiter, call_with_backoff
+
+LLM_LATENCY = 0.05
+
+
+class RateLimitError(Exception):
+    """Erreur 429 telle que la lèvent les clients HTTP (attribut status_code)."""
+    status_code = 429
+
+
+class FakeLLM:
+    """LLM bouchon à latence fixe ; les `failures` premiers appels renvoient un 429."""
+
+    def __init__(self, latency: float = LLM_LATENCY, failures: int = 0):
+        self.latency = latency
+        self.failures = failures
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt: str):
+        with self._lock:
+            self.calls += 1
+            fail = self.calls <= self.failures
+        time.sleep(self.latency)
+        if fail:
+            raise RateLimitError("429 Too Many Requests")
+        chunk = prompt.split("<chunk>")[1].split("</chunk>")[0]
+        return SimpleNamespace(content=f"contexte de {chunk}")
+
+
+@pytest.fixture(autouse=True)
+def no_wait(monkeypatch):
+    monkeypatch.setattr(Config, "CONTEXT_CACHE_ENABLED", False)
+    monkeypatch.setattr(Config, "LLM_BACKOFF_BASE_SECONDS", 0.0)
+
+
+def make_processor(llm) -> ContextualProcessor:
+    # Budgets larges : seule la latence du LLM limite le débit
+    return ContextualProcessor(llm=llm, rate_limiter=RateLimiter(1_000_000, 1_000_000_000))
+
+
+def make_chunks(n: int):
+    return [Document(page_content=f"chunk {i}", metadata={"page": i // 4}) for i in range(n)]
+
+
+def test_wall_time_drops_with_concurrency(monkeypatch):
+    chunks = make_chunks(16)
+    durations = {}
+    for concurrency in (1, 4, 16):
+        monkeypatch.setattr(Config, "CONTEXTUAL_CONCURRENCY", concurrency)
+        start = time.perf_counter()
+        make_processor(FakeLLM()).generate_contextual_chunks("document", chunks)
+        durations[concurrency] = time.perf_counter() - start
+
+    # Séquentiel : ~16 x latence ; les appels se recouvrent ensuite
+    assert durations[1] >= len(chunks) * LLM_LATENCY
+    assert durations[4] < durations[1] / 2
+    assert durations[16] < durations[4]
+
+
+def test_order_and_chunk_ids_unchanged():
+    chunks = make_chunks(20)
+    docs = make_processor(FakeLLM(latency=0.0)).generate_contextual_chunks("document", chunks, concurrency=8)
+
+    assert [doc.metadata["chunk_id"] for doc in docs] == list(range(len(chunks)))
+    for doc, chunk in zip(docs, chunks):
+        assert doc.page_content == f"contexte de {chunk.page_content}\n\n{chunk.page_content}"
+        assert doc.metadata["page"] == chunk.metadata["page"]
+        assert doc.metadata["context_chars"] == len(f"contexte de {chunk.page_content}") + 2
+
+
+def test_rate_limited_chunks_are_retried():
+    llm = FakeLLM(latency=0.0, failures=3)
+    docs = make_processor(llm).generate_contextual_chunks("document", make_chunks(4), concurrency=2)
+
+    assert llm.calls == 4 + 3
+    assert all(doc.page_content.startswith("contexte de") for doc in docs)
+
+
+def test_call_with_backoff_retries_on_429(monkeypatch):
+    delays = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", delays.append)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RateLimitError("429 Too Many Requests")
+        return "ok"
+
+    assert call_with_backoff(call, max_retries=5, base_delay=1.0, max_delay=30.0) == "ok"
+    assert len(attempts) == 3
+    # Jitter complet : chaque attente est tirée dans [0, base * 2^essai]
+    assert len(delays) == 2
+    assert 0 <= delays[0] <= 1.0 and 0 <= delays[1] <= 2.0
+
+
+def test_call_with_backoff_gives_up(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda delay: None)
+    attempts = []
+
+    def rate_limited():
+        attempts.append(1)
+        raise RateLimitError("429 Too Many Requests")
+
+    with pytest.raises(RateLimitError):
+        call_with_backoff(rate_limited, max_retries=2, base_delay=1.0, max_delay=30.0)
+    assert len(attempts) == 3
+
+    # Les autres erreurs ne sont pas réessayées
+    attempts.clear()
+
+    def broken():
+        attempts.append(1)
+        raise ValueError("prompt invalide")
+
+    with pytest.raises(ValueError):
+        call_with_backoff(broken, max_retries=5, base_delay=1.0, max_delay=30.0)
+    assert len(attempts) == 1
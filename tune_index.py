@@ -0,0 +1,125 @@
+import json
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+from src.ann_index import INDEX_TYPES, build_faiss_index, is_exact, reconstruct_vectors, rescore
+from src.config import Config
+from src.corpus import CorpusManager
+
+# --- CONFIGURATION ---
+GROUND_TRUTH_PATH = "data/ground_truth.json"
+
+
+def synthetic_corpus(base: np.ndarray, size: int, rng, noise: float = 0.05) -> np.ndarray:
+    """Étend le corpus réel à `size` vecteurs (tirages bruités des vrais chunks, renormalisés)."""
+    picks = base[rng.integers(0, len(base), size)]
+    vectors = picks + rng.normal(0, noise, picks.shape).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, k: int,
+            vectors: np.ndarray = None, rescore_factor: int = 0) -> dict:
+    """`vectors` + `rescore_factor` : recherche de facteur * k candidats re-classés en float32 (voir rescore)."""
+    latencies = []
+    found = 0
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        if vectors is not None:
+            _, ids = index.search(query[None, :], k * rescore_factor)
+            _, ids = rescore(query[None, :], vectors, ids, k)
+        else:
+            _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found += len(set(ids[0]) & set(truth[i]))
+    latencies = np.array(latencies) * 1000
+    return {
+        f"recall@{k}": found / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        # Taille sérialisée : bonne approximation de la mémoire occupée par l'index
+        # (les vecteurs float32 du rescoring restent sur disque, lus en mmap)
+        "ram_mb": faiss.serialize_index(index).nbytes / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construit et compare les types d'index FAISS")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES))
+    parser.add_argument("--storage", nargs="+", default=["float32", "float16", "int8", "binary"])
+    parser.add_argument("--rescore-factor", type=int, default=Config.FAISS_RESCORE_FACTOR,
+                        help="Ajoute une ligne avec rescoring float32 pour chaque index quantifié (0 = non)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--documents", nargs="+", help="Shards (doc_id ou nom de fichier) ; défaut : tout le corpus")
+    parser.add_argument("--json", help="Fichier où écrire les résultats bruts")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    # Vecteurs réels : ceux des shards du corpus (float32 du rescoring s'ils existent, sinon décodés)
+    corpus_manager = CorpusManager()
+    if not corpus_manager.load():
+        raise SystemExit("❌ Aucun index trouvé : lancez d'abord main.py pour l'ingestion.")
+    shards = corpus_manager.select_shards(args.documents)
+    if not shards:
+        raise SystemExit(f"❌ Aucun shard ne correspond à {args.documents}")
+    base = np.vstack([
+        np.asarray(shard.vectors, dtype=np.float32) if shard.vectors is not None
+        else reconstruct_vectors(shard.vector_db.index, range(shard.vector_db.index.ntotal))
+        for shard in shards
+    ])
+    print(f"📦 {len(base)} vecteurs réels issus de {len(shards)} shard(s)")
+
+    # Requêtes : les questions de la vérité terrain + des vecteurs du corpus bruités
+    with open(GROUND_TRUTH_PATH, "r") as f:
+        questions = [item["question"] for item in json.load(f)]
+    queries = np.vstack([
+        corpus_manager.embeddings.encode(questions),
+        synthetic_corpus(base, max(0, args.queries - len(questions)), rng, noise=0.1)
+    ])
+
+    results = []
+    print("| Taille | Type | Stockage | Build (s) | Recall@k | p50 (ms) | p99 (ms) | RAM (MB) |")
+    print("| :--- | :--- | :--- | :--- | :--- | :--- | :--- | :--- |")
+    for size in args.sizes:
+        corpus = synthetic_corpus(base, size, rng)
+        # Vérité : l'index exact
+        _, truth = build_faiss_index(corpus, "flat").search(queries, args.k)
+
+        for index_type in args.types:
+            # IVF-PQ a son propre codage : le paramètre de stockage ne s'applique pas
+            for storage in (["float32"] if index_type == "ivf_pq" else args.storage):
+                if storage == "binary" and index_type != "flat":
+                    continue
+                start = time.perf_counter()
+                index = build_faiss_index(
+                    corpus, index_type, storage,
+                    nlist=Config.FAISS_IVF_NLIST,
+                    nprobe=Config.FAISS_IVF_NPROBE,
+                    hnsw_m=Config.FAISS_HNSW_M,
+                    ef_construction=Config.FAISS_HNSW_EF_CONSTRUCTION,
+                    ef_search=Config.FAISS_HNSW_EF_SEARCH,
+                    pq_m=Config.FAISS_PQ_M
+                )
+                build_s = time.perf_counter() - start
+                rows = [{"size": size, "type": index_type, "storage": storage, "build_s": build_s,
+                         **measure(index, queries, truth, args.k)}]
+                if args.rescore_factor > 0 and not is_exact(index):
+                    rows.append({"size": size, "type": index_type, "storage": f"{storage}+rescore", "build_s": build_s,
+                                 **measure(index, queries, truth, args.k, corpus, args.rescore_factor)})
+                for row in rows:
+                    results.append(row)
+                    print(f"| {size} | {index_type} | {row['storage']} | {row['build_s']:.2f} | "
+                          f"{row[f'recall@{args.k}']:.3f} | {row['p50_ms']:.3f} | {row['p99_ms']:.3f} | {row['ram_mb']:.2f} |")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
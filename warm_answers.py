@@ -0,0 +1,76 @@
+import json
+import asyncio
+import argparse
+
+# --- CONFIGURATION ---
+GROUND_TRUTH_PATH = "data/ground_truth.json"
+
+
+def load_questions(args, store) -> list:
+    """Questions à préparer : vérité terrain, questions fréquentes du journal, fichier texte (une par ligne)."""
+    questions = []
+    if args.ground_truth:
+        with open(args.ground_truth, "r", encoding="utf-8") as f:
+            questions += [item["question"] for item in json.load(f)]
+    if args.hot:
+        questions += [entry["question"] for entry in store.hot_questions(args.hot) if entry["k"] == args.k]
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions += [line.strip() for line in f if line.strip()]
+    # Doublons retirés, ordre conservé
+    return list(dict.fromkeys(questions))
+
+
+async def warm(args):
+    # Import tardif : main charge la configuration et construit les services
+    import main
+    from src.answer_store import AnswerStore
+    from src.config import Config
+
+    if not main.rag_store.load():
+        raise SystemExit("❌ Aucun index : lancez l'ingestion avant de préparer des réponses.")
+    store = main.answer_store or AnswerStore(Config.ANSWER_STORE_PATH, Config.QUERY_LOG_MAX_ROWS)
+    version = main.rag_store.index_version()
+    store.invalidate(version)
+
+    questions = load_questions(args, store)
+    if not args.force:
+        questions = [q for q in questions if not store.contains(q, args.k, "", version)]
+    print(f"📝 {len(questions)} réponse(s) à préparer (index {version}, k={args.k})")
+
+    # Réponses calculées à neuf : ni cache de requêtes, ni réponses déjà préparées
+    main.query_cache = None
+    Config.ANSWER_STORE_ENABLED = False
+
+    prepared = failed = 0
+    for start in range(0, len(questions), args.batch_size):
+        chunk = questions[start:start + args.batch_size]
+        results = await main.answer_batch(main.BatchQueryRequest(queries=chunk, k=args.k))
+        for question, result in zip(chunk, results):
+            if result.get("error"):
+                failed += 1
+                print(f"⚠️ {question[:60]!r} : {result['error']}")
+                continue
+            store.put(question, args.k, "", result, version)
+            prepared += 1
+        print(f"   {start + len(chunk)}/{len(questions)}")
+
+    print(f"✅ {prepared} réponse(s) préparée(s), {failed} en échec")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pré-calcule les réponses de questions connues (servies telles quelles tant que l'index ne change pas)"
+    )
+    parser.add_argument("--ground-truth", default=GROUND_TRUTH_PATH,
+                        help="Fichier JSON [{'question': ...}] ('' pour l'ignorer)")
+    parser.add_argument("--hot", type=int, default=0, help="Ajoute les N questions les plus fréquentes du journal")
+    parser.add_argument("--questions", help="Fichier texte, une question par ligne")
+    parser.add_argument("--k", type=int, default=6, help="Doit correspondre au k des requêtes à servir")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--force", action="store_true", help="Recalcule même les réponses déjà à jour")
+    asyncio.run(warm(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()